@@ -0,0 +1,24 @@
+"""
+Конфигурация gunicorn для ASGI: воркеры uvicorn и асинхронные GET каталога.
+
+    gunicorn -c api_fivefortyfive/gunicorn_asgi.py api_fivefortyfive.asgi:application
+
+Каждый воркер обслуживает много медленных клиентов в одном event loop,
+поэтому воркеров нужно меньше, чем синхронных под WSGI. Метрики всех
+воркеров /metrics собирает из общего PROMETHEUS_MULTIPROC_DIR.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'uvicorn_worker.UvicornWorker'
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = timeout
+
+raw_env = ['ASYNC_READS=True']
+# Под ASGI запросы обслуживаются в разных потоках, и постоянные соединения
+# копятся по потоку; вместо них лучше пул (DB_POOL=True)
+if 'DB_CONN_MAX_AGE' not in os.environ:
+    raw_env.append('DB_CONN_MAX_AGE=0')
@@ -18,11 +18,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'site_api',
 ]
 
 MIDDLEWARE = [
+    'site_api.metrics.MetricsMiddleware',
+    'site_api.static_catalog.CatalogSnapshotMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,15 +55,68 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'api_fivefortyfive.wsgi.application'
 
-DATABASES = {
-    'default': {
+# Соединения с БД. По умолчанию соединение живёт DB_CONN_MAX_AGE секунд и проверяется
+# перед повторным использованием. DB_POOL=True включает пул psycopg 3 (psycopg-pool
+# в requirements.txt); постоянные соединения с пулом несовместимы,
+# поэтому CONN_MAX_AGE тогда 0. DB_STATEMENT_TIMEOUT_MS ограничивает время запроса на стороне сервера.
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+
+
+def database(prefix='DB'):
+    options = {}
+    if DB_STATEMENT_TIMEOUT_MS:
+        options['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+    if DB_POOL:
+        options['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+    return {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('DB_USER'),
-        'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT'),
+        'NAME': os.getenv(f'{prefix}_NAME', os.getenv('DB_NAME')),
+        'USER': os.getenv(f'{prefix}_USER', os.getenv('DB_USER')),
+        'PASSWORD': os.getenv(f'{prefix}_PASSWORD', os.getenv('DB_PASSWORD')),
+        'HOST': os.getenv(f'{prefix}_HOST', os.getenv('DB_HOST')),
+        'PORT': os.getenv(f'{prefix}_PORT', os.getenv('DB_PORT')),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': options,
     }
+
+
+DATABASES = {
+    'default': database(),
+}
+
+# Реплика для чтения: GET и HEAD к API читают с неё (site_api.routers).
+# Ответы, собранные с реплики, кэшируются не дольше DB_REPLICA_CACHE_TIMEOUT,
+# чтобы отставание реплики не закрепилось в кэше под новой версией каталога.
+DB_REPLICA_PATHS = ('/api/',)
+DB_REPLICA_CACHE_TIMEOUT = int(os.getenv('DB_REPLICA_CACHE_TIMEOUT', '30'))
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {**database('DB_REPLICA'), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_ROUTERS = ['site_api.routers.ReplicaRouter']
+    MIDDLEWARE.insert(0, 'site_api.routers.ReplicaReadsMiddleware')
+
+# Кэш каталога: locmem для разработки и тестов, file/redis в продакшене
+# (redis требует пакет redis и адрес вида redis://host:6379/0 в CACHE_LOCATION).
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': CACHE_BACKENDS[os.getenv('CATALOG_CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.getenv('CATALOG_CACHE_LOCATION', 'catalog'),
+        'TIMEOUT': int(os.getenv('CATALOG_CACHE_TIMEOUT', '86400')),
+    },
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -91,18 +147,58 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Оригиналы фото хранятся под именем из SHA-256 содержимого (site_api.storage):
+# одинаковые загрузки не дублируются, а отдавать их можно с вечным кэшем
+STORAGES = {
+    'default': {'BACKEND': 'site_api.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Загрузки пишутся на диск кусками во временный файл, а не собираются в памяти
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
+# Кто отдаёт тело файлов /media/ (site_api.media.serve_media): 'django' - FileResponse,
+# 'nginx' - X-Accel-Redirect на internal location MEDIA_ACCEL_PREFIX, 'sendfile' - X-Sendfile
+MEDIA_SERVER = os.getenv('MEDIA_SERVER', 'django')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Предел пикселей при декодировании фото (Image.MAX_IMAGE_PIXELS): защита воркера
+# и производных от «декомпрессионных бомб»; по умолчанию 50 Мп
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50_000_000)))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Для разработки, в продакшене замените
     ],
+    # Браузабельный API только для разработки: в продакшене его HTML и формы не нужны
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'site_api.renderers.CatalogJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     ],
+    'DEFAULT_PAGINATION_CLASS': 'site_api.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
 }
 
+# Асинхронные GET-обработчики каталога (site_api.async_views) для запуска под ASGI
+ASYNC_READS = os.getenv('ASYNC_READS', 'False') == 'True'
+
+# Записи журнала изменений моложе этого срока не отдаются в /api/changes/: журнал пишется
+# в транзакции данных, и запись с меньшим id ещё может быть не закоммичена. Срок должен
+# быть дольше самой долгой транзакции записи каталога (пачка импорта, сохранение в админке)
+CHANGES_SETTLE_SECONDS = float(os.getenv('CHANGES_SETTLE_SECONDS', '10'))
+
+# Запросы дольше этого порога пишутся в лог site_api.slow_requests вместе с самыми долгими SQL
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '500'))
+
+# /metrics отдаётся только с заголовком `Authorization: Bearer <METRICS_TOKEN>`; без токена адреса нет.
+# При нескольких воркерах gunicorn нужен общий каталог PROMETHEUS_MULTIPROC_DIR (см. Dockerfile)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Каталог снимка build_catalog_snapshot: если задан, GET из его манифеста отдаются
+# файлами без обращения к view и БД (на пиках чтения); пусто - снимок не используется
+CATALOG_SNAPSHOT_DIR = os.getenv('CATALOG_SNAPSHOT_DIR', '')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -115,12 +211,20 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json_line': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+        'console_json': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json_line',
+        },
     },
     'loggers': {
         'django': {
@@ -138,5 +242,10 @@ LOGGING = {
             'level': 'ERROR',  # Логируем ошибки приложения
             'propagate': True,
         },
+        'site_api.slow_requests': {
+            'handlers': ['console_json'],
+            'level': 'WARNING',  # Медленные запросы, по JSON-строке на запрос
+            'propagate': False,
+        },
     },
 }
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from site_api.media import serve_media
+from site_api.metrics import metrics_view
 
 admin.site.site_header = "Администрирование 5.45"
 admin.site.site_title = "5.45 Админ панель"
@@ -11,7 +12,7 @@ admin.site.site_url = ''
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('site_api.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    # Не только в DEBUG: в продакшене тело отдаёт nginx по X-Accel-Redirect (MEDIA_SERVER)
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
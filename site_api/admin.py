@@ -1,9 +1,17 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
 from django import forms
+from django.core.paginator import Paginator
 from django.forms import FileInput
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from django.db import models
-from site_api.models import Product, ProductImage, Category, Look, LookImage
+from django.db import connections, models
+from django.db.models import Count
+from site_api.filters import has_related
+from site_api.models import Product, ProductImage, Category, Look, LookImage, ImageJob
+from site_api.renditions import rendition_url
+from site_api.search import search_products, search_looks
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot
 
 
 class NonClearableFileInput(FileInput):
@@ -18,18 +26,65 @@ class MultiFileInput(FileInput):
         return super().render(name, value, attrs, renderer)
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Для списка без фильтров берёт число строк из статистики PostgreSQL
+    (pg_class.reltuples) вместо COUNT(*), который читает всю таблицу.
+    Отфильтрованные списки и небольшие таблицы считаются точно.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.exact_below:
+                return row[0]
+        return super().count
+
+
+class CategoryFilter(admin.SimpleListFilter):
+    """Фильтр по категории через EXISTS: без JOIN по M2M и DISTINCT, который admin добавил бы к нему."""
+    title = 'категория'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return Category.objects.order_by('name').values_list('pk', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        try:
+            category = int(self.value())
+        except ValueError as exc:
+            raise IncorrectLookupParameters(exc)
+        return queryset.filter(has_related(queryset.model, 'categories', [category]))
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Без полного COUNT(*) на каждой странице; при поиске admin показывает только число найденных
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 0
-    fields = ['image_preview', 'image', 'is_main']
-    readonly_fields = ['image_preview']
+    fields = ['image_preview', 'image', 'is_main', 'processing_status']
+    readonly_fields = ['image_preview', 'processing_status']
     formfield_overrides = {
         models.ImageField: {'widget': NonClearableFileInput},
     }
 
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.image.url)
+            return format_html('<img src="{}" width="100" height="100" />', rendition_url('product', obj.pk, 'thumb', 'jpeg'))
         return "No image"
     image_preview.short_description = 'Превью'
 
@@ -37,15 +92,15 @@ class ProductImageInline(admin.TabularInline):
 class LookImageInline(admin.TabularInline):
     model = LookImage
     extra = 0
-    fields = ['image_preview', 'image', 'is_main']
-    readonly_fields = ['image_preview']
+    fields = ['image_preview', 'image', 'is_main', 'processing_status']
+    readonly_fields = ['image_preview', 'processing_status']
     formfield_overrides = {
         models.ImageField: {'widget': NonClearableFileInput},
     }
 
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.image.url)
+            return format_html('<img src="{}" width="100" height="100" />', rendition_url('look', obj.pk, 'thumb', 'jpeg'))
         return "Нет изображения"
     image_preview.short_description = 'Превью'
 
@@ -144,39 +199,67 @@ class LookAdminForm(forms.ModelForm):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     form = ProductAdminForm
-    list_display = ['main_image_preview', 'article', 'name', 'price', 'material']
+    list_display = ['main_image_preview', 'article', 'name', 'price', 'material', 'image_count']
     list_display_links = ['main_image_preview', 'article', 'name']
-    list_filter = ['categories']
-    search_fields = ['name', 'article', 'categories__name']
+    list_filter = [CategoryFilter]
+    # Нужен, чтобы admin показал поле поиска; сам поиск - get_search_results по индексам
+    search_fields = ['name', 'article']
     filter_horizontal = ['categories']
     inlines = [ProductImageInline]
 
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('images', 'categories')
+        # Фото считаются в том же запросе; основное фото берётся из снимка main_image_id
+        return super().get_queryset(request).defer('search_vector').annotate(images_count=Count('images'))
+
+    def save_related(self, request, form, formsets, change):
+        # Категории и инлайны с фото сохраняются здесь, уже после save() формы;
+        # changeform_view выполняется в одной транзакции с этим пересчётом
+        super().save_related(request, form, formsets, change)
+        refresh_product_snapshot([form.instance.pk])
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по GIN-индексам вместо icontains по JOIN с категориями
+        if not search_term:
+            return queryset, False
+        return search_products(queryset, search_term), False
 
     def main_image_preview(self, obj):
-        main_image = obj.images.filter(is_main=True).first()
-        if main_image:
-            return format_html('<img src="{}" width="50" height="50" />', main_image.image.url)
+        if obj.main_image_id:
+            return format_html('<img src="{}" width="50" height="50" />', rendition_url('product', obj.main_image_id, 'thumb', 'jpeg'))
         return "No main image"
     main_image_preview.short_description = 'Основное фото'
 
     def image_count(self, obj):
-        return obj.images.count()
+        return obj.images_count
     image_count.short_description = 'Количество фото'
+    image_count.admin_order_field = 'images_count'
 
 
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
-    list_display = ['product', 'image_preview', 'is_main', 'created_at']
-    list_filter = ['is_main', 'created_at']
+class ProductImageAdmin(LargeTableAdmin):
+    list_display = ['product', 'image_preview', 'is_main', 'processing_status', 'created_at']
+    list_filter = ['is_main', 'processing_status', 'created_at']
     search_fields = ['product__name', 'product__article']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product').defer('product__search_vector', 'product__material')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Фото найденных по индексам товаров вместо icontains по JOIN
+        if not search_term:
+            return queryset, False
+        products = search_products(Product.objects.all(), search_term).values('pk')
+        return queryset.filter(product__in=products), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_product_snapshot([obj.product_id])
+
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.image.url)
+            return format_html('<img src="{}" width="100" height="100" />', rendition_url('product', obj.pk, 'thumb', 'jpeg'))
         return "No image"
     image_preview.short_description = 'Превью'
 
@@ -189,34 +272,66 @@ class CategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Look)
-class LookAdmin(admin.ModelAdmin):
+class LookAdmin(LargeTableAdmin):
     form = LookAdminForm
-    list_display = ['main_image_preview', 'name', 'price']
+    list_display = ['main_image_preview', 'name', 'price', 'image_count']
     list_display_links = ['main_image_preview', 'name']
-    list_filter = ['created_at', 'categories']
-    search_fields = ['name', 'categories__name', 'products__name', 'products__article']
+    list_filter = ['created_at', CategoryFilter]
+    search_fields = ['name']
     filter_horizontal = ['products', 'categories']
     inlines = [LookImageInline]
 
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('images', 'products', 'categories')
+        return super().get_queryset(request).defer('search_vector').annotate(images_count=Count('images'))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        refresh_look_snapshot([form.instance.pk])
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_looks(queryset, search_term), False
 
     def main_image_preview(self, obj):
-        main_image = obj.images.filter(is_main=True).first()
-        if main_image:
-            return format_html('<img src="{}" width="50" height="50" />', main_image.image.url)
+        if obj.main_image_id:
+            return format_html('<img src="{}" width="50" height="50" />', rendition_url('look', obj.main_image_id, 'thumb', 'jpeg'))
         return "Нет изображения"
     main_image_preview.short_description = 'Основное фото'
 
+    def image_count(self, obj):
+        return obj.images_count
+    image_count.short_description = 'Количество фото'
+    image_count.admin_order_field = 'images_count'
+
 
 @admin.register(LookImage)
-class LookImageAdmin(admin.ModelAdmin):
-    list_display = ['look', 'image_preview', 'is_main', 'created_at']
-    list_filter = ['is_main', 'created_at']
+class LookImageAdmin(LargeTableAdmin):
+    list_display = ['look', 'image_preview', 'is_main', 'processing_status', 'created_at']
+    list_filter = ['is_main', 'processing_status', 'created_at']
     search_fields = ['look__name']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('look').defer('look__search_vector')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(look__in=search_looks(Look.objects.all(), search_term).values('pk')), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_look_snapshot([obj.look_id])
+
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.image.url)
+            return format_html('<img src="{}" width="100" height="100" />', rendition_url('look', obj.pk, 'thumb', 'jpeg'))
         return "Нет изображения"
-    image_preview.short_description = 'Превью'
\ No newline at end of file
+    image_preview.short_description = 'Превью'
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(LargeTableAdmin):
+    list_display = ['id', 'kind', 'image_id', 'status', 'attempts', 'created_at', 'updated_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['kind', 'image_id', 'attempts', 'error', 'created_at', 'updated_at']
\ No newline at end of file
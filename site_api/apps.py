@@ -5,3 +5,10 @@ class SiteApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'site_api'
     verbose_name = 'Каталог'
+
+    def ready(self):
+        from django.conf import settings
+        from PIL import Image
+        from site_api import signals  # noqa: F401
+
+        Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
@@ -0,0 +1,180 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from site_api.batch import parse_ids, fetch_batch
+from site_api.cache import PRODUCTS, LOOKS, acache_response
+from site_api.conditional import (
+    aconditional_get, product_list_state, product_detail_state, look_list_state, look_detail_state,
+)
+from site_api.fieldsets import sparse_fieldsets
+from site_api.filters import filter_products, filter_looks, get_ordering
+from site_api.models import Product, Look
+from site_api.pagination import KeysetPagination
+from site_api.querysets import (
+    product_queryset, look_queryset, product_summary_queryset, look_summary_queryset, attach_related_ids,
+)
+from site_api.renderers import CatalogJSONRenderer
+from site_api.serializers import ProductSerializer, ProductSummarySerializer, LookSerializer, LookSummarySerializer
+from site_api.views import SUMMARY_VIEW, BatchFetchMixin
+
+
+def json_response(data, status=200):
+    return HttpResponse(CatalogJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def error_response(exc):
+    # Тело как у exception_handler DRF в синхронных view: строка оборачивается в {"detail": ...}
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status=exc.status_code)
+
+
+def split_by_method(async_view, sync_view):
+    """
+    Один URL для двух реализаций: GET и HEAD обслуживает асинхронный view,
+    запись идёт в прежний синхронный DRF-view в потоке, как Django и так
+    запускает синхронные view под ASGI.
+    """
+    sync_view = sync_to_async(sync_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await async_view(request, *args, **kwargs)
+        return await sync_view(request, *args, **kwargs)
+    return view
+
+
+class AsyncReadView(View):
+    """
+    Асинхронный GET каталога поверх async ORM (`aget`, `aiterator`).
+
+    Отвечает только JSON и без браузабельного API; ответы, включая ошибки,
+    побайтно совпадают с синхронными view и делят с ними кэш и ETag.
+    Сериализаторы работают по уже загруженным данным, поэтому запросов
+    к БД в event loop нет. Подкласс определяет `async read(request, ...)`,
+    которая возвращает данные ответа или бросает APIException (NotFound).
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def respond(self, request, *args, **kwargs):
+        try:
+            data = await self.read(Request(request), *args, **kwargs)
+        except APIException as exc:
+            return error_response(exc)
+        return json_response(data)
+
+    async def batch(self, request, resource, url_name, queryset_builder, serializer_class):
+        fields, expand = sparse_fieldsets(request.GET)
+        try:
+            ids = parse_ids(request.GET['ids'], BatchFetchMixin.max_query_ids)
+            content = await sync_to_async(fetch_batch)(
+                resource, url_name, queryset_builder(fields, expand), serializer_class, ids, fields, expand
+            )
+        except APIException as exc:
+            return error_response(exc)
+        return HttpResponse(content, content_type='application/json')
+
+    @staticmethod
+    async def fetch_page(paginator, queryset, request):
+        rows = paginator.get_page_queryset(queryset, request)
+        # chunk_size обязателен, чтобы aiterator выполнил prefetch_related
+        return paginator.build_page([row async for row in rows.aiterator(chunk_size=paginator.page_size + 1)])
+
+
+class AsyncProductListView(AsyncReadView):
+    async def get(self, request):
+        if 'ids' in request.GET:
+            return await self.batch(request, PRODUCTS, 'product-detail', product_queryset, ProductSerializer)
+        return await self.list(request)
+
+    @aconditional_get(PRODUCTS, product_list_state)
+    @acache_response(PRODUCTS)
+    async def list(self, request):
+        return await self.respond(request)
+
+    async def read(self, request):
+        paginator = KeysetPagination()
+        paginator.ordering = get_ordering(request.query_params)
+        fields, expand = sparse_fieldsets(request.query_params)
+        if request.query_params.get('view') == SUMMARY_VIEW:
+            products = filter_products(product_summary_queryset(), request.query_params)
+            page = await self.fetch_page(paginator, products, request)
+            return paginator.get_paginated_response(ProductSummarySerializer(page, many=True, fields=fields, expand=expand).data).data
+
+        products = filter_products(product_queryset(fields, expand), request.query_params)
+        page = await self.fetch_page(paginator, products, request)
+        return paginator.get_paginated_response(ProductSerializer(page, many=True, fields=fields, expand=expand).data).data
+
+
+class AsyncProductDetailView(AsyncReadView):
+    @aconditional_get(PRODUCTS, product_detail_state, detail=True)
+    @acache_response(PRODUCTS)
+    async def get(self, request, pk):
+        return await self.respond(request, pk)
+
+    async def read(self, request, pk):
+        fields, expand = sparse_fieldsets(request.query_params)
+        try:
+            product = await product_queryset(fields, expand).aget(pk=pk)
+        except Product.DoesNotExist:
+            raise NotFound
+        return ProductSerializer(product, fields=fields, expand=expand).data
+
+
+class AsyncProductLooksView(AsyncReadView):
+    @acache_response(LOOKS)
+    async def get(self, request, pk):
+        return await self.respond(request, pk)
+
+    async def read(self, request, pk):
+        if not await Product.objects.filter(pk=pk).aexists():
+            raise NotFound
+        paginator = KeysetPagination()
+        paginator.ordering = get_ordering(request.query_params)
+        page = await self.fetch_page(paginator, look_summary_queryset().filter(products=pk), request)
+        await sync_to_async(attach_related_ids)(page, Look, 'products')
+        return paginator.get_paginated_response(LookSummarySerializer(page, many=True).data).data
+
+
+class AsyncLookListView(AsyncReadView):
+    async def get(self, request):
+        if 'ids' in request.GET:
+            return await self.batch(request, LOOKS, 'look-detail', look_queryset, LookSerializer)
+        return await self.list(request)
+
+    @aconditional_get(LOOKS, look_list_state)
+    @acache_response(LOOKS)
+    async def list(self, request):
+        return await self.respond(request)
+
+    async def read(self, request):
+        paginator = KeysetPagination()
+        paginator.ordering = get_ordering(request.query_params)
+        fields, expand = sparse_fieldsets(request.query_params)
+        if request.query_params.get('view') == SUMMARY_VIEW:
+            looks = filter_looks(look_summary_queryset(), request.query_params)
+            page = await self.fetch_page(paginator, looks, request)
+            await sync_to_async(attach_related_ids)(page, Look, 'products')
+            return paginator.get_paginated_response(LookSummarySerializer(page, many=True, fields=fields, expand=expand).data).data
+
+        looks = filter_looks(look_queryset(fields, expand), request.query_params)
+        page = await self.fetch_page(paginator, looks, request)
+        return paginator.get_paginated_response(LookSerializer(page, many=True, fields=fields, expand=expand).data).data
+
+
+class AsyncLookDetailView(AsyncReadView):
+    @aconditional_get(LOOKS, look_detail_state, detail=True)
+    @acache_response(LOOKS)
+    async def get(self, request, pk):
+        return await self.respond(request, pk)
+
+    async def read(self, request, pk):
+        fields, expand = sparse_fieldsets(request.query_params)
+        try:
+            look = await look_queryset(fields, expand).aget(pk=pk)
+        except Look.DoesNotExist:
+            raise NotFound
+        return LookSerializer(look, fields=fields, expand=expand).data
@@ -0,0 +1,57 @@
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+from site_api.fieldsets import sparse_query
+from site_api.cache import catalog_cache, get_version, path_cache_key, response_timeout
+from site_api.metrics import record_cache
+from site_api.renderers import CatalogJSONRenderer
+
+
+def parse_ids(values, limit):
+    """Id из `?ids=1,2,3` или из списка в теле POST; порядок и повторы сохраняются."""
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not isinstance(values, list) or not values:
+        raise ValidationError({'ids': ['Expected a non-empty list of integers.']})
+    if len(values) > limit:
+        raise ValidationError({'ids': [f'Ensure this list has no more than {limit} elements.']})
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValidationError({'ids': ['Expected integers.']})
+
+
+def fetch_batch(resource, url_name, queryset, serializer_class, ids, fields=None, expand=None):
+    """
+    JSON-байты `{"results": [...]}` с объектами в порядке `ids`; вместо
+    отсутствующих - `{"id": N, "not_found": true}`.
+
+    Каждый объект берётся из кэша карточки (`url_name`), промахи читаются
+    одной выборкой `queryset` с её планом prefetch и сразу кладутся в кэш
+    под ключами карточек (с `fields`/`expand` - под ключами карточек с теми
+    же параметрами). Ответ склеивается из готовых байтов, без повторной
+    сериализации закэшированного.
+    """
+    cache = catalog_cache()
+    version = get_version(resource)
+    query = sparse_query(fields, expand)
+    keys = {
+        pk: path_cache_key(resource, reverse(url_name, kwargs={'pk': pk}) + query, version)
+        for pk in dict.fromkeys(ids)
+    }
+    cached = cache.get_many(list(keys.values()))
+    parts = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in keys if pk not in parts]
+    record_cache(not missing)
+
+    renderer = CatalogJSONRenderer()
+    if missing:
+        objects = list(queryset.filter(pk__in=missing))
+        fresh = {}
+        for obj, data in zip(objects, serializer_class(objects, many=True, fields=fields, expand=expand).data):
+            parts[obj.pk] = fresh[keys[obj.pk]] = renderer.render(data)
+        cache.set_many(fresh, response_timeout())
+    results = [
+        parts[pk] if pk in parts else renderer.render({'id': pk, 'not_found': True})
+        for pk in ids
+    ]
+    return b'{"results":[' + b','.join(results) + b']}'
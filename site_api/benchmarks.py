@@ -0,0 +1,302 @@
+import asyncio
+import itertools
+import json
+import math
+import resource
+import sys
+import time
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+# Типичная смесь чтений витрины; детальные страницы добавляются через --path
+DEFAULT_PATHS = [
+    '/api/products/',
+    '/api/products/?view=summary',
+    '/api/looks/',
+    '/api/looks/?view=summary',
+]
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    def summary(self):
+        count = len(self.latencies)
+        as_ms = lambda value: None if value is None else round(value * 1000, 2)
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'rps': round(count / self.elapsed, 1) if self.elapsed else 0.0,
+            'p50_ms': as_ms(self.percentile(50)),
+            'p99_ms': as_ms(self.percentile(99)),
+            'max_ms': as_ms(max(self.latencies, default=None)),
+            'bytes_per_request': round(self.bytes / count) if count else 0,
+        }
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by server')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    size = 0
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            chunk_size = int((await reader.readline()).split(b';')[0], 16)
+            if chunk_size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            await reader.readexactly(chunk_size + 2)
+            size += chunk_size
+    else:
+        size = int(headers.get('content-length', 0))
+        await reader.readexactly(size)
+    return status, size, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(base_url, paths, deadline, result, bust_cache, counter):
+    parts = urlsplit(base_url)
+    host, port, prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+    reader = writer = None
+    for path in paths:
+        if time.perf_counter() >= deadline:
+            break
+        if bust_cache:
+            path += ('&' if '?' in path else '?') + f'_={next(counter)}'
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            writer.write(
+                f'GET {prefix}{path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+                f'Accept: application/json\r\n\r\n'.encode('latin-1')
+            )
+            await writer.drain()
+            status, size, keep_alive = await _read_response(reader)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            result.errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            continue
+        result.latencies.append(time.perf_counter() - started)
+        result.bytes += size
+        if status >= 400:
+            result.errors += 1
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(base_url, paths, concurrency, duration, bust_cache):
+    result = LoadResult()
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        # Сдвиг по списку путей, чтобы клиенты не запрашивали одно и то же синхронно
+        _client(base_url, itertools.islice(itertools.cycle(paths), index, None), deadline, result, bust_cache, counter)
+        for index in range(concurrency)
+    ))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def run_load(base_url, paths=DEFAULT_PATHS, concurrency=100, duration=30.0, warmup=5.0, bust_cache=False):
+    """
+    Нагрузка постоянной конкурентностью: `concurrency` клиентов с keep-alive
+    шлют GET по кругу в течение `duration` секунд. Первые `warmup` секунд
+    не учитываются (прогрев соединений, кэшей и пулов).
+    """
+    if warmup:
+        asyncio.run(_run(base_url, paths, concurrency, warmup, bust_cache))
+    return asyncio.run(_run(base_url, paths, concurrency, duration, bust_cache)).summary()
+
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS процесса до текущего; работает только на Linux."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss не сбрасывается: пик за всё время процесса; в macOS он в байтах
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Scenario:
+    """
+    Запрос к одному эндпоинту. `build(index)` возвращает аргументы метода
+    тестового клиента для `index`-го повтора, чтобы записи не конфликтовали,
+    а `--bust-cache` мог обойти кэш ответов.
+    """
+    def __init__(self, name, method, build, max_requests=None):
+        self.name, self.method, self.build, self.max_requests = name, method, build, max_requests
+
+
+def _read(path, **params):
+    def build(index, bust_cache):
+        return {'path': path, 'data': {**params, **({'_': index} if bust_cache else {})}}
+    return build
+
+
+def _write(path, payload):
+    def build(index, bust_cache):
+        return {'path': path, 'data': json.dumps(payload(index)), 'content_type': 'application/json'}
+    return build
+
+
+def _upload(path):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (120, 120, 120)).save(buffer, 'PNG')
+    content = buffer.getvalue()
+
+    def build(index, bust_cache):
+        image = SimpleUploadedFile(f'bench_{index}.png', content, content_type='image/png')
+        return {'path': path, 'data': {'image': image, 'is_main': 'false'}}
+    return build
+
+
+def _import(rows):
+    def build(index, bust_cache):
+        body = ''.join(
+            json.dumps({'article': f'B{row:05d}', 'name': f'Товар {row}', 'price': 1000 + index, 'material': 'Хлопок'},
+                       ensure_ascii=False) + '\n'
+            for row in range(rows)
+        )
+        return {'path': '/api/products/bulk/', 'data': body.encode('utf-8'), 'content_type': 'application/x-ndjson'}
+    return build
+
+
+def api_scenarios(product_id, look_id, product_image_id, search_term):
+    """
+    Все эндпоинты site_api/urls.py. Чтения идут первыми, чтобы записи не меняли
+    каталог, на котором они измеряются. Товары и образы создаются через импорт:
+    POST /api/products/ и /api/looks/ требуют вложенных файлов фото и пока
+    не принимают корректное тело запроса.
+    """
+    return [
+        Scenario('products.list', 'get', _read('/api/products/')),
+        Scenario('products.list.summary', 'get', _read('/api/products/', view='summary')),
+        Scenario('products.list.filtered', 'get', _read('/api/products/', price_min=1000, ordering='price')),
+        Scenario('products.detail', 'get', _read(f'/api/products/{product_id}/')),
+        Scenario('products.looks', 'get', _read(f'/api/products/{product_id}/looks/')),
+        Scenario('looks.list', 'get', _read('/api/looks/')),
+        Scenario('looks.list.summary', 'get', _read('/api/looks/', view='summary')),
+        Scenario('looks.detail', 'get', _read(f'/api/looks/{look_id}/')),
+        Scenario('products.batch', 'get', _read('/api/products/', ids=','.join(str(product_id + offset) for offset in range(20)))),
+        Scenario('looks.batch', 'post', _write('/api/looks/batch/', lambda index: {'ids': [look_id + offset for offset in range(20)]})),
+        Scenario('search', 'get', _read('/api/search/', q=search_term)),
+        Scenario('changes', 'get', _read('/api/changes/', since=0)),
+        Scenario('renditions', 'get', _read(f'/api/renditions/product/{product_image_id}/card.webp')),
+        # Выгрузки читают весь каталог, поэтому повторов немного
+        Scenario('products.export', 'get', _read('/api/products/export/'), max_requests=5),
+        Scenario('looks.export', 'get', _read('/api/looks/export/'), max_requests=5),
+        Scenario('products.bulk.export', 'get', _read('/api/products/bulk/'), max_requests=5),
+        Scenario('products.bulk.import', 'post', _import(rows=20), max_requests=50),
+        Scenario('products.update', 'put', _write(f'/api/products/{product_id}/', lambda index: {'price': 1000 + index})),
+        Scenario('looks.update', 'put', _write(f'/api/looks/{look_id}/', lambda index: {'price': 5000 + index})),
+        Scenario('products.image.upload', 'post', _upload(f'/api/products/{product_id}/images/'), max_requests=50),
+        Scenario('looks.image.upload', 'post', _upload(f'/api/looks/{look_id}/images/'), max_requests=50),
+    ]
+
+
+def run_scenario(client, scenario, requests=200, warmup=10, bust_cache=False):
+    """
+    Последовательные запросы через тестовый клиент Django, без HTTP-сервера:
+    латентность приложения, число запросов к БД (максимум на запрос) и пик RSS.
+    """
+    requests = min(requests, scenario.max_requests or requests)
+    warmup = min(warmup, requests)
+    send = getattr(client, scenario.method)
+    result = LoadResult()
+    queries = 0
+    for index in range(-warmup, 0):
+        _consume(send(**scenario.build(index, bust_cache)))
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    for index in range(requests):
+        kwargs = scenario.build(index, bust_cache)
+        with CaptureQueriesContext(connection) as context:
+            request_started = time.perf_counter()
+            response = send(**kwargs)
+            size = _consume(response)
+            result.latencies.append(time.perf_counter() - request_started)
+        queries = max(queries, len(context.captured_queries))
+        result.bytes += size
+        result.errors += response.status_code >= 400
+    result.elapsed = time.perf_counter() - started
+    return {**result.summary(), 'queries': queries, 'peak_rss_mb': peak_rss_mb()}
+
+
+def _consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def compare_results(baseline, current, tolerance=0.25, min_delta_ms=1.0):
+    """
+    Список регрессий относительно сохранённого прогона. Латентность (p50, p99)
+    и пик RSS сравниваются с допуском `tolerance`, для латентности ещё и с
+    минимальной разницей `min_delta_ms` против шума на быстрых эндпоинтах.
+    Рост числа запросов к БД и новые ошибки считаются регрессией всегда.
+    """
+    regressions = []
+    for size, scenarios in current.items():
+        for name, result in scenarios.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            label = f'{size} {name}'
+            for metric in ('p50_ms', 'p99_ms'):
+                if before[metric] is None or result[metric] is None:
+                    continue
+                if result[metric] > before[metric] * (1 + tolerance) and result[metric] - before[metric] > min_delta_ms:
+                    regressions.append(f'{label}: {metric} {before[metric]} -> {result[metric]}')
+            if result['queries'] > before['queries']:
+                regressions.append(f'{label}: queries {before["queries"]} -> {result["queries"]}')
+            if result['errors'] > before['errors']:
+                regressions.append(f'{label}: errors {before["errors"]} -> {result["errors"]}')
+            if result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f'{label}: peak_rss_mb {before["peak_rss_mb"]} -> {result["peak_rss_mb"]}')
+    return regressions
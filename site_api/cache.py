@@ -0,0 +1,136 @@
+import hashlib
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.http import HttpResponse
+from site_api.metrics import record_cache
+from site_api.renderers import CatalogJSONRenderer
+from site_api.routers import reading_from_replica
+
+CATALOG_CACHE_ALIAS = 'catalog'
+
+PRODUCTS = 'products'
+LOOKS = 'looks'
+
+
+def catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def _version_key(resource):
+    return f'catalog:{resource}:version'
+
+
+def get_version(resource):
+    cache = catalog_cache()
+    version = cache.get(_version_key(resource))
+    if version is None:
+        # Начальное значение от времени: после вытеснения ключа версия не повторится
+        cache.add(_version_key(resource), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(resource))
+    return version
+
+
+async def aget_version(resource):
+    cache = catalog_cache()
+    version = await cache.aget(_version_key(resource))
+    if version is None:
+        await cache.aadd(_version_key(resource), time.time_ns(), timeout=None)
+        version = await cache.aget(_version_key(resource))
+    return version
+
+
+def bump_version(*resources):
+    cache = catalog_cache()
+    for resource in resources:
+        try:
+            cache.incr(_version_key(resource))
+        except ValueError:
+            cache.set(_version_key(resource), time.time_ns(), timeout=None)
+
+
+def bump_version_on_commit(*resources, using=None):
+    """
+    Сдвигает версии после коммита текущей транзакции (вне транзакции - сразу).
+
+    Сдвиг до коммита позволил бы параллельному чтению сохранить под новой
+    версией ещё старые закоммиченные строки на весь таймаут кэша.
+    """
+    transaction.on_commit(partial(bump_version, *resources), using=using)
+
+
+def path_cache_key(resource, path, version=None):
+    version = get_version(resource) if version is None else version
+    path_hash = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return f'catalog:{resource}:{version}:{path_hash}'
+
+
+def response_cache_key(resource, request, version=None):
+    return path_cache_key(resource, request.get_full_path(), version)
+
+
+def _responses_key(resources, request, versions):
+    """Ключ ответа, который зависит от нескольких ресурсов: сдвиг версии любого из них его меняет."""
+    return path_cache_key('+'.join(resources), request.get_full_path(), '.'.join(map(str, versions)))
+
+
+def response_timeout():
+    """Ответ, собранный с отстающей реплики, не должен жить под новой версией вечно."""
+    return settings.DB_REPLICA_CACHE_TIMEOUT if reading_from_replica() else DEFAULT_TIMEOUT
+
+
+def cache_response(*resources):
+    """
+    Кэширует готовые JSON-байты ответа GET под версиями ресурсов, из которых он собран.
+
+    Ответы браузабельного API и все ответы, кроме 200, не кэшируются.
+    Версия читается до построения ответа, а писатели сдвигают её только
+    после коммита (`bump_version_on_commit`), поэтому запись, совпавшая
+    по времени с чтением, не оставит в кэше устаревших данных.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.accepted_renderer.format != 'json':
+                return method(view, request, *args, **kwargs)
+
+            cache = catalog_cache()
+            key = _responses_key(resources, request, [get_version(resource) for resource in resources])
+            content = cache.get(key)
+            record_cache(content is not None)
+            if content is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = CatalogJSONRenderer().render(response.data)
+                cache.set(key, content, response_timeout())
+            return HttpResponse(content, content_type='application/json')
+        return wrapper
+    return decorator
+
+
+def acache_response(*resources):
+    """
+    То же для асинхронных view из site_api.async_views: они всегда отвечают JSON,
+    а ключи совпадают с синхронными, поэтому обе версии делят один кэш.
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(view, request, *args, **kwargs):
+            cache = catalog_cache()
+            key = _responses_key(resources, request, [await aget_version(resource) for resource in resources])
+            content = await cache.aget(key)
+            record_cache(content is not None)
+            if content is None:
+                response = await method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = response.content
+                await cache.aset(key, content, response_timeout())
+            return HttpResponse(content, content_type='application/json')
+        return wrapper
+    return decorator
@@ -0,0 +1,277 @@
+import codecs
+import csv
+import io
+import json
+import posixpath
+from itertools import islice
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework import serializers
+from site_api.cache import PRODUCTS, LOOKS, bump_version_on_commit
+from site_api.changes import record_changes
+from site_api.images import sync_images
+from site_api.models import Product, ProductImage, Category, Look, ChangeAction
+from site_api.renderers import CatalogJSONRenderer
+from site_api.search import refresh_product_search, refresh_look_search
+from site_api.snapshots import refresh_product_snapshot, refresh_look_pricing
+from site_api.storage import INCOMING_DIR
+
+FORMATS = ('ndjson', 'csv')
+
+# Разделитель списков (категорий и фото) в ячейках CSV
+CSV_LIST_SEPARATOR = '|'
+CSV_FIELDS = ['article', 'name', 'price', 'material', 'categories', 'images']
+
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    Строка импорта. Категории задаются именами (недостающие создаются,
+    строка с именем нескольких категорий отклоняется), фото - путями
+    уже загруженных файлов в MEDIA_ROOT, первое фото основное.
+    """
+    article = serializers.CharField(max_length=6, validators=Product._meta.get_field('article').validators)
+    name = serializers.CharField(max_length=255)
+    price = serializers.IntegerField(min_value=1)
+    material = serializers.CharField()
+    categories = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    images = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+
+    def validate_images(self, value):
+        # Путь должен вести к уже загруженному файлу, а не наружу из MEDIA_ROOT или во временный каталог
+        for name in value:
+            if posixpath.normpath(name) != name or name.split('/')[0] == INCOMING_DIR or not _stored(name):
+                raise serializers.ValidationError(f'No such file in media storage: {name!r}.')
+        return value
+
+
+def _stored(name):
+    try:
+        return default_storage.exists(name)
+    except SuspiciousFileOperation:
+        return False
+
+
+def detect_format(name='', content_type=''):
+    if content_type.startswith('text/csv') or name.lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+def read_rows(stream, fmt):
+    """Лениво читает байтовый поток построчно и отдаёт пары (номер строки, словарь или ошибка)."""
+    text = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        for line, row in enumerate(csv.DictReader(text), start=2):
+            for field in ('categories', 'images'):
+                if field in row:
+                    row[field] = [item.strip() for item in (row[field] or '').split(CSV_LIST_SEPARATOR) if item.strip()]
+            yield line, row
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as exc:
+            yield line, ValueError(f'Invalid JSON: {exc}')
+            continue
+        yield line, row if isinstance(row, dict) else ValueError('Row must be a JSON object.')
+
+
+def import_products(rows, chunk_size=1000):
+    report = {'created': 0, 'updated': 0, 'unchanged_images': 0, 'errors': []}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = {}
+        for line, row in chunk:
+            if isinstance(row, Exception):
+                report['errors'].append({'line': line, 'errors': [str(row)]})
+                continue
+            serializer = ProductImportSerializer(data=row)
+            if not serializer.is_valid():
+                report['errors'].append({'line': line, 'article': row.get('article'), 'errors': serializer.errors})
+                continue
+            article = serializer.validated_data['article']
+            if article in valid:
+                previous_line = valid[article][0]
+                report['errors'].append({
+                    'line': previous_line, 'article': article,
+                    'errors': [f'Duplicate article, superseded by line {line}.'],
+                })
+            valid[article] = (line, serializer.validated_data)
+
+        categories, ambiguous = _category_ids({name for _, data in valid.values() for name in data.get('categories', [])})
+        for article, (line, data) in list(valid.items()):
+            names = sorted(ambiguous.intersection(data.get('categories', [])))
+            if names:
+                report['errors'].append({
+                    'line': line, 'article': article,
+                    'errors': {'categories': [f"Several categories are named {name!r}." for name in names]},
+                })
+                del valid[article]
+        if valid:
+            _write_chunk([data for _, data in valid.values()], categories, report)
+    return report
+
+
+def _category_ids(names):
+    """
+    id категорий по именам. Имя категории не уникально, поэтому имена, под которыми
+    в каталоге несколько категорий, возвращаются отдельно: строки с ними не импортируются.
+    """
+    ids, ambiguous = {}, set()
+    for pk, name in Category.objects.filter(name__in=names).values_list('id', 'name'):
+        if name in ids:
+            ambiguous.add(name)
+        ids[name] = pk
+    return ids, ambiguous
+
+
+@transaction.atomic
+def _write_chunk(items, categories, report):
+    articles = [item['article'] for item in items]
+    existing = set(Product.objects.filter(article__in=articles).values_list('article', flat=True))
+
+    Product.objects.bulk_create(
+        [
+            Product(article=item['article'], name=item['name'], price=item['price'], material=item['material'])
+            for item in items
+        ],
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=['name', 'price', 'material', 'updated_at'],
+    )
+    ids = dict(Product.objects.filter(article__in=articles).values_list('article', 'id'))
+    report['created'] += len(items) - len(existing)
+    report['updated'] += len(existing)
+
+    _write_categories(items, ids, categories)
+    _write_images(items, ids, report)
+    refresh_product_snapshot(list(ids.values()))
+    # bulk_create и update() не вызывают сигналы, поэтому поисковый индекс и цены образов обновляем сами
+    looks = Look.objects.filter(products__in=list(ids.values())).values('pk')
+    refresh_product_search(list(ids.values()))
+    refresh_look_search(looks)
+    refresh_look_pricing(looks)
+    # Журнал изменений для строк, записанных bulk_create
+    record_changes(Product, [ids[article] for article in articles if article not in existing], ChangeAction.CREATED)
+    record_changes(Product, [ids[article] for article in articles if article in existing], ChangeAction.UPDATED)
+    record_changes(Look, looks.values_list('pk', flat=True), ChangeAction.UPDATED)
+    # Каждый кусок коммитится отдельно, версию сдвигаем после его коммита
+    bump_version_on_commit(PRODUCTS, LOOKS)
+
+
+def _write_categories(items, ids, categories):
+    names = {name for item in items for name in item.get('categories', [])}
+    missing = [Category(name=name) for name in names if name not in categories]
+    for category in Category.objects.bulk_create(missing):
+        categories[category.name] = category.pk
+    record_changes(Category, [category.pk for category in missing], ChangeAction.CREATED)
+
+    through = Product.categories.through
+    with_categories = [item for item in items if 'categories' in item]
+    through.objects.filter(product_id__in=[ids[item['article']] for item in with_categories]).delete()
+    through.objects.bulk_create(
+        [
+            through(product_id=ids[item['article']], category_id=categories[name])
+            for item in with_categories
+            for name in dict.fromkeys(item['categories'])
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def _write_images(items, ids, report):
+    """
+    Приводит фото товаров к спискам из строк через sync_images: фото с тем же
+    файлом сохраняет свой id, лишние удаляются вместе с файлами без ссылок.
+    """
+    with_images = {ids[item['article']]: list(dict.fromkeys(item['images'])) for item in items if item.get('images')}
+    current = {}
+    for pk, product_id, name in (
+        ProductImage.objects.filter(product_id__in=with_images)
+        .order_by('product_id', '-is_main', 'id')
+        .values_list('id', 'product_id', 'image')
+    ):
+        current.setdefault(product_id, []).append((pk, name))
+
+    for product_id, names in with_images.items():
+        images = current.get(product_id, [])
+        if [name for _, name in images] == names:
+            report['unchanged_images'] += 1
+            continue
+        by_name = {}
+        for pk, name in images:
+            by_name.setdefault(name, []).append(pk)
+        sync_images(Product(pk=product_id), 'product', [
+            {'id': by_name[name].pop(0), 'is_main': index == 0} if by_name.get(name)
+            else {'image': name, 'is_main': index == 0}
+            for index, name in enumerate(names)
+        ])
+
+
+def export_rows(chunk_size=1000):
+    """Отдаёт товары в формате строк импорта; память не растёт с размером каталога."""
+    queryset = Product.objects.order_by('id').prefetch_related('categories', 'images')
+    for product in queryset.iterator(chunk_size=chunk_size):
+        images = sorted(product.images.all(), key=lambda image: (not image.is_main, image.pk))
+        yield {
+            'article': product.article,
+            'name': product.name,
+            'price': product.price,
+            'material': product.material,
+            'categories': [category.name for category in product.categories.all()],
+            'images': [image.image.name for image in images if image.image],
+        }
+
+
+def render_rows(rows, fmt):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue()
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow({
+                **row,
+                'categories': CSV_LIST_SEPARATOR.join(row['categories']),
+                'images': CSV_LIST_SEPARATOR.join(row['images']),
+            })
+            yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def stream_serialized(queryset, serializer_class, fmt, chunk_size=500):
+    """
+    Сериализует выборку кусками по `chunk_size` и сразу отдаёт байты.
+
+    `.iterator(chunk_size=...)` читает строки серверным курсором и выполняет
+    prefetch_related отдельно для каждого куска, поэтому память воркера
+    не зависит от размера каталога.
+    """
+    renderer = CatalogJSONRenderer()
+    objects = queryset.order_by('id').iterator(chunk_size=chunk_size)
+    if fmt == 'json':
+        yield b'['
+    first = True
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            break
+        for item in serializer_class(chunk, many=True).data:
+            if fmt == 'json':
+                yield renderer.render(item) if first else b',' + renderer.render(item)
+            else:
+                yield renderer.render(item) + b'\n'
+            first = False
+    if fmt == 'json':
+        yield b']'
@@ -0,0 +1,75 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from site_api.models import Product, ProductImage, Category, Look, LookImage, ChangeLogEntry, ChangeAction
+
+# Имена ресурсов в журнале и в ответе /api/changes/
+RESOURCES = {
+    Product: 'products',
+    ProductImage: 'product_images',
+    Category: 'categories',
+    Look: 'looks',
+    LookImage: 'look_images',
+}
+
+UPSERTED = 'upserted'
+
+
+def record_changes(model, ids, action):
+    """
+    Добавляет записи журнала одним INSERT в текущей транзакции: журнал
+    коммитится и откатывается вместе с данными, поэтому изменение не может
+    попасть в каталог без записи в журнале. `ids` - любой итерируемый набор id.
+    """
+    resource = RESOURCES[model]
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(resource=resource, object_id=object_id, action=action)
+        for object_id in dict.fromkeys(ids)
+    ])
+
+
+def settled_cursor():
+    """
+    Курсор, до которого журнал уже не пополнится задним числом. id записи
+    выдаётся при INSERT, а видна она становится при коммите транзакции, поэтому
+    запись с меньшим id может появиться позже записи с большим. Это окно
+    покрывает CHANGES_SETTLE_SECONDS: оно должно быть дольше самой долгой
+    транзакции, которая пишет в каталог.
+    """
+    settle = datetime.timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    entries = ChangeLogEntry.objects.filter(created_at__lte=timezone.now() - settle)
+    return entries.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def changes_since(cursor, limit):
+    """
+    Сжатая пачка изменений после курсора.
+
+    Записи одного объекта схлопываются в итоговое состояние: удалённые
+    попадают в `deleted` (tombstone), остальные - в `upserted`, и клиент
+    перечитывает их текущее представление. Записи моложе
+    CHANGES_SETTLE_SECONDS откладываются до следующего запроса.
+    """
+    settle = datetime.timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    entries = list(
+        ChangeLogEntry.objects.filter(pk__gt=cursor, created_at__lte=timezone.now() - settle)
+        .order_by('pk')
+        .values_list('pk', 'resource', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    states = {}
+    for _, resource, object_id, action in entries:
+        states[resource, object_id] = action
+    changes = {}
+    for (resource, object_id), action in sorted(states.items()):
+        kind = ChangeAction.DELETED.value if action == ChangeAction.DELETED else UPSERTED
+        changes.setdefault(resource, {UPSERTED: [], ChangeAction.DELETED.value: []})[kind].append(object_id)
+
+    return {
+        'cursor': entries[-1][0] if entries else cursor,
+        'has_more': has_more,
+        'changes': changes,
+    }
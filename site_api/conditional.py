@@ -0,0 +1,120 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from site_api.cache import catalog_cache, response_cache_key, aget_version, response_timeout
+from site_api.models import Product, Category, Look
+
+
+def _state(queryset, modified_field='updated_at'):
+    state = queryset.aggregate(count=Count('pk', distinct=True), modified=Max(modified_field))
+    return state['count'], state['modified']
+
+
+def product_list_state(request):
+    return [_state(Product.objects.all()), _state(Category.objects.all())]
+
+
+def look_list_state(request):
+    return [_state(Look.objects.all()), _state(Product.objects.all()), _state(Category.objects.all())]
+
+
+def product_detail_state(request, pk):
+    product = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if product is None:
+        return None
+    return [(1, product), _state(Category.objects.filter(products=pk))]
+
+
+def look_detail_state(request, pk):
+    look = Look.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if look is None:
+        return None
+    categories = Category.objects.filter(Q(looks=pk) | Q(products__looks=pk))
+    return [(1, look), _state(Product.objects.filter(looks=pk)), _state(categories)]
+
+
+def _validators(request, fmt, state):
+    fingerprint = repr((request.get_full_path(), fmt, state))
+    last_modified = max((modified for _, modified in state if modified is not None), default=None)
+    return (
+        quote_etag(hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()),
+        int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def _set_validators(response, validators):
+    etag, last_modified = validators
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_get(resource, state_func, detail=False):
+    """
+    Отдаёт ETag и Last-Modified и отвечает 304 до сериализации и до кэша ответов.
+
+    Валидаторы считаются дешёвыми агрегатами (число строк и максимальный
+    `updated_at`) и запоминаются в кэше каталога под текущей версией ресурса.
+    If-Modified-Since учитывается только для одиночных объектов: удаление
+    строки из списка не сдвигает максимальный `updated_at`, а ETag учитывает
+    и число строк.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = catalog_cache()
+            fmt = request.accepted_renderer.format
+            # Браузабельный API и JSON - разные представления, у каждого свой ETag
+            key = response_cache_key(resource, request) + f':validators:{fmt}'
+            validators = cache.get(key)
+            if validators is None:
+                state = state_func(request, *args, **kwargs)
+                if state is None:
+                    return method(view, request, *args, **kwargs)
+                validators = _validators(request, fmt, state)
+                cache.set(key, validators, response_timeout())
+
+            etag, last_modified = validators
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified if detail else None,
+            )
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _set_validators(response, validators)
+        return wrapper
+    return decorator
+
+
+def aconditional_get(resource, state_func, detail=False):
+    """Асинхронный вариант `conditional_get`; агрегаты состояния считаются в потоке через sync_to_async."""
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(view, request, *args, **kwargs):
+            cache = catalog_cache()
+            key = response_cache_key(resource, request, await aget_version(resource)) + ':validators:json'
+            validators = await cache.aget(key)
+            if validators is None:
+                state = await sync_to_async(state_func)(request, *args, **kwargs)
+                if state is None:
+                    return await method(view, request, *args, **kwargs)
+                validators = _validators(request, 'json', state)
+                await cache.aset(key, validators, response_timeout())
+
+            etag, last_modified = validators
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified if detail else None,
+            )
+            if response is None:
+                response = await method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _set_validators(response, validators)
+        return wrapper
+    return decorator
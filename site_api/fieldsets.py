@@ -0,0 +1,38 @@
+def sparse_fieldsets(params):
+    """
+    `?fields=` и `?expand=` как множества путей через точку (`products.name`).
+    None - параметра нет: поля все, вложенные объекты раскрыты, как раньше.
+    """
+    def paths(name):
+        if name not in params:
+            return None
+        return {value.strip() for raw in params.getlist(name) for value in raw.split(',') if value.strip()}
+    return paths('fields'), paths('expand')
+
+
+def sparse_query(fields, expand):
+    """Канонический query string для ключей кэша: порядок путей не важен."""
+    params = [(name, paths) for name, paths in (('fields', fields), ('expand', expand)) if paths is not None]
+    if not params:
+        return ''
+    return '?' + '&'.join(f"{name}={','.join(sorted(paths))}" for name, paths in params)
+
+
+def top_level(paths):
+    return {path.split('.', 1)[0] for path in paths}
+
+
+def nested_paths(paths, name):
+    """Пути внутри поля `name`: `{'products.name', 'price'}` -> `{'name'}` для products."""
+    if paths is None:
+        return None
+    prefix = f'{name}.'
+    return {path[len(prefix):] for path in paths if path.startswith(prefix)}
+
+
+def included(fields, name):
+    return fields is None or name in top_level(fields)
+
+
+def expanded(expand, name):
+    return expand is None or name in top_level(expand)
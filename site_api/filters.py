@@ -0,0 +1,107 @@
+import datetime
+
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from site_api.models import Product, Look
+
+# Разрешённые варианты сортировки; id в конце делает ключ пагинации уникальным
+ORDERINGS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+DEFAULT_ORDERING = '-created_at'
+
+
+def _ints(params, name):
+    values = [value for raw in params.getlist(name) for value in raw.split(',') if value]
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise ValidationError({name: ['Expected integers.']})
+
+
+def _int(params, name):
+    values = _ints(params, name)
+    if len(values) > 1:
+        raise ValidationError({name: ['Expected a single integer.']})
+    return values[0] if values else None
+
+
+def _datetime(params, name):
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        value = parse_datetime(raw)
+        date = parse_date(raw) if value is None else None
+    except ValueError:
+        value = date = None
+    if value is None:
+        if date is None:
+            raise ValidationError({name: ['Expected an ISO 8601 date or datetime.']})
+        value = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def has_related(model, field_name, ids):
+    """EXISTS по промежуточной таблице M2M: не размножает строки и не требует DISTINCT."""
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    return Exists(through.objects.filter(**{
+        f'{field.m2m_field_name()}_id': OuterRef('pk'),
+        f'{field.m2m_reverse_field_name()}_id__in': ids,
+    }))
+
+
+def _filter_common(queryset, model, params):
+    ids = _ints(params, 'id')
+    if ids:
+        queryset = queryset.filter(pk__in=ids)
+    categories = _ints(params, 'category')
+    if categories:
+        queryset = queryset.filter(has_related(model, 'categories', categories))
+    price_min = _int(params, 'price_min')
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+    price_max = _int(params, 'price_max')
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+    created_after = _datetime(params, 'created_after')
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gt=created_after)
+    return queryset
+
+
+def filter_products(queryset, params):
+    """
+    Фильтры списка товаров: `id`, `category` (через запятую или повтором),
+    `price_min`, `price_max`, `created_after`, `in_look`.
+    """
+    queryset = _filter_common(queryset, Product, params)
+    looks = _ints(params, 'in_look')
+    if looks:
+        through = Look.products.through
+        queryset = queryset.filter(Exists(through.objects.filter(product_id=OuterRef('pk'), look_id__in=looks)))
+    return queryset
+
+
+def filter_looks(queryset, params):
+    """Фильтры списка образов: `id`, `category`, `price_min`, `price_max`, `created_after`, `product`."""
+    queryset = _filter_common(queryset, Look, params)
+    products = _ints(params, 'product')
+    if products:
+        queryset = queryset.filter(has_related(Look, 'products', products))
+    return queryset
+
+
+def get_ordering(params):
+    ordering = params.get('ordering', DEFAULT_ORDERING)
+    if ordering not in ORDERINGS:
+        raise ValidationError({'ordering': [f'Expected one of: {", ".join(ORDERINGS)}.']})
+    return ORDERINGS[ordering]
@@ -0,0 +1,78 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from site_api.cache import bump_version_on_commit
+from site_api.changes import record_changes
+from site_api.models import IMAGE_MODELS, ProductImage, LookImage, ImageJob, ProcessingStatus, ChangeAction
+from site_api.renditions import RENDITION_WIDTHS, RENDITION_FORMATS, rendition_name, rendition_storage
+from site_api.signals import INVALIDATES
+
+
+def sync_images(owner, kind, items):
+    """
+    Приводит фото товара или образа к списку `items` по разнице, а не пересозданием.
+
+    Элемент с `id` оставляет существующее фото (меняется только `is_main`),
+    элемент с `image` добавляет новое. Фото, которых нет в списке, удаляются,
+    их файлы - после коммита, если на них больше никто не ссылается.
+    Строки владельца и его фото блокируются до конца транзакции.
+    """
+    image_model = IMAGE_MODELS[kind]
+    fk_name = image_model._meta.get_field(kind).attname
+    with transaction.atomic():
+        list(type(owner).objects.select_for_update().filter(pk=owner.pk).values_list('pk', flat=True))
+        current = {
+            pk: (is_main, name)
+            for pk, is_main, name in image_model.objects.select_for_update()
+            .filter(**{fk_name: owner.pk}).values_list('pk', 'is_main', 'image')
+        }
+        kept = {item['id']: item.get('is_main', False) for item in items if 'id' in item}
+        added = [item for item in items if 'id' not in item]
+
+        removed = [pk for pk in current if pk not in kept]
+        if removed:
+            # Удаление через QuerySet.delete(): сигналы ведут журнал изменений и кэш
+            image_model.objects.filter(pk__in=removed).delete()
+            names = [current[pk][1] for pk in removed if current[pk][1]]
+            transaction.on_commit(lambda: delete_unreferenced_files(names))
+
+        # Уникальный индекс «одно основное фото» проверяется на каждой строке,
+        # поэтому сначала снимаем старое основное, затем ставим новое
+        main_id = next((pk for pk, is_main in kept.items() if is_main), None)
+        flipped = [pk for pk, is_main in kept.items() if current[pk][0] and pk != main_id]
+        if flipped:
+            image_model.objects.filter(pk__in=flipped).update(is_main=False)
+        if main_id is not None and not current[main_id][0]:
+            image_model.objects.filter(pk=main_id).update(is_main=True)
+            flipped.append(main_id)
+
+        images = image_model.objects.bulk_create([
+            image_model(
+                **{fk_name: owner.pk},
+                image=item['image'],
+                is_main=item.get('is_main', False),
+                processing_status=ProcessingStatus.PENDING,
+            )
+            for item in added
+        ])
+        # bulk_create и update() не вызывают сигналы: задачи обработки, журнал и кэш ведём сами
+        ImageJob.objects.bulk_create([ImageJob(kind=kind, image_id=image.pk) for image in images])
+        record_changes(image_model, [image.pk for image in images], ChangeAction.CREATED)
+        record_changes(image_model, flipped, ChangeAction.UPDATED)
+        if images or flipped:
+            bump_version_on_commit(*INVALIDATES[image_model])
+    return {'kept': len(kept), 'added': len(images), 'removed': len(removed)}
+
+
+def referenced_files(names):
+    """Имена из `names`, на которые ссылается хотя бы одно фото товара или образа."""
+    referenced = set(ProductImage.objects.filter(image__in=names).values_list('image', flat=True))
+    referenced.update(LookImage.objects.filter(image__in=names).values_list('image', flat=True))
+    return referenced
+
+
+def delete_unreferenced_files(names):
+    """Удаляет файлы фото и их производные, если ни одна строка больше не ссылается на файл."""
+    for name in default_storage.delete_unreferenced(names, referenced_files):
+        for size in RENDITION_WIDTHS:
+            for fmt in RENDITION_FORMATS:
+                rendition_storage.delete(rendition_name(name, size, fmt))
@@ -0,0 +1,116 @@
+import warnings
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+from site_api.cache import bump_version_on_commit
+from site_api.changes import record_changes
+from site_api.models import IMAGE_MODELS, ImageJob, ProcessingStatus, ChangeAction
+from site_api.renditions import RENDITION_WIDTHS, RENDITION_FORMATS, ensure_rendition, oriented_width
+from site_api.signals import INVALIDATES, touch
+
+
+def claim_jobs(limit):
+    """Забирает пачку задач; SKIP LOCKED позволяет запускать несколько воркеров параллельно."""
+    with transaction.atomic():
+        jobs = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ProcessingStatus.PENDING)
+            .order_by('id')[:limit]
+        )
+        ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ProcessingStatus.PROCESSING, attempts=F('attempts') + 1, updated_at=timezone.now()
+        )
+        for job in jobs:
+            job.attempts += 1
+        set_image_status(jobs, ProcessingStatus.PROCESSING)
+    return jobs
+
+
+def requeue_stale_jobs(older_than, max_attempts=3):
+    """
+    Возвращает в очередь задачи, брошенные упавшим воркером. Попытка засчитана
+    ещё при захвате (claim_jobs), поэтому задача, которая уже `max_attempts`
+    раз роняла воркер, помечается ошибкой, а не возвращается по кругу.
+    Возвращает пару (возвращено, помечено ошибкой).
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    stale = ImageJob.objects.filter(status=ProcessingStatus.PROCESSING, updated_at__lt=cutoff)
+    with transaction.atomic():
+        failed = list(stale.filter(attempts__gte=max_attempts).select_for_update(skip_locked=True))
+        ImageJob.objects.filter(pk__in=[job.pk for job in failed]).update(
+            status=ProcessingStatus.FAILED, error='Воркер не завершил задачу', updated_at=timezone.now()
+        )
+        set_image_status(failed, ProcessingStatus.FAILED)
+        requeued = stale.filter(attempts__lt=max_attempts).update(
+            status=ProcessingStatus.PENDING, updated_at=timezone.now()
+        )
+    return requeued, len(failed)
+
+
+def image_names(jobs):
+    ids = defaultdict(list)
+    for job in jobs:
+        ids[job.kind].append(job.image_id)
+    names = {}
+    for kind, image_ids in ids.items():
+        for image_id, name in IMAGE_MODELS[kind].objects.filter(pk__in=image_ids).values_list('pk', 'image'):
+            names[kind, image_id] = name
+    return names
+
+
+def process_image(name):
+    """
+    Тяжёлая часть задачи: выполняется в дочернем процессе и не обращается к БД.
+    Проверяет, что файл декодируется, строит все производные
+    (EXIF при перекодировании не переносится) и возвращает ширину оригинала.
+    Фото больше Image.MAX_IMAGE_PIXELS отклоняется ещё по заголовку.
+    """
+    with warnings.catch_warnings(), default_storage.open(name, 'rb') as source:
+        # Pillow только предупреждает до двукратного превышения предела, воркер отклоняет сразу
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        Image.open(source).verify()
+        # После verify() объект изображения непригоден, размеры читаем из заголовка заново
+        source.seek(0)
+        width = oriented_width(Image.open(source))
+    for size in RENDITION_WIDTHS:
+        for fmt in RENDITION_FORMATS:
+            ensure_rendition(name, size, fmt, force=True)
+    return width
+
+
+def finish_job(job, error=None, max_attempts=3, width=None):
+    if error is None:
+        status = ProcessingStatus.READY
+    elif job.attempts >= max_attempts:
+        status = ProcessingStatus.FAILED
+    else:
+        status = ProcessingStatus.PENDING
+    with transaction.atomic():
+        ImageJob.objects.filter(pk=job.pk).update(status=status, error=error or '', updated_at=timezone.now())
+        if width is not None:
+            IMAGE_MODELS[job.kind].objects.filter(pk=job.image_id).update(width=width)
+        if status != ProcessingStatus.PENDING:
+            set_image_status([job], status)
+
+
+def set_image_status(jobs, status):
+    """
+    Обновляет статус на записях фото через update(), без сигналов post_save,
+    поэтому сам сдвигает `updated_at` родителя, версию кэша каталога и пишет журнал изменений.
+    """
+    ids = defaultdict(list)
+    for job in jobs:
+        ids[job.kind].append(job.image_id)
+    for kind, image_ids in ids.items():
+        model = IMAGE_MODELS[kind]
+        model.objects.filter(pk__in=image_ids).update(processing_status=status, updated_at=timezone.now())
+        parent = model._meta.get_field(kind).related_model
+        touch(parent, images__in=image_ids)
+        bump_version_on_commit(*INVALIDATES[model])
+        record_changes(model, image_ids, ChangeAction.UPDATED)
+        record_changes(parent, parent.objects.filter(images__in=image_ids).values_list('pk', flat=True), ChangeAction.UPDATED)
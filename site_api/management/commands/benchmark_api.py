@@ -0,0 +1,129 @@
+import json
+import platform
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from site_api.benchmarks import api_scenarios, compare_results, run_scenario
+from site_api.cache import catalog_cache
+from site_api.models import Product, ProductImage, Look
+from site_api.seeding import clear_catalog, seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все эндпоинты site_api на нескольких размерах каталога во временной тестовой БД '
+        'и печатает rps, p50/p99, число запросов к БД и пик RSS. Результат можно сохранить как базовый '
+        '(--save) и сравнить с ним следующий прогон (--compare): при регрессиях команда завершается с ошибкой.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', metavar='PRODUCTS:LOOKS',
+                            help='Размер каталога; можно повторять. По умолчанию 1000:200 и 10000:2000.')
+        parser.add_argument('--images-per', type=int, default=3)
+        parser.add_argument('--requests', type=int, default=200, help='Повторов на сценарий.')
+        parser.add_argument('--warmup', type=int, default=10, help='Неучитываемых повторов перед замером.')
+        parser.add_argument('--scenario', action='append', help='Запустить только эти сценарии.')
+        parser.add_argument('--bust-cache', action='store_true',
+                            help='Уникальный параметр в каждом чтении: мимо кэша ответов, до БД.')
+        parser.add_argument('--save', help='Сохранить результат как базовый в JSON-файл.')
+        parser.add_argument('--compare', help='Сравнить с базовым JSON-файлом.')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый рост p50/p99 и RSS, доля.')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Меньшая разница в латентности не считается регрессией.')
+        parser.add_argument('--json', dest='as_json', action='store_true', help='Вывести результат в JSON.')
+
+    def handle(self, *args, size, images_per, requests, warmup, scenario, bust_cache, save, compare,
+               tolerance, min_delta_ms, as_json, **options):
+        sizes = []
+        for item in size or ['1000:200', '10000:2000']:
+            products, sep, looks = item.partition(':')
+            if not sep or not products.isdigit() or not looks.isdigit() or not int(products) or not int(looks):
+                raise CommandError(f'Ожидается PRODUCTS:LOOKS, получено: {item}')
+            sizes.append((item, int(products), int(looks)))
+        meta = {
+            'bust_cache': bust_cache,
+            'requests': requests,
+            'images_per': images_per,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+        baseline = None
+        if compare:
+            try:
+                with open(compare, encoding='utf-8') as source:
+                    baseline = json.load(source)
+            except FileNotFoundError as exc:
+                raise CommandError(exc)
+            if baseline['meta']['bust_cache'] != bust_cache:
+                raise CommandError('Базовый прогон снят с другим --bust-cache, сравнение бессмысленно.')
+
+        # Отдельная БД, локальный кэш и временный MEDIA_ROOT: рабочие данные не затрагиваются
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                DEBUG=False,
+                MEDIA_ROOT=media_root,
+                SLOW_REQUEST_MS=10 ** 9,
+                CACHES={**settings.CACHES, 'catalog': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark',
+                }},
+            ):
+                results = {}
+                for label, products, looks in sizes:
+                    self.stderr.write(f'{label}: заполнение каталога')
+                    clear_catalog()
+                    catalog_cache().clear()
+                    seed_catalog(products, looks, images_per=images_per)
+                    results[label] = self.run_size(label, images_per, requests, warmup, scenario, bust_cache)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        if save:
+            with open(save, 'w', encoding='utf-8') as output:
+                json.dump({'meta': meta, 'results': results}, output, ensure_ascii=False, indent=2)
+        if as_json:
+            self.stdout.write(json.dumps({'meta': meta, 'results': results}, ensure_ascii=False, indent=2))
+        else:
+            self.print_results(results)
+
+        if baseline is not None:
+            regressions = compare_results(baseline['results'], results, tolerance, min_delta_ms)
+            if regressions:
+                raise CommandError('Регрессии относительно базового прогона:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('Регрессий относительно базового прогона нет.'))
+
+    def run_size(self, label, images_per, requests, warmup, only, bust_cache):
+        # Исключение в view считается ошибкой сценария (500), а не прерывает прогон
+        client = Client(raise_request_exception=False, HTTP_HOST=settings.ALLOWED_HOSTS[0], HTTP_ACCEPT='application/json')
+        product = Product.objects.filter(looks__isnull=False).order_by('pk').first()
+        look = Look.objects.order_by('pk').first()
+        image = ProductImage.objects.filter(product=product).order_by('pk').first() if images_per else None
+        if image is None:
+            raise CommandError('Для сценария renditions нужны фото: --images-per должен быть больше 0.')
+        scenarios = api_scenarios(product.pk, look.pk, image.pk, product.name.split()[0])
+
+        results = {}
+        for scenario in scenarios:
+            if only and scenario.name not in only:
+                continue
+            self.stderr.write(f'{label}: {scenario.name}')
+            results[scenario.name] = run_scenario(client, scenario, requests, warmup, bust_cache)
+        return results
+
+    def print_results(self, results):
+        for label, scenarios in results.items():
+            self.stdout.write(f'\nКаталог {label}')
+            self.stdout.write(
+                f'{"scenario":<26}{"rps":>9}{"p50, мс":>10}{"p99, мс":>10}{"запросов":>10}{"RSS, МБ":>9}{"ошибки":>8}'
+            )
+            for name, result in scenarios.items():
+                self.stdout.write(
+                    f'{name:<26}{result["rps"]:>9}{result["p50_ms"] or "-":>10}{result["p99_ms"] or "-":>10}'
+                    f'{result["queries"]:>10}{result["peak_rss_mb"]:>9}{result["errors"]:>8}'
+                )
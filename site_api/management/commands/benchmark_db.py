@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from site_api.benchmarks import LoadResult
+from site_api.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет, сколько стоит новое соединение с БД на запрос: один и тот же GET '
+        'выполняется с CONN_MAX_AGE=0 и с постоянным соединением, в процессе, без HTTP-сервера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--path', help='Путь запроса; по умолчанию карточка первого товара.')
+
+    def handle(self, *args, requests, path, **options):
+        if path is None:
+            pk = Product.objects.order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                raise CommandError('Каталог пуст: задайте --path или заполните БД.')
+            path = f'/api/products/{pk}/'
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0], HTTP_ACCEPT='application/json')
+        pooled = 'pool' in connection.settings_dict['OPTIONS']
+
+        results = {}
+        modes = [('per-request', 0), ('persistent', None)]
+        if pooled:
+            # С пулом соединение «закрывается» возвратом в пул, сравнивать не с чем
+            modes = [('pool', 0)]
+        for name, max_age in modes:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            result = LoadResult()
+            started = time.perf_counter()
+            for index in range(requests):
+                # Уникальный параметр обходит кэш ответов, запрос доходит до БД
+                request_started = time.perf_counter()
+                response = client.get(path, {'_': f'{name}-{index}'})
+                result.latencies.append(time.perf_counter() - request_started)
+                result.errors += response.status_code >= 400
+            result.elapsed = time.perf_counter() - started
+            results[name] = result.summary()
+        connection.close()
+
+        self.stdout.write(f'{path}, {requests} запросов, сервер БД {connection.settings_dict["HOST"] or "local"}')
+        self.stdout.write(f'{"mode":<14}{"rps":>10}{"p50, мс":>10}{"p99, мс":>10}{"ошибки":>9}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<14}{result["rps"]:>10}{result["p50_ms"] or "-":>10}{result["p99_ms"] or "-":>10}{result["errors"]:>9}'
+            )
+        if 'persistent' in results and results['persistent']['p50_ms'] is not None:
+            saved = results['per-request']['p50_ms'] - results['persistent']['p50_ms']
+            self.stdout.write(f'Экономия на запрос (p50): {saved:.2f} мс')
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from site_api.benchmarks import DEFAULT_PATHS, run_load
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает запущенные развёртывания API по запросам в секунду и p99 при высокой конкурентности. '
+        'Пример: WSGI на :8000 (gunicorn api_fivefortyfive.wsgi:application) и ASGI на :8001 '
+        '(GUNICORN_BIND=0.0.0.0:8001 gunicorn -c api_fivefortyfive/gunicorn_asgi.py api_fivefortyfive.asgi:application).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', metavar='NAME=URL',
+                            help='Развёртывание для сравнения; по умолчанию wsgi=http://127.0.0.1:8000 '
+                                 'и asgi=http://127.0.0.1:8001.')
+        parser.add_argument('--path', action='append', help='Путь для нагрузки; можно повторять.')
+        parser.add_argument('--concurrency', type=int, default=256)
+        parser.add_argument('--duration', type=float, default=30.0, help='Длительность замера, сек.')
+        parser.add_argument('--warmup', type=float, default=5.0, help='Прогрев перед замером, сек.')
+        parser.add_argument('--bust-cache', action='store_true',
+                            help='Уникальный параметр в каждом запросе: мимо кэша ответов, до БД.')
+        parser.add_argument('--json', dest='as_json', action='store_true', help='Вывести результат в JSON.')
+
+    def handle(self, *args, target, path, concurrency, duration, warmup, bust_cache, as_json, **options):
+        targets = []
+        for item in target or ['wsgi=http://127.0.0.1:8000', 'asgi=http://127.0.0.1:8001']:
+            name, sep, url = item.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f'Ожидается NAME=http://host:port, получено: {item}')
+            targets.append((name, url))
+
+        results = {}
+        for name, url in targets:
+            self.stderr.write(f'{name}: {url}, {concurrency} клиентов, {duration} с')
+            results[name] = run_load(url, path or DEFAULT_PATHS, concurrency, duration, warmup, bust_cache)
+
+        if as_json:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+            return
+        baseline = results[targets[0][0]]
+        self.stdout.write(f'{"target":<12}{"rps":>10}{"p50, мс":>10}{"p99, мс":>10}{"ошибки":>9}{"rps к базе":>12}')
+        for name, result in results.items():
+            ratio = result['rps'] / baseline['rps'] if baseline['rps'] else 0
+            self.stdout.write(
+                f'{name:<12}{result["rps"]:>10}{result["p50_ms"] or "-":>10}{result["p99_ms"] or "-":>10}'
+                f'{result["errors"]:>9}{ratio:>11.2f}x'
+            )
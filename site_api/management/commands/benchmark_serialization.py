@@ -0,0 +1,61 @@
+import time
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from site_api.querysets import product_queryset, look_queryset
+from site_api.renderers import CatalogJSONRenderer, orjson
+from site_api.serializers import ProductSerializer, LookSerializer, drf_read
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает сериализацию полного представления на большом списке: обход полей DRF против '
+        'FastReadMixin и JSON из stdlib против orjson. Объекты берутся из БД (seed_catalog) и '
+        'повторяются до --items; заодно проверяется, что оба пути дают одинаковые байты.'
+    )
+    kinds = {
+        'products': (product_queryset, ProductSerializer),
+        'looks': (look_queryset, LookSerializer),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(self.kinds), default='looks')
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3, help='Берётся лучший из повторов.')
+
+    def handle(self, *args, kind, items, repeat, **options):
+        queryset_builder, serializer_class = self.kinds[kind]
+        objects = list(queryset_builder().order_by('id')[:items])
+        if not objects:
+            raise CommandError('Каталог пуст: заполните его командой seed_catalog.')
+        objects = list(islice(cycle(objects), items))
+
+        def best(function):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = function()
+                timings.append(time.perf_counter() - started)
+            return result, min(timings) * 1000
+
+        with drf_read():
+            drf_data, drf_ms = best(lambda: serializer_class(objects, many=True).data)
+        fast_data, fast_ms = best(lambda: serializer_class(objects, many=True).data)
+        stdlib_bytes, stdlib_ms = best(lambda: JSONRenderer().render(fast_data))
+        fast_bytes, render_ms = best(lambda: CatalogJSONRenderer().render(fast_data))
+        if JSONRenderer().render(drf_data) != stdlib_bytes or fast_bytes != stdlib_bytes:
+            raise CommandError('Быстрый путь дал другой JSON, чем DRF.')
+
+        self.stdout.write(f'{kind}: {items} объектов, {len(fast_bytes) / 1024 / 1024:.1f} МБ JSON, лучший из {repeat}')
+        self.stdout.write(f'{"этап":<36}{"мс":>10}{"ускорение":>12}')
+        rows = [
+            ('to_representation, DRF', drf_ms, drf_ms),
+            ('to_representation, FastReadMixin', fast_ms, drf_ms),
+            ('render, json (stdlib)', stdlib_ms, stdlib_ms),
+            (f'render, {"orjson" if orjson else "json (orjson не установлен)"}', render_ms, stdlib_ms),
+            ('итого, было', drf_ms + stdlib_ms, drf_ms + stdlib_ms),
+            ('итого, стало', fast_ms + render_ms, drf_ms + stdlib_ms),
+        ]
+        for name, elapsed, baseline in rows:
+            self.stdout.write(f'{name:<36}{elapsed:>10.1f}{baseline / elapsed:>11.2f}x')
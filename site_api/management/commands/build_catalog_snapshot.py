@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from site_api.static_catalog import build_snapshot, load_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        'Рендерит карточки, списки и списки по категориям в готовые JSON-файлы со сжатыми копиями gzip и brotli '
+        'и манифест URL -> файл. Снимок отдаёт CatalogSnapshotMiddleware (CATALOG_SNAPSHOT_DIR) или фронтовой прокси. '
+        'Пример: build_catalog_snapshot --base-url https://api.example.com --incremental'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.CATALOG_SNAPSHOT_DIR or None,
+                            help='Каталог снимка (по умолчанию CATALOG_SNAPSHOT_DIR).')
+        parser.add_argument('--base-url', help='Схема и хост API для ссылок next/previous; при --incremental - из манифеста.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число процессов; 1 - без пула.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Карточек на одну задачу пула.')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Перестроить только изменённое по журналу после прошлой сборки.')
+
+    def handle(self, *args, output, base_url, workers, chunk_size, incremental, **options):
+        if not output:
+            raise CommandError('Укажите --output или CATALOG_SNAPSHOT_DIR.')
+        if base_url is None and incremental:
+            base_url = (load_manifest(output) or {}).get('base_url')
+        if not base_url:
+            raise CommandError('Укажите --base-url, например https://api.example.com.')
+        started = time.monotonic()
+        report = build_snapshot(output, base_url.rstrip('/'), workers=workers, chunk_size=chunk_size, incremental=incremental)
+        self.stdout.write(self.style.SUCCESS(
+            f"Карточек: {report['details']}, страниц списков: {report['pages']}, URL в манифесте: {report['entries']}, "
+            f"удалено файлов: {report['removed_files']} за {time.monotonic() - started:.1f} с"
+        ))
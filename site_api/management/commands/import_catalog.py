@@ -0,0 +1,41 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from site_api.catalog_io import FORMATS, detect_format, read_rows, import_products
+
+
+class Command(BaseCommand):
+    help = 'Импорт товаров из NDJSON/CSV с upsert по артикулу пачками bulk_create.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу или '-' для stdin.")
+        parser.add_argument('--format', choices=FORMATS, help='По умолчанию определяется по расширению файла.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--report', help='Куда записать отчёт об ошибках (JSON).')
+
+    def handle(self, *args, path, format, chunk_size, report, **options):
+        fmt = format or detect_format(name=path)
+        started = time.monotonic()
+        if path == '-':
+            result = import_products(read_rows(sys.stdin.buffer, fmt), chunk_size=chunk_size)
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    result = import_products(read_rows(stream, fmt), chunk_size=chunk_size)
+            except FileNotFoundError as exc:
+                raise CommandError(exc)
+        elapsed = time.monotonic() - started
+
+        if report:
+            with open(report, 'w', encoding='utf-8') as output:
+                json.dump(result['errors'], output, ensure_ascii=False, indent=2, default=str)
+        else:
+            for error in result['errors']:
+                self.stderr.write(json.dumps(error, ensure_ascii=False, default=str))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: {result['created']}, обновлено: {result['updated']}, "
+            f"ошибок: {len(result['errors'])} за {elapsed:.1f} с"
+        ))
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from site_api.jobs import claim_jobs, requeue_stale_jobs, image_names, process_image, finish_job
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди обработки фото: забирает задачи из таблицы image_jobs и выполняет их в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Число процессов в пуле.')
+        parser.add_argument('--batch', type=int, default=10, help='Сколько задач забирать за раз.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Пауза при пустой очереди, сек.')
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Через сколько секунд задача в статусе processing считается брошенной.')
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и выйти.')
+
+    def create_executor(self, workers):
+        # Дочерние процессы не должны наследовать открытое соединение с БД
+        connections.close_all()
+        return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+
+    def handle(self, *args, workers, batch, poll_interval, max_attempts, stale_after, once, **options):
+        requeued, failed = requeue_stale_jobs(stale_after, max_attempts)
+        if requeued or failed:
+            self.stdout.write(f'Возвращено в очередь: {requeued}, исчерпали попытки: {failed}')
+
+        executor = self.create_executor(workers)
+        try:
+            while True:
+                jobs = claim_jobs(batch)
+                if not jobs:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                names = image_names(jobs)
+                futures = {}
+                broken = False
+                for job in jobs:
+                    name = names.get((job.kind, job.image_id))
+                    if not name:
+                        finish_job(job, error='Фото удалено или без файла', max_attempts=0)
+                        continue
+                    try:
+                        futures[job] = executor.submit(process_image, name)
+                    except BrokenProcessPool as exc:
+                        broken = True
+                        finish_job(job, error=f'{type(exc).__name__}: {exc}', max_attempts=max_attempts)
+
+                for job, future in futures.items():
+                    try:
+                        width = future.result()
+                    except Exception as exc:
+                        # Упавший дочерний процесс (OOM, сбой декодера) ломает весь пул: какая задача
+                        # его уронила, неизвестно, поэтому попытка засчитывается всем задачам пачки
+                        broken = broken or isinstance(exc, BrokenProcessPool)
+                        finish_job(job, error=f'{type(exc).__name__}: {exc}', max_attempts=max_attempts)
+                        self.stderr.write(f'{job}: {exc}')
+                    else:
+                        finish_job(job, width=width)
+                self.stdout.write(f'Обработано задач: {len(jobs)}')
+
+                if broken:
+                    self.stderr.write('Пул процессов сломан, создаётся новый')
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self.create_executor(workers)
+        finally:
+            executor.shutdown()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from site_api.models import Product, Look
+from site_api.search import refresh_product_search, refresh_look_search
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы товаров и образов (после первого развёртывания или сбоя).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        for model, refresh in ((Product, refresh_product_search), (Look, refresh_look_search)):
+            ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                refresh(ids[start:start + batch_size])
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {len(ids)}')
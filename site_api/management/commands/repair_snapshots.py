@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from site_api.cache import PRODUCTS, LOOKS, bump_version
+from site_api.models import Product, Look
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot, refresh_look_pricing
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает снимки main_image и category_ids и агрегаты цен образов (после миграции или ручных правок в БД).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        for model, refreshers in ((Product, [refresh_product_snapshot]), (Look, [refresh_look_snapshot, refresh_look_pricing])):
+            ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                with transaction.atomic():
+                    for refresh in refreshers:
+                        refresh(ids[start:start + batch_size])
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {len(ids)}')
+        bump_version(PRODUCTS, LOOKS)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from site_api.seeding import clear_catalog, seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет каталог синтетическими данными для нагрузочных тестов: категории, товары, '
+        'образы, фото и связи M2M пачками bulk_create. Пример: seed_catalog --products 100000 --looks 20000 --images-per 3'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--looks', type=int, default=200)
+        parser.add_argument('--images-per', type=int, default=3, help='Фото на товар и на образ.')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products-per-look', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора: одинаковое зерно даёт те же данные.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true',
+                            help='Сначала удалить весь каталог и журнал изменений. Только для тестовых БД.')
+
+    def handle(self, *args, products, looks, images_per, categories, products_per_look, seed, batch_size, clear, **options):
+        started = time.monotonic()
+        if clear:
+            clear_catalog()
+        report = seed_catalog(
+            products, looks, images_per=images_per, categories=categories,
+            products_per_look=products_per_look, seed=seed, batch_size=batch_size,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Категорий: {report['categories']}, товаров: {report['products']}, образов: {report['looks']}, "
+            f"фото: {report['images']} за {time.monotonic() - started:.1f} с"
+        ))
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from PIL import UnidentifiedImageError
+from site_api.models import ProductImage, LookImage
+from site_api.renditions import RENDITION_WIDTHS, RENDITION_FORMATS, ensure_rendition
+
+
+class Command(BaseCommand):
+    help = 'Заранее строит производные изображения (thumb/card/full в WebP и JPEG) для всех фото каталога.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(RENDITION_WIDTHS), default=list(RENDITION_WIDTHS))
+        parser.add_argument('--formats', nargs='+', choices=list(RENDITION_FORMATS), default=list(RENDITION_FORMATS))
+        parser.add_argument('--workers', type=int, default=4, help='Число потоков (Pillow отпускает GIL при сжатии).')
+        parser.add_argument('--force', action='store_true', help='Перестроить уже существующие файлы.')
+
+    def handle(self, *args, sizes, formats, workers, force, **options):
+        names = set()
+        for model in (ProductImage, LookImage):
+            names.update(model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+
+        jobs = [(name, size, fmt) for name in sorted(names) for size in sizes for fmt in formats]
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(ensure_rendition, *job, force=force): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (FileNotFoundError, UnidentifiedImageError) as exc:
+                    failed += 1
+                    self.stderr.write(f'{futures[future][0]}: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(names)}, производных: {len(jobs) - failed}, ошибок: {failed}'
+        ))
@@ -0,0 +1,60 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+from site_api.storage import INCOMING_DIR, is_content_addressed
+
+# Оригинал под хэшем содержимого не меняется никогда
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Производные и файлы со старыми именами могут быть перезаписаны на месте
+REVALIDATE = 'public, max-age=86400'
+
+
+def _etag(path, stat):
+    if is_content_addressed(path):
+        return '"%s"' % os.path.splitext(os.path.basename(path))[0]
+    return '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдача MEDIA_ROOT. Само тело отдаёт фронтовой сервер по MEDIA_SERVER:
+    `nginx` - X-Accel-Redirect на internal location MEDIA_ACCEL_PREFIX,
+    `sendfile` - X-Sendfile (Apache, lighttpd); по умолчанию FileResponse,
+    которую WSGI-сервер отдаёт через wsgi.file_wrapper (sendfile) без
+    чтения файла в Python. Django только проверяет путь и ставит заголовки.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    # Сравнивается нормализованный путь: `x/../.incoming/...` тоже ведёт во временный каталог
+    incoming = safe_join(settings.MEDIA_ROOT, INCOMING_DIR)
+    if full_path.startswith(incoming + os.sep) or not os.path.isfile(full_path):
+        raise Http404
+    stat = os.stat(full_path)
+    headers = {
+        'Cache-Control': IMMUTABLE if is_content_addressed(path) else REVALIDATE,
+        'ETag': _etag(path, stat),
+        'Last-Modified': http_date(stat.st_mtime),
+    }
+    if headers['ETag'] in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_SERVER == 'nginx':
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    elif settings.MEDIA_SERVER == 'sendfile':
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Sendfile'] = full_path
+    else:
+        response = FileResponse(open(full_path, 'rb'))
+    for name, value in headers.items():
+        response[name] = value
+    return response
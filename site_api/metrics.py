@@ -0,0 +1,201 @@
+import hmac
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+slow_logger = logging.getLogger('site_api.slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SLOW_QUERIES_LOGGED = 5
+SQL_LOG_LENGTH = 500
+
+# Метрики prometheus_client. Под gunicorn с несколькими воркерами задаётся
+# PROMETHEUS_MULTIPROC_DIR: каждый воркер пишет значения в свои файлы в общем
+# каталоге, а /metrics в любом воркере собирает их со всех процессов
+REQUEST_LABELS = ('route', 'method', 'status')
+request_duration = Histogram(
+    'catalog_request_duration_seconds', 'Время обработки запроса.', REQUEST_LABELS, buckets=LATENCY_BUCKETS,
+)
+request_queries = Histogram(
+    'catalog_request_db_queries', 'Число запросов к БД на HTTP-запрос.', ('route', 'method'),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_seconds = Counter(
+    'catalog_db_seconds_total', 'Суммарное время запросов к БД.', ('route', 'method'),
+)
+render_seconds = Counter(
+    'catalog_render_seconds_total', 'Суммарное время рендеринга ответов в JSON (без to_representation).',
+    ('route', 'method'),
+)
+response_bytes = Counter(
+    'catalog_response_bytes_total', 'Размер тел ответов; потоковые ответы не учитываются.', ('route', 'method'),
+)
+cache_requests = Counter(
+    'catalog_response_cache_total', 'Обращения к кэшу ответов каталога.', ('route', 'result'),
+)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'render', 'cache')
+
+    def __init__(self):
+        self.queries = []
+        self.render = 0.0
+        self.cache = None
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def record_cache(hit):
+    stats = _current.get()
+    if stats is not None:
+        stats.cache = 'hit' if hit else 'miss'
+
+
+@contextmanager
+def timed_render():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _current.get()
+        if stats is not None:
+            stats.render += time.perf_counter() - started
+
+
+def query_timer(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries.append((sql, time.perf_counter() - started))
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Соединения живут в потоках, в том числе в потоках sync_to_async,
+    # поэтому обёртка ставится на каждое новое соединение, а статистику
+    # запроса она находит через contextvar
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+class MetricsMiddleware:
+    """
+    Латентность, запросы к БД, время рендеринга JSON, размер ответа и попадания в кэш
+    по имени URL. В DEBUG добавляет заголовок Server-Timing; запросы дольше
+    SLOW_REQUEST_MS пишутся в лог `site_api.slow_requests` одной JSON-строкой.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def finish(self, request, response, stats, duration):
+        match = request.resolver_match
+        route = match.url_name if match and match.url_name else 'unmatched'
+        if route == 'metrics':
+            return response
+        size = 0 if response.streaming else len(response.content)
+        db_time = stats.db_time
+        request_duration.labels(route, request.method, str(response.status_code)).observe(duration)
+        request_queries.labels(route, request.method).observe(len(stats.queries))
+        db_seconds.labels(route, request.method).inc(db_time)
+        render_seconds.labels(route, request.method).inc(stats.render)
+        response_bytes.labels(route, request.method).inc(size)
+        if stats.cache is not None:
+            cache_requests.labels(route, stats.cache).inc()
+
+        if settings.DEBUG:
+            response['Server-Timing'] = ', '.join([
+                f'db;desc="{len(stats.queries)} queries";dur={db_time * 1000:.2f}',
+                f'render;dur={stats.render * 1000:.2f}',
+                f'total;dur={duration * 1000:.2f}',
+            ] + ([f'cache;desc="{stats.cache}"'] if stats.cache else []))
+
+        if duration * 1000 >= settings.SLOW_REQUEST_MS:
+            top = sorted(stats.queries, key=lambda query: query[1], reverse=True)[:SLOW_QUERIES_LOGGED]
+            slow_logger.warning(json.dumps({
+                'event': 'slow_request',
+                'route': route,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_queries': len(stats.queries),
+                'db_ms': round(db_time * 1000, 2),
+                'render_ms': round(stats.render * 1000, 2),
+                'response_bytes': size,
+                'cache': stats.cache,
+                'top_queries': [{'sql': sql[:SQL_LOG_LENGTH], 'ms': round(elapsed * 1000, 2)} for sql, elapsed in top],
+            }, ensure_ascii=False))
+        return response
+
+
+def metrics_view(request):
+    """
+    Экспозиция для Prometheus. Отдаётся только с токеном METRICS_TOKEN
+    (`Authorization: Bearer <токен>`); без настроенного токена адреса нет.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -1,8 +1,13 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
 from django.core.validators import MinValueValidator, RegexValidator
 
 class Category(models.Model):
     name = models.CharField(max_length=255, verbose_name='Имя категории')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения')
 
     class Meta:
         db_table = 'categories'
@@ -23,21 +28,58 @@ class Product(models.Model):
     price = models.PositiveIntegerField(validators=[MinValueValidator(1)], verbose_name='Цена')
     material = models.TextField(verbose_name='Материал')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения')
     categories = models.ManyToManyField(Category, related_name='products', verbose_name='Категории')
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Снимки для чтения из одной таблицы; поддерживаются site_api.snapshots
+    main_image = models.ForeignKey(
+        'ProductImage',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Основное фото'
+    )
+    category_ids = ArrayField(models.BigIntegerField(), default=list, blank=True, editable=False)
 
     class Meta:
         db_table = 'products'
         verbose_name = 'Товар'
         verbose_name_plural = 'Каталог'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='products_created_at_id_idx'),
+            models.Index(fields=['price', 'id'], name='products_price_id_idx'),
+            models.Index(fields=['updated_at'], name='products_updated_at_idx'),
+            GinIndex(fields=['search_vector'], name='products_search_idx'),
+            GinIndex(fields=['article'], opclasses=['gin_trgm_ops'], name='products_article_trgm_idx'),
+            # Поиск по началу артикула (article__istartswith) сравнивает UPPER(article) через LIKE
+            models.Index(OpClass(Upper('article'), name='text_pattern_ops'), name='products_article_prefix_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.article})"
 
+class ProcessingStatus(models.TextChoices):
+    PENDING = 'pending', 'В очереди'
+    PROCESSING = 'processing', 'Обрабатывается'
+    READY = 'ready', 'Готово'
+    FAILED = 'failed', 'Ошибка'
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE, verbose_name='Товар')
     image = models.ImageField(upload_to='product_images/', null=True, blank=True, verbose_name='Фото')
+    # Ширина с учётом EXIF-ориентации; заполняет воркер process_image_jobs, нужна для srcset
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина, px')
     is_main = models.BooleanField(default=False, verbose_name='Основное фото?')
+    processing_status = models.CharField(
+        max_length=16,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.READY,
+        verbose_name='Обработка'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения')
 
     class Meta:
         db_table = 'product_images'
@@ -58,13 +100,36 @@ class Look(models.Model):
     name = models.CharField(max_length=255, verbose_name='Название образа')
     price = models.PositiveIntegerField(validators=[MinValueValidator(1)], verbose_name='Цена')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения')
     products = models.ManyToManyField(Product, related_name='looks', verbose_name='Товары')
     categories = models.ManyToManyField(Category, related_name='looks', verbose_name='Категории')
+    search_vector = SearchVectorField(null=True, editable=False)
+    main_image = models.ForeignKey(
+        'LookImage',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Основное фото'
+    )
+    category_ids = ArrayField(models.BigIntegerField(), default=list, blank=True, editable=False)
+    # Агрегаты по товарам образа; поддерживаются сигналами, а не считаются при чтении
+    products_total = models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Сумма цен товаров')
+    products_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество товаров')
+    products_min_price = models.PositiveIntegerField(null=True, editable=False, verbose_name='Минимальная цена товара')
+    products_max_price = models.PositiveIntegerField(null=True, editable=False, verbose_name='Максимальная цена товара')
 
     class Meta:
         db_table = 'looks'
         verbose_name = 'Образ'
         verbose_name_plural = 'Образы'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='looks_created_at_id_idx'),
+            models.Index(fields=['price', 'id'], name='looks_price_id_idx'),
+            models.Index(fields=['updated_at'], name='looks_updated_at_idx'),
+            GinIndex(fields=['search_vector'], name='looks_search_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -72,8 +137,17 @@ class Look(models.Model):
 class LookImage(models.Model):
     look = models.ForeignKey(Look, related_name='images', on_delete=models.CASCADE, verbose_name='Образ')
     image = models.ImageField(upload_to='look_images/', null=True, blank=True, verbose_name='Фото')
+    # Ширина с учётом EXIF-ориентации; заполняет воркер process_image_jobs, нужна для srcset
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина, px')
     is_main = models.BooleanField(default=False, verbose_name='Основное фото?')
+    processing_status = models.CharField(
+        max_length=16,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.READY,
+        verbose_name='Обработка'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения')
 
     class Meta:
         db_table = 'look_images'
@@ -88,4 +162,55 @@ class LookImage(models.Model):
         ]
 
     def __str__(self):
-        return f"Картинка для {self.look.name} ({'Основная' if self.is_main else 'Дополнительная'})"
\ No newline at end of file
+        return f"Картинка для {self.look.name} ({'Основная' if self.is_main else 'Дополнительная'})"
+
+IMAGE_MODELS = {
+    'product': ProductImage,
+    'look': LookImage,
+}
+
+class ImageJob(models.Model):
+    kind = models.CharField(max_length=16, choices=[(kind, kind) for kind in IMAGE_MODELS], verbose_name='Тип фото')
+    image_id = models.PositiveBigIntegerField(verbose_name='ID фото')
+    status = models.CharField(
+        max_length=16,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения')
+
+    class Meta:
+        db_table = 'image_jobs'
+        verbose_name = 'Задача обработки фото'
+        verbose_name_plural = 'Задачи обработки фото'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='image_jobs_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.image_id} ({self.status})"
+
+class ChangeAction(models.TextChoices):
+    CREATED = 'created', 'Создание'
+    UPDATED = 'updated', 'Изменение'
+    DELETED = 'deleted', 'Удаление'
+
+class ChangeLogEntry(models.Model):
+    """Запись журнала изменений каталога; только добавляется, id служит курсором синхронизации."""
+    id = models.BigAutoField(primary_key=True)
+    resource = models.CharField(max_length=32, verbose_name='Ресурс')
+    object_id = models.PositiveBigIntegerField(verbose_name='ID объекта')
+    action = models.CharField(max_length=16, choices=ChangeAction.choices, verbose_name='Действие')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время')
+
+    class Meta:
+        db_table = 'change_log'
+        verbose_name = 'Изменение каталога'
+        verbose_name_plural = 'Журнал изменений'
+
+    def __str__(self):
+        return f"{self.resource} #{self.object_id} {self.action}"
@@ -0,0 +1,154 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import F
+from django.db.models.fields.tuple_lookups import Tuple, TupleGreaterThan, TupleLessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по набору ключей (по умолчанию `created_at`, `id`).
+
+    Страница выбирается условием `WHERE (created_at, id) < (...)` по индексу,
+    поэтому N-я страница стоит столько же, сколько первая. Курсор непрозрачен
+    для клиента: это base64 от позиции последней (или первой) строки страницы.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        rows = list(self.get_page_queryset(queryset, request))
+        return self.build_page(rows)
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor['reverse']
+        ordering = self._reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            position = self.parse_position(queryset.model, self.cursor['position'])
+            queryset = queryset.filter(self._after(ordering, position))
+        return queryset[:self.page_size + 1]
+
+    def build_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.cursor is not None and self.cursor['reverse']:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+            ordering = payload['o']
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        # Курсор, выданный для другой сортировки, указывал бы на чужую позицию
+        if ordering != ','.join(self.ordering) or not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return {'position': position, 'reverse': reverse}
+
+    def parse_position(self, model, position):
+        """Приводит значения курсора к типам полей сортировки: подделанный курсор - 404, а не ошибка в SQL."""
+        values = []
+        for field, value in zip(self.ordering, position):
+            if value is None or isinstance(value, (bool, list, dict)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                values.append(model._meta.get_field(field.lstrip('-')).to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, position, reverse):
+        payload = {'p': position, 'o': ','.join(self.ordering)}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def _position(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+    @staticmethod
+    def _after(ordering, position):
+        # Сравнение строк (a, b) < (x, y): PostgreSQL начинает с него диапазон по индексу (a, b).
+        # Так можно, только когда все поля ключа сортируются в одну сторону, как в filters.ORDERINGS
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ImproperlyConfigured('KeysetPagination.ordering must sort all fields in the same direction.')
+        lookup = TupleLessThan if descending.pop() else TupleGreaterThan
+        return lookup(Tuple(*(F(field.lstrip('-')) for field in ordering)), position)
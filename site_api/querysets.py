@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+from django.db.models import F, Prefetch
+from site_api.fieldsets import top_level, nested_paths, included, expanded
+from site_api.filters import ORDERINGS
+from site_api.models import Product, ProductImage, Category, Look, LookImage
+
+LOOK_PRICING_FIELDS = ('products_total', 'products_count', 'products_min_price', 'products_max_price')
+# Поисковый вектор нужен только в WHERE поиска, сериализаторы его не читают
+DEFERRED_COLUMNS = ('search_vector',)
+# Пагинация читает ключ сортировки с объекта, поэтому эти колонки грузятся всегда
+ORDERING_COLUMNS = {field.lstrip('-') for ordering in ORDERINGS.values() for field in ordering}
+
+
+def _columns(model, fields):
+    """Колонки для `.only()`: запрошенные поля модели, id и ключи keyset-пагинации."""
+    names = {field.name for field in model._meta.concrete_fields} & top_level(fields)
+    return ['id', *sorted(names | ORDERING_COLUMNS)]
+
+
+def _related_prefetch(name, model, fields, expand, fk_name=None, ordering=()):
+    """
+    Prefetch связи `name` по запросу: None, если поле не запрошено; только id
+    (и внешний ключ), если связь не раскрыта; иначе полный queryset `model`.
+    """
+    if not included(fields, name):
+        return None
+    queryset = model.objects.order_by(*ordering) if ordering else model.objects.all()
+    if not expanded(expand, name):
+        queryset = queryset.only('id', *filter(None, [fk_name]))
+    return Prefetch(name, queryset=queryset)
+
+
+def product_queryset(fields=None, expand=None):
+    """
+    Полный план prefetch для ProductSerializer: фиксированное число запросов на любую выборку.
+    С `fields`/`expand` (см. SparseFieldsMixin) грузит только запрошенные колонки и связи.
+    """
+    if fields is None:
+        queryset = Product.objects.defer(*DEFERRED_COLUMNS)
+    else:
+        queryset = Product.objects.only(*_columns(Product, fields))
+    prefetches = [
+        _related_prefetch('images', ProductImage, fields, expand, 'product_id', ('-is_main', 'id')),
+        _related_prefetch('categories', Category, fields, expand),
+    ]
+    return queryset.prefetch_related(*filter(None, prefetches))
+
+
+def look_queryset(fields=None, expand=None):
+    """
+    Полный план prefetch для LookSerializer, включая вложенные товары с их фото и категориями.
+    Вложенные `products.*` из `fields`/`expand` уходят в план товаров.
+    """
+    if fields is None:
+        queryset = Look.objects.defer(*DEFERRED_COLUMNS)
+    else:
+        queryset = Look.objects.only(*_columns(Look, fields))
+    prefetches = [
+        _related_prefetch('images', LookImage, fields, expand, 'look_id', ('-is_main', 'id')),
+        _related_prefetch('categories', Category, fields, expand),
+    ]
+    if included(fields, 'products'):
+        if expanded(expand, 'products'):
+            products = product_queryset(nested_paths(fields, 'products') or None, nested_paths(expand, 'products'))
+        else:
+            products = Product.objects.only('id')
+        prefetches.insert(1, Prefetch('products', queryset=products))
+    return queryset.prefetch_related(*filter(None, prefetches))
+
+
+def _summary_values(queryset, *fields, **expressions):
+    """Поля сетки берутся из снимков `main_image` и `category_ids`: один JOIN вместо подзапросов."""
+    return queryset.values(
+        'id', 'name', 'price', 'created_at', 'category_ids', *fields,
+        main_image_path=F('main_image__image'),
+        **expressions,
+    )
+
+
+def product_summary_queryset():
+    return _summary_values(Product.objects.all())
+
+
+def look_summary_queryset():
+    return _summary_values(Look.objects.all(), *LOOK_PRICING_FIELDS, savings=F('products_total') - F('price'))
+
+
+def attach_related_ids(rows, model, field_name, key=None):
+    """
+    Добавляет к строкам `.values()` списки id из M2M-поля одним запросом
+    к промежуточной таблице, без загрузки связанных объектов.
+    """
+    key = key or field_name
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_field_name()
+    target = field.m2m_reverse_field_name()
+
+    related = defaultdict(list)
+    pairs = through.objects.filter(**{f'{source}__in': [row['id'] for row in rows]})
+    for source_id, target_id in pairs.values_list(f'{source}_id', f'{target}_id').order_by('pk'):
+        related[source_id].append(target_id)
+    for row in rows:
+        row[key] = related[row['id']]
+    return rows
@@ -0,0 +1,40 @@
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+from site_api.metrics import timed_render
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson не принимает ensure_ascii и не экранирует эти символы сам,
+# а JSONRenderer экранирует их всегда, чтобы ответ оставался подмножеством JavaScript
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class CatalogJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если пакет установлен; без него и для ответов
+    с отступами (`; indent=N` в Accept) работает обычный json из stdlib.
+    Вывод совпадает с JSONRenderer побайтно, поэтому кэш и ETag не зависят
+    от того, какой кодировщик собрал ответ. Время рендеринга попадает
+    в метрики запроса (catalog_render_seconds_total).
+    """
+    encoder_default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_render():
+            indent = self.get_indent(accepted_media_type, renderer_context or {})
+            if orjson is None or indent is not None or not self.compact or self.ensure_ascii:
+                return super().render(data, accepted_media_type, renderer_context)
+            if data is None:
+                return b''
+            # Даты и время форматирует кодировщик DRF (миллисекунды, суффикс Z), а не orjson
+            ret = orjson.dumps(
+                data, default=self.encoder_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+            for raw, escaped in LINE_SEPARATORS:
+                if raw in ret:
+                    ret = ret.replace(raw, escaped)
+            return ret
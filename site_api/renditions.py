@@ -0,0 +1,127 @@
+import os
+import posixpath
+import tempfile
+from functools import lru_cache
+from io import BytesIO
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.urls import get_script_prefix, reverse
+from PIL import ExifTags, Image, ImageOps
+
+# Ширина производных изображений; оригиналы уже не растягиваются
+RENDITION_WIDTHS = {
+    'thumb': 100,
+    'card': 400,
+    'full': 1200,
+}
+
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+RENDITIONS_DIR = 'renditions'
+SRCSET_ID_PLACEHOLDER = 987654321987654321
+
+rendition_storage = FileSystemStorage()
+
+
+def rendition_name(image_name, size, fmt):
+    stem, _ = posixpath.splitext(image_name)
+    return posixpath.join(RENDITIONS_DIR, stem, f'{size}.{fmt}')
+
+
+def render(image_name, size, fmt):
+    width = RENDITION_WIDTHS[size]
+    pil_format, options = RENDITION_FORMATS[fmt]
+
+    with default_storage.open(image_name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif pil_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def oriented_width(image):
+    """Ширина кадра после exif_transpose(), не декодируя пиксели: ориентации 5-8 поворачивают на 90°."""
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        return image.height
+    return image.width
+
+
+def _write_rendition(name, content):
+    # Имя производной детерминировано: пишем во временный файл рядом и подменяем
+    # его через os.replace, чтобы читатель никогда не увидел недописанный файл
+    path = rendition_storage.path(name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(content)
+        os.chmod(temporary, rendition_storage.file_permissions_mode or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def ensure_rendition(image_name, size, fmt, force=False):
+    """Возвращает имя производного файла, создавая его при первом обращении."""
+    name = rendition_name(image_name, size, fmt)
+    if force or not rendition_storage.exists(name):
+        _write_rendition(name, render(image_name, size, fmt))
+    return name
+
+
+def rendition_url(kind, image_id, size, fmt):
+    return reverse('image-rendition', kwargs={'kind': kind, 'pk': image_id, 'size': size, 'fmt': fmt})
+
+
+@lru_cache(maxsize=32)
+def _srcset_templates(kind, script_prefix):
+    # reverse() на каждое фото в списке дорог (6 вызовов на фото), поэтому URL
+    # строятся один раз с id-заглушкой, а для фото подставляется только id
+    return {
+        (size, fmt): rendition_url(kind, SRCSET_ID_PLACEHOLDER, size, fmt).split(f'/{SRCSET_ID_PLACEHOLDER}/')
+        for size in RENDITION_WIDTHS
+        for fmt in RENDITION_FORMATS
+    }
+
+
+def srcset_widths(original_width=None):
+    """
+    Размеры для srcset с реальной шириной файла. Оригинал не растягивается,
+    поэтому первый размер не уже оригинала объявляется его шириной, а более
+    крупные пропускаются. Пока ширина неизвестна (фото ещё не обработано
+    воркером), объявляются номинальные ширины.
+    """
+    widths = {}
+    for size, width in sorted(RENDITION_WIDTHS.items(), key=lambda item: item[1]):
+        if original_width is not None and width >= original_width:
+            widths[size] = original_width
+            break
+        widths[size] = width
+    return widths
+
+
+def srcset(kind, image_id, original_width=None):
+    templates = _srcset_templates(kind, get_script_prefix())
+    separator = f'/{image_id}/'
+    widths = srcset_widths(original_width)
+    return {
+        fmt: ', '.join(f'{separator.join(templates[size, fmt])} {width}w' for size, width in widths.items())
+        for fmt in RENDITION_FORMATS
+    }
@@ -0,0 +1,64 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def reading_from_replica():
+    return _replica_reads.get()
+
+
+class ReplicaRouter:
+    """
+    Чтения внутри GET-запросов к API идут на реплику, всё остальное - на основную БД.
+
+    Запрос на запись читает с основной БД, поэтому видит собственные изменения;
+    команды, воркеры и админка реплику не используют.
+    """
+    def db_for_read(self, model, **hints):
+        return REPLICA_ALIAS if reading_from_replica() else None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaReadsMiddleware:
+    """Помечает безопасные запросы к путям DB_REPLICA_PATHS; контекст переживает sync_to_async."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def use_replica(self, request):
+        return request.method in SAFE_METHODS and request.path.startswith(settings.DB_REPLICA_PATHS)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _replica_reads.set(self.use_replica(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+
+    async def __acall__(self, request):
+        token = _replica_reads.set(self.use_replica(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
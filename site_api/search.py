@@ -0,0 +1,92 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import Count, F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Greatest
+from site_api.models import Product, Category, Look
+
+SEARCH_CONFIG = 'russian'
+
+# Границы ценовых корзин для фасетов, последняя корзина открыта сверху
+PRICE_BUCKETS = [0, 1000, 3000, 5000, 10000, 20000]
+
+TRIGRAM_THRESHOLD = 0.3
+
+
+def _joined(model, related_name, field):
+    """Подзапрос со склеенными значениями поля связанных строк: `update()` не умеет JOIN по M2M."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{related_name: OuterRef('pk')})
+            .values(related_name)
+            .annotate(joined=StringAgg(field, ' '))
+            .values('joined')
+        ),
+        Value(''),
+        output_field=TextField(),
+    )
+
+
+def product_search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('article', weight='A', config='simple')
+        + SearchVector(_joined(Category, 'products', 'name'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('material', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def look_search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_joined(Category, 'looks', 'name'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_joined(Product, 'looks', 'name'), weight='C', config=SEARCH_CONFIG)
+        + SearchVector(_joined(Product, 'looks', 'article'), weight='C', config='simple')
+    )
+
+
+def refresh_product_search(product_ids):
+    Product.objects.filter(pk__in=product_ids).update(search_vector=product_search_vector())
+
+
+def refresh_look_search(look_ids):
+    Look.objects.filter(pk__in=look_ids).update(search_vector=look_search_vector())
+
+
+def search_query(term):
+    return SearchQuery(term, search_type='websearch', config=SEARCH_CONFIG)
+
+
+def search_products(queryset, term):
+    """Полнотекстовый поиск плюс нечёткое совпадение артикула по триграммному индексу."""
+    query = search_query(term)
+    return queryset.filter(
+        Q(search_vector=query) | Q(article__trigram_similar=term) | Q(article__istartswith=term)
+    ).annotate(
+        rank=Greatest(SearchRank(F('search_vector'), query), TrigramSimilarity('article', term)),
+    )
+
+
+def search_looks(queryset, term):
+    query = search_query(term)
+    return queryset.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))
+
+
+def category_facets(products):
+    return list(
+        Category.objects.filter(products__in=products.values('pk'))
+        .annotate(count=Count('products'))
+        .order_by('-count', 'name')
+        .values('id', 'name', 'count')
+    )
+
+
+def price_facets(products):
+    bounds = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+    counts = products.order_by().aggregate(**{
+        f'bucket_{index}': Count('pk', filter=Q(price__gte=low) & (Q(price__lt=high) if high else Q()))
+        for index, (low, high) in enumerate(bounds)
+    })
+    return [
+        {'min': low, 'max': high, 'count': counts[f'bucket_{index}']}
+        for index, (low, high) in enumerate(bounds)
+    ]
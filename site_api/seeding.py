@@ -0,0 +1,163 @@
+import random
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from PIL import Image
+from site_api.cache import PRODUCTS, LOOKS, bump_version_on_commit
+from site_api.changes import record_changes
+from site_api.models import (
+    Product, ProductImage, Category, Look, LookImage, ImageJob, ChangeAction, ChangeLogEntry,
+)
+from site_api.search import refresh_product_search, refresh_look_search
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot, refresh_look_pricing
+
+GARMENTS = ['Платье', 'Рубашка', 'Брюки', 'Юбка', 'Жакет', 'Пальто', 'Свитер', 'Футболка', 'Джинсы', 'Кардиган']
+STYLES = ['базовый', 'оверсайз', 'приталенный', 'укороченный', 'классический', 'летний', 'тёплый', 'вечерний']
+COLORS = ['чёрный', 'белый', 'бежевый', 'синий', 'серый', 'оливковый', 'бордовый', 'молочный']
+MATERIALS = ['Хлопок', 'Лён', 'Шерсть', 'Шёлк', 'Вискоза', 'Полиэстер', 'Кашемир', 'Деним']
+SEASONS = ['Весна', 'Лето', 'Осень', 'Зима', 'Офис', 'Выходные', 'Вечер', 'Отпуск']
+
+# Все фото ссылаются на один файл: проверяется работа API, а не диск,
+# но производные изображения строятся из настоящей картинки
+PLACEHOLDER_SIZE = (1200, 1600)
+PLACEHOLDERS = {
+    'product': 'product_images/seed.png',
+    'look': 'look_images/seed.png',
+}
+# Хранилище кладёт файл под хэшем содержимого, а не под именем из PLACEHOLDERS,
+# поэтому проверяется имя, которое вернуло прошлое сохранение
+_saved_placeholders = {}
+
+
+def placeholder(kind):
+    name = _saved_placeholders.get(kind)
+    if name is None or not default_storage.exists(name):
+        buffer = BytesIO()
+        Image.new('RGB', PLACEHOLDER_SIZE, (200, 190, 180)).save(buffer, 'PNG')
+        name = default_storage.save(PLACEHOLDERS[kind], ContentFile(buffer.getvalue()))
+        _saved_placeholders[kind] = name
+    return name
+
+
+def _article(index):
+    # Префикс S и 5 знаков base36: до 60 млн артикулов в пределах max_length=6
+    digits = ''
+    for _ in range(5):
+        index, remainder = divmod(index, 36)
+        digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'[remainder] + digits
+    return f'S{digits}'
+
+
+@transaction.atomic
+def clear_catalog():
+    """
+    Очищает таблицы каталога так же, как manage.py flush: в PostgreSQL одним
+    TRUNCATE, без сигналов и без выборки удаляемых строк. Журнал изменений
+    очищается тоже: клиентам синхронизации после этого нужна полная выгрузка.
+    """
+    tables = [model._meta.db_table for model in (
+        LookImage, ProductImage, Look.products.through, Look.categories.through, Look,
+        Product.categories.through, Product, Category, ImageJob, ChangeLogEntry,
+    )]
+    connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables))
+    bump_version_on_commit(PRODUCTS, LOOKS)
+
+
+def seed_catalog(products, looks, images_per=3, categories=20, products_per_look=4, seed=0, batch_size=2000):
+    """
+    Заполняет каталог синтетическими данными: категории, товары с фото и
+    категориями, образы из случайных товаров. Пишет пачками bulk_create и
+    сразу обновляет снимки, поисковый индекс, цены образов и журнал
+    изменений, как импорт. При одинаковом `seed` данные те же.
+    """
+    rng = random.Random(seed)
+    report = {'categories': 0, 'products': 0, 'looks': 0, 'images': 0}
+    product_image = placeholder('product') if images_per else None
+    look_image = placeholder('look') if images_per else None
+
+    category_objects = Category.objects.bulk_create([
+        Category(name=f'{rng.choice(SEASONS)} {index + 1}') for index in range(categories)
+    ])
+    category_ids = [category.pk for category in category_objects]
+    record_changes(Category, category_ids, ChangeAction.CREATED)
+    report['categories'] = len(category_ids)
+
+    offset = Product.objects.count()
+    product_ids, prices = [], {}
+    for start in range(0, products, batch_size):
+        with transaction.atomic():
+            batch = Product.objects.bulk_create([
+                Product(
+                    name=f'{rng.choice(GARMENTS)} {rng.choice(STYLES)} {rng.choice(COLORS)}',
+                    article=_article(offset + index),
+                    price=rng.randrange(500, 50000, 10),
+                    material=rng.choice(MATERIALS),
+                )
+                for index in range(start, min(start + batch_size, products))
+            ])
+            ids = [product.pk for product in batch]
+            through = Product.categories.through
+            if category_ids:
+                through.objects.bulk_create([
+                    through(product_id=pk, category_id=category_id)
+                    for pk in ids
+                    for category_id in rng.sample(category_ids, rng.randint(1, min(3, len(category_ids))))
+                ])
+            images = ProductImage.objects.bulk_create([
+                ProductImage(product_id=pk, image=product_image, is_main=index == 0)
+                for pk in ids
+                for index in range(images_per)
+            ])
+            refresh_product_snapshot(ids)
+            refresh_product_search(ids)
+            record_changes(Product, ids, ChangeAction.CREATED)
+            record_changes(ProductImage, [image.pk for image in images], ChangeAction.CREATED)
+        product_ids.extend(ids)
+        prices.update((product.pk, product.price) for product in batch)
+        report['images'] += len(images)
+    report['products'] = len(product_ids)
+
+    for start in range(0, looks if product_ids else 0, batch_size):
+        with transaction.atomic():
+            members = [
+                rng.sample(product_ids, min(products_per_look, len(product_ids)))
+                for _ in range(start, min(start + batch_size, looks))
+            ]
+            batch = Look.objects.bulk_create([
+                Look(
+                    name=f'{rng.choice(SEASONS)}: образ {start + index + 1}',
+                    # Образ дешевле суммы своих товаров, как в витрине
+                    price=max(1, round(sum(prices[pk] for pk in look_products) * rng.uniform(0.8, 0.95))),
+                )
+                for index, look_products in enumerate(members)
+            ])
+            ids = [look.pk for look in batch]
+            Look.products.through.objects.bulk_create([
+                Look.products.through(look_id=pk, product_id=product_id)
+                for pk, look_products in zip(ids, members)
+                for product_id in look_products
+            ])
+            if category_ids:
+                Look.categories.through.objects.bulk_create([
+                    Look.categories.through(look_id=pk, category_id=category_id)
+                    for pk in ids
+                    for category_id in rng.sample(category_ids, rng.randint(1, min(2, len(category_ids))))
+                ])
+            images = LookImage.objects.bulk_create([
+                LookImage(look_id=pk, image=look_image, is_main=index == 0)
+                for pk in ids
+                for index in range(images_per)
+            ])
+            refresh_look_snapshot(ids)
+            refresh_look_pricing(ids)
+            refresh_look_search(ids)
+            record_changes(Look, ids, ChangeAction.CREATED)
+            record_changes(LookImage, [image.pk for image in images], ChangeAction.CREATED)
+        report['looks'] += len(ids)
+        report['images'] += len(images)
+
+    bump_version_on_commit(PRODUCTS, LOOKS)
+    return report
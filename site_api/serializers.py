@@ -1,25 +1,175 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from site_api.fieldsets import top_level, nested_paths, expanded
+from site_api.images import sync_images
 from site_api.models import Product, ProductImage, Category, Look, LookImage
+from site_api.renditions import srcset
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot
+
+# Поля DRF, чей to_representation возвращает значение поля модели такого типа как есть:
+# их читаем атрибутом напрямую. Свойства, аннотации и поля других типов идут обычным путём
+PLAIN_FIELDS = {
+    serializers.IntegerField: (models.IntegerField,),
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.BooleanField: (models.BooleanField,),
+}
+
+_fast_read = ContextVar('fast_read', default=True)
+
+
+@contextmanager
+def drf_read():
+    """Внутри блока FastReadMixin идёт обычным путём DRF (для сравнения в benchmark_serialization)."""
+    token = _fast_read.set(False)
+    try:
+        yield
+    finally:
+        _fast_read.reset(token)
+
+
+class FastReadMixin:
+    """
+    Чтение без обхода полей DRF на каждом объекте. План (какие поля берутся
+    атрибутом как есть, а какие через свой to_representation) строится один
+    раз на экземпляр сериализатора; с `many=True` это один раз на весь список.
+    Результат совпадает с Serializer.to_representation.
+    """
+
+    @cached_property
+    def _read_plan(self):
+        plan = []
+        for field in self._readable_fields:
+            if self._is_plain(field):
+                plan.append((field.field_name, field.source_attrs[0], None))
+            else:
+                plan.append((field.field_name, None, field))
+        return plan
+
+    def _is_plain(self, field):
+        if type(field) not in PLAIN_FIELDS or len(field.source_attrs) != 1:
+            return False
+        try:
+            model_field = self.Meta.model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            return False
+        return isinstance(model_field, PLAIN_FIELDS[type(field)]) and not model_field.choices
+
+    def to_representation(self, instance):
+        if not _fast_read.get():
+            return super().to_representation(instance)
+        data = {}
+        for name, attr, field in self._read_plan:
+            if field is None:
+                data[name] = getattr(instance, attr)
+                continue
+            attribute = field.get_attribute(instance)
+            data[name] = None if attribute is None else field.to_representation(attribute)
+        return data
+
+class SparseFieldsMixin:
+    """
+    Разреженное представление: `fields` оставляет только названные поля,
+    `expand` - раскрытые связи из `expandable`, остальные связи отдаются
+    списками id. Пути через точку передаются вложенному сериализатору
+    (`products.name`, `products.images`). Без обоих параметров представление
+    полное, как раньше. Параметры доходят до child и при `many=True`.
+    """
+    expandable = {}
 
-class CategorySerializer(serializers.ModelSerializer):
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.requested_fields = fields
+        self.requested_expand = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.requested_fields, self.requested_expand
+        if requested is None and expand is None:
+            return fields
+        if requested is not None:
+            unknown = sorted(top_level(requested) - set(fields))
+            if unknown:
+                raise serializers.ValidationError({'fields': [f"Unknown fields: {', '.join(unknown)}."]})
+            fields = {name: field for name, field in fields.items() if name in top_level(requested)}
+        if expand is not None:
+            unknown = sorted(top_level(expand) - set(self.expandable))
+            if unknown:
+                raise serializers.ValidationError({'expand': [f"Cannot expand: {', '.join(unknown)}."]})
+        for name, serializer_class in self.expandable.items():
+            if name not in fields:
+                continue
+            if not expanded(expand, name):
+                fields[name] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+                continue
+            nested_fields = nested_paths(requested, name) or None
+            nested_expand = nested_paths(expand, name)
+            if nested_fields is not None or nested_expand is not None:
+                fields[name] = serializer_class(many=True, fields=nested_fields, expand=nested_expand)
+        return fields
+
+class CategorySerializer(FastReadMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name']
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class SummarySerializer(SparseFieldsMixin, serializers.Serializer):
+    """
+    Плоское представление для сеток витрины. Строится из словарей `.values()`,
+    а не из экземпляров моделей, и собирается без обхода полей DRF.
+    """
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    price = serializers.IntegerField(read_only=True)
+    main_image = serializers.CharField(source='main_image_path', read_only=True, allow_null=True)
+    categories = serializers.ListField(source='category_ids', child=serializers.IntegerField(), read_only=True)
+
+    def to_representation(self, instance):
+        data = {name: instance[field.source] for name, field in self.fields.items() if name != 'main_image'}
+        if 'main_image' in self.fields:
+            path = instance['main_image_path']
+            data['main_image'] = default_storage.url(path) if path else None
+        return data
+
+class ProductSummarySerializer(SummarySerializer):
+    pass
+
+class ImageRenditionsMixin(serializers.Serializer):
+    srcset = serializers.SerializerMethodField()
+    rendition_kind = None
+
+    def get_srcset(self, obj):
+        return srcset(self.rendition_kind, obj.pk, obj.width)
+
+class ProductImageSerializer(ImageRenditionsMixin, FastReadMixin, SparseFieldsMixin, serializers.ModelSerializer):
     image = serializers.ImageField(use_url=True)
+    rendition_kind = 'product'
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_main', 'created_at']
+        fields = ['id', 'image', 'is_main', 'processing_status', 'created_at', 'srcset']
+        read_only_fields = ['processing_status']
 
-class ProductSerializer(serializers.ModelSerializer):
-    images = ProductImageSerializer(many=True)
-    categories = CategorySerializer(many=True)
+class NestedImageMixin(serializers.Serializer):
+    """Фото в теле товара или образа: существующее задаётся своим `id`, новое - файлом `image`."""
+    id = serializers.IntegerField(required=False)
+    image = serializers.ImageField(use_url=True, required=False)
 
-    class Meta:
-        model = Product
-        fields = ['id', 'name', 'article', 'price', 'material', 'created_at', 'images', 'categories']
+    def validate(self, attrs):
+        if ('id' in attrs) == ('image' in attrs):
+            raise serializers.ValidationError("Pass either the id of an existing image or a new image file.")
+        return attrs
+
+class NestedProductImageSerializer(NestedImageMixin, ProductImageSerializer):
+    pass
+
+class ImageSetMixin(serializers.Serializer):
+    """Проверка списка фото для sync_images: одно основное и только свои id."""
 
     def validate_images(self, value):
         main_images = [img for img in value if img.get('is_main', False)]
@@ -27,17 +177,35 @@ class ProductSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Exactly one image must be marked as main.")
         if not value:
             raise serializers.ValidationError("At least one image is required.")
+        ids = [img['id'] for img in value if 'id' in img]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Image ids must be unique.")
+        owned = set(self.instance.images.filter(pk__in=ids).values_list('pk', flat=True)) if self.instance and ids else set()
+        unknown = sorted(set(ids) - owned)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown image ids: {', '.join(map(str, unknown))}.")
         return value
 
+class ProductSerializer(FastReadMixin, SparseFieldsMixin, ImageSetMixin, serializers.ModelSerializer):
+    images = NestedProductImageSerializer(many=True)
+    categories = CategorySerializer(many=True)
+    expandable = {'images': NestedProductImageSerializer, 'categories': CategorySerializer}
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'article', 'price', 'material', 'created_at', 'images', 'categories']
+
+    @transaction.atomic
     def create(self, validated_data):
         images_data = validated_data.pop('images')
         categories_data = validated_data.pop('categories', [])
         product = Product.objects.create(**validated_data)
-        for image_data in images_data:
-            ProductImage.objects.create(product=product, **image_data)
+        sync_images(product, 'product', images_data)
         product.categories.set(categories_data)
+        refresh_product_snapshot([product.pk])
         return product
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         images_data = validated_data.pop('images', None)
         categories_data = validated_data.pop('categories', None)
@@ -48,48 +216,60 @@ class ProductSerializer(serializers.ModelSerializer):
         instance.save()
 
         if images_data:
-            instance.images.all().delete()
-            for image_data in images_data:
-                ProductImage.objects.create(product=instance, **image_data)
+            sync_images(instance, 'product', images_data)
         if categories_data is not None:
             instance.categories.set(categories_data)
+        refresh_product_snapshot([instance.pk])
         return instance
 
-class LookImageSerializer(serializers.ModelSerializer):
+class LookImageSerializer(ImageRenditionsMixin, FastReadMixin, SparseFieldsMixin, serializers.ModelSerializer):
     image = serializers.ImageField(use_url=True)
+    rendition_kind = 'look'
 
     class Meta:
         model = LookImage
-        fields = ['id', 'image', 'is_main', 'created_at']
+        fields = ['id', 'image', 'is_main', 'processing_status', 'created_at', 'srcset']
+        read_only_fields = ['processing_status']
+
+class LookPricingMixin(serializers.Serializer):
+    products_total = serializers.IntegerField(read_only=True)
+    products_count = serializers.IntegerField(read_only=True)
+    products_min_price = serializers.IntegerField(read_only=True, allow_null=True)
+    products_max_price = serializers.IntegerField(read_only=True, allow_null=True)
 
-class LookSerializer(serializers.ModelSerializer):
-    images = LookImageSerializer(many=True)
+class LookSummarySerializer(LookPricingMixin, SummarySerializer):
+    products = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+    savings = serializers.IntegerField(read_only=True)
+
+class NestedLookImageSerializer(NestedImageMixin, LookImageSerializer):
+    pass
+
+class LookSerializer(FastReadMixin, SparseFieldsMixin, ImageSetMixin, LookPricingMixin, serializers.ModelSerializer):
+    images = NestedLookImageSerializer(many=True)
     products = ProductSerializer(many=True)
     categories = CategorySerializer(many=True)
+    expandable = {'images': NestedLookImageSerializer, 'products': ProductSerializer, 'categories': CategorySerializer}
 
     class Meta:
         model = Look
-        fields = ['id', 'name', 'price', 'created_at', 'images', 'products', 'categories']
-
-    def validate_images(self, value):
-        main_images = [img for img in value if img.get('is_main', False)]
-        if len(main_images) != 1:
-            raise serializers.ValidationError("Exactly one image must be marked as main.")
-        if not value:
-            raise serializers.ValidationError("At least one image is required.")
-        return value
+        fields = [
+            'id', 'name', 'price', 'created_at', 'images', 'products', 'categories',
+            'products_total', 'products_count', 'products_min_price', 'products_max_price',
+        ]
 
+    @transaction.atomic
     def create(self, validated_data):
         images_data = validated_data.pop('images')
         products_data = validated_data.pop('products', [])
         categories_data = validated_data.pop('categories', [])
         look = Look.objects.create(**validated_data)
-        for image_data in images_data:
-            LookImage.objects.create(look=look, **image_data)
+        sync_images(look, 'look', images_data)
         look.products.set(products_data)
         look.categories.set(categories_data)
+        refresh_look_snapshot([look.pk])
         return look
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         images_data = validated_data.pop('images', None)
         products_data = validated_data.pop('products', None)
@@ -99,11 +279,10 @@ class LookSerializer(serializers.ModelSerializer):
         instance.save()
 
         if images_data:
-            instance.images.all().delete()
-            for image_data in images_data:
-                LookImage.objects.create(look=instance, **image_data)
+            sync_images(instance, 'look', images_data)
         if products_data is not None:
             instance.products.set(products_data)
         if categories_data is not None:
             instance.categories.set(categories_data)
+        refresh_look_snapshot([instance.pk])
         return instance
\ No newline at end of file
@@ -0,0 +1,248 @@
+from django.db.models.signals import pre_migrate, pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
+from site_api.cache import PRODUCTS, LOOKS, bump_version_on_commit
+from site_api.changes import record_changes
+from site_api.models import (
+    IMAGE_MODELS, Product, ProductImage, Category, Look, LookImage, ImageJob, ProcessingStatus, ChangeAction,
+)
+from site_api.search import refresh_product_search, refresh_look_search
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot, refresh_look_pricing
+
+# Какие закэшированные ответы зависят от модели: образ содержит товары целиком
+INVALIDATES = {
+    Product: (PRODUCTS, LOOKS),
+    ProductImage: (PRODUCTS, LOOKS),
+    Category: (PRODUCTS, LOOKS),
+    Look: (LOOKS,),
+    LookImage: (LOOKS,),
+}
+
+
+def touch(model, **filters):
+    """Сдвигает `updated_at` без вызова save(), чтобы ETag родителя менялся вместе с вложенными данными."""
+    model.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+def _m2m_field(model, through):
+    return next(field for field in model._meta.many_to_many if field.remote_field.through is through)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Look.products.through)
+@receiver(m2m_changed, sender=Look.categories.through)
+def remember_cleared_owners(sender, instance, action, reverse, model, **kwargs):
+    # При очистке с обратной стороны pk_set не передаётся, запоминаем владельцев до удаления строк
+    if reverse and action == 'pre_clear':
+        field = _m2m_field(model, sender)
+        owners = list(model.objects.filter(**{field.name: instance}).values_list('pk', flat=True))
+        instance._cleared_owners = {**getattr(instance, '_cleared_owners', {}), sender: owners}
+
+
+def m2m_owners(sender, instance, action, reverse, model, pk_set):
+    """
+    Модель и id объектов, чьё представление изменило m2m_changed, или None для pre_-действий.
+
+    Владелец связи (товар у категорий, образ у товаров и категорий) — это `instance`
+    при прямом изменении и `model` при изменении с обратной стороны.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return None
+    if not reverse:
+        return type(instance), [instance.pk]
+    if action == 'post_clear':
+        return model, getattr(instance, '_cleared_owners', {}).get(sender, [])
+    return model, pk_set
+
+
+# Подписка только на модели каталога: у остальных (в т.ч. промежуточных таблиц M2M)
+# без получателей сигналов массовое удаление идёт одним DELETE
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Look)
+@receiver([post_save, post_delete], sender=LookImage)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_version_on_commit(*INVALIDATES[sender])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Look.products.through)
+@receiver(m2m_changed, sender=Look.categories.through)
+def invalidate_catalog_cache_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    owners = m2m_owners(sender, instance, action, reverse, model, pk_set)
+    if owners is None:
+        return
+    bump_version_on_commit(*INVALIDATES[type(instance)])
+    touch(type(instance), pk=instance.pk)
+    if reverse and owners[1]:
+        touch(model, pk__in=owners[1])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product(sender, instance, **kwargs):
+    touch(Product, pk=instance.product_id)
+
+
+@receiver(post_save, sender=LookImage)
+@receiver(post_delete, sender=LookImage)
+def touch_look(sender, instance, **kwargs):
+    touch(Look, pk=instance.look_id)
+
+
+@receiver(pre_delete, sender=Product)
+def touch_looks_of_deleted_product(sender, instance, **kwargs):
+    # Каскадное удаление строк M2M не присылает m2m_changed
+    instance._pricing_looks = list(Look.objects.filter(products=instance).values_list('pk', flat=True))
+    touch(Look, pk__in=instance._pricing_looks)
+
+
+@receiver(post_delete, sender=Product)
+def refresh_pricing_of_deleted_product(sender, instance, **kwargs):
+    look_ids = getattr(instance, '_pricing_looks', [])
+    refresh_look_pricing(look_ids)
+    record_changes(Look, look_ids, ChangeAction.UPDATED)
+
+
+@receiver(pre_save, sender=Product)
+def remember_price_change(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list('price', flat=True).first()
+    instance._price_changed = previous is not None and previous != instance.price
+
+
+@receiver(post_save, sender=Product)
+def refresh_pricing_on_price_change(sender, instance, **kwargs):
+    if getattr(instance, '_price_changed', False):
+        instance._price_changed = False
+        look_ids = list(Look.objects.filter(products=instance).values_list('pk', flat=True))
+        refresh_look_pricing(look_ids)
+        record_changes(Look, look_ids, ChangeAction.UPDATED)
+
+
+@receiver(m2m_changed, sender=Look.products.through)
+def refresh_pricing_on_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    owners = m2m_owners(sender, instance, action, reverse, model, pk_set)
+    if owners is not None:
+        refresh_look_pricing(owners[1])
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_owners(sender, instance, **kwargs):
+    # После удаления строки M2M уже стёрты каскадом, поэтому владельцев запоминаем заранее
+    instance._snapshot_owners = (
+        list(Product.objects.filter(categories=instance).values_list('pk', flat=True)),
+        list(Look.objects.filter(categories=instance).values_list('pk', flat=True)),
+    )
+
+
+@receiver(post_delete, sender=Category)
+def refresh_snapshots_of_deleted_category(sender, instance, **kwargs):
+    product_ids, look_ids = getattr(instance, '_snapshot_owners', ([], []))
+    refresh_product_snapshot(product_ids)
+    refresh_look_snapshot(look_ids)
+    record_changes(Product, product_ids, ChangeAction.UPDATED)
+    record_changes(Look, look_ids, ChangeAction.UPDATED)
+
+
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=LookImage)
+def mark_image_pending(sender, instance, **kwargs):
+    if not instance.image:
+        return
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+        if previous == instance.image.name:
+            return
+    instance.processing_status = ProcessingStatus.PENDING
+    instance.width = None
+    instance._enqueue_processing = True
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=LookImage)
+def enqueue_image_processing(sender, instance, **kwargs):
+    # Декодирование и производные считает воркер process_image_jobs, а не запрос загрузки
+    if getattr(instance, '_enqueue_processing', False):
+        instance._enqueue_processing = False
+        kind = next(kind for kind, model in IMAGE_MODELS.items() if model is sender)
+        ImageJob.objects.create(kind=kind, image_id=instance.pk)
+
+
+@receiver(pre_migrate)
+def create_search_extensions(sender, using, **kwargs):
+    # Триграммный индекс по артикулу требует pg_trgm до создания таблиц
+    if sender.name != 'site_api':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_on_save(sender, instance, **kwargs):
+    refresh_product_search([instance.pk])
+    refresh_look_search(Look.objects.filter(products=instance).values('pk'))
+
+
+@receiver(post_save, sender=Look)
+def refresh_look_search_on_save(sender, instance, **kwargs):
+    refresh_look_search([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def refresh_search_on_category_save(sender, instance, **kwargs):
+    refresh_product_search(Product.objects.filter(categories=instance).values('pk'))
+    refresh_look_search(Look.objects.filter(categories=instance).values('pk'))
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Look.products.through)
+@receiver(m2m_changed, sender=Look.categories.through)
+def refresh_search_on_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    owners = m2m_owners(sender, instance, action, reverse, model, pk_set)
+    if owners is None:
+        return
+    owner, ids = owners
+    if owner is Product:
+        refresh_product_search(ids)
+    else:
+        refresh_look_search(ids)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Look)
+@receiver(post_save, sender=LookImage)
+def record_save(sender, instance, created, **kwargs):
+    record_changes(sender, [instance.pk], ChangeAction.CREATED if created else ChangeAction.UPDATED)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Look)
+@receiver(post_delete, sender=LookImage)
+def record_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], ChangeAction.DELETED)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=LookImage)
+def record_image_parent(sender, instance, **kwargs):
+    # Фото входят в представление родителя, поэтому клиенту достаточно следить за товарами и образами
+    kind = next(kind for kind, model in IMAGE_MODELS.items() if model is sender)
+    parent = sender._meta.get_field(kind)
+    record_changes(parent.related_model, [getattr(instance, parent.attname)], ChangeAction.UPDATED)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Look.products.through)
+@receiver(m2m_changed, sender=Look.categories.through)
+def record_m2m_changes(sender, instance, action, reverse, model, pk_set, **kwargs):
+    owners = m2m_owners(sender, instance, action, reverse, model, pk_set)
+    if owners is not None:
+        record_changes(*owners, ChangeAction.UPDATED)
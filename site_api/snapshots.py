@@ -0,0 +1,65 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import BigIntegerField, Count, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from site_api.models import Product, ProductImage, Look, LookImage
+
+
+def _main_image_id(image_model, fk_name):
+    return Subquery(image_model.objects.filter(**{fk_name: OuterRef('pk')}, is_main=True).values('pk')[:1])
+
+
+def _category_ids(model):
+    """Подзапрос с массивом id категорий в порядке добавления, как их отдаёт API."""
+    field = model._meta.get_field('categories')
+    through = field.remote_field.through
+    source = field.m2m_field_name()
+    target = f'{field.m2m_reverse_field_name()}_id'
+    return Coalesce(
+        Subquery(
+            through.objects.filter(**{source: OuterRef('pk')})
+            .values(source)
+            .annotate(ids=ArrayAgg(target, ordering='id'))
+            .values('ids')
+        ),
+        Value([], output_field=ArrayField(BigIntegerField())),
+    )
+
+
+def refresh_product_snapshot(product_ids):
+    """
+    Пересчитывает `main_image` и `category_ids` одним UPDATE.
+
+    Вызывается из тех же транзакций, что меняют фото и категории,
+    поэтому читатели не видят рассогласованного снимка.
+    """
+    Product.objects.filter(pk__in=product_ids).update(
+        main_image=_main_image_id(ProductImage, 'product'),
+        category_ids=_category_ids(Product),
+    )
+
+
+def refresh_look_snapshot(look_ids):
+    Look.objects.filter(pk__in=look_ids).update(
+        main_image=_main_image_id(LookImage, 'look'),
+        category_ids=_category_ids(Look),
+    )
+
+
+def _look_products(aggregate):
+    return Subquery(
+        Look.products.through.objects.filter(look=OuterRef('pk'))
+        .values('look')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+
+
+def refresh_look_pricing(look_ids):
+    """Пересчитывает сумму, количество и разброс цен товаров образа по промежуточной таблице."""
+    Look.objects.filter(pk__in=look_ids).update(
+        products_total=Coalesce(_look_products(Sum('product__price')), 0),
+        products_count=Coalesce(_look_products(Count('product')), 0),
+        products_min_price=_look_products(Min('product__price')),
+        products_max_price=_look_products(Max('product__price')),
+    )
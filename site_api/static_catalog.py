@@ -0,0 +1,365 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import django
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.http import FileResponse, HttpResponseNotModified
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from site_api.changes import UPSERTED, changes_since, settled_cursor
+from site_api.models import Product, Look, Category, ChangeAction
+from site_api.querysets import product_queryset, look_queryset
+from site_api.renderers import CatalogJSONRenderer
+from site_api.serializers import ProductSerializer, LookSerializer
+from site_api.views import SUMMARY_VIEW, ProductListCreateView, LookListCreateView
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+FILES_DIR = 'files'
+
+# Сжатые копии лежат рядом с телом, их отдают как есть без сжатия на лету
+COMPRESSORS = {'gzip': ('.gz', lambda content: gzip.compress(content, compresslevel=9, mtime=0))}
+if brotli is not None:
+    COMPRESSORS['br'] = ('.br', lambda content: brotli.compress(content, quality=11))
+
+# Полное представление и сетка витрины для каждого списка
+LIST_VARIANTS = ({}, {'view': SUMMARY_VIEW})
+
+
+class SnapshotResource:
+    def __init__(self, model, queryset_builder, serializer_class, detail_url_name, list_url_name, list_view):
+        self.model, self.queryset_builder, self.serializer_class = model, queryset_builder, serializer_class
+        self.detail_url_name, self.list_url_name, self.list_view = detail_url_name, list_url_name, list_view
+
+
+RESOURCES = {
+    'products': SnapshotResource(
+        Product, product_queryset, ProductSerializer, 'product-detail', 'product-list-create', ProductListCreateView,
+    ),
+    'looks': SnapshotResource(
+        Look, look_queryset, LookSerializer, 'look-detail', 'look-list-create', LookListCreateView,
+    ),
+}
+
+
+def canonical_url(path, params):
+    """Ключ манифеста: путь и параметры запроса в отсортированном порядке."""
+    query = urlencode(sorted(params))
+    return f'{path}?{query}' if query else path
+
+
+def _write(out_dir, name, build):
+    path = os.path.join(out_dir, name)
+    if os.path.exists(path):
+        # Имя - хэш содержимого: такой файл уже записан
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory)
+    with os.fdopen(descriptor, 'wb') as output:
+        output.write(build())
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def _store(out_dir, content):
+    digest = hashlib.sha256(content).hexdigest()
+    name = f'{FILES_DIR}/{digest[:2]}/{digest}.json'
+    _write(out_dir, name, lambda: content)
+    encodings = {}
+    for encoding, (suffix, compress) in COMPRESSORS.items():
+        _write(out_dir, name + suffix, lambda: compress(content))
+        encodings[encoding] = name + suffix
+    return {'file': name, 'size': len(content), 'etag': f'"{digest}"', 'encodings': encodings}
+
+
+def render_details(resource, ids, out_dir):
+    """Карточки пачкой, как fetch_batch кладёт их в кэш: одна выборка с prefetch на пачку."""
+    spec = RESOURCES[resource]
+    renderer = CatalogJSONRenderer()
+    objects = list(spec.queryset_builder().filter(pk__in=ids).order_by('pk'))
+    return {
+        reverse(spec.detail_url_name, kwargs={'pk': obj.pk}): _store(out_dir, renderer.render(data))
+        for obj, data in zip(objects, spec.serializer_class(objects, many=True).data)
+    }
+
+
+def render_list(resource, params, base_url, out_dir):
+    """
+    Проходит все страницы списка через сам view API, поэтому байты и ссылки
+    next/previous те же, что отдал бы живой API по адресу `base_url`.
+    Возвращает записи манифеста для страниц и id объектов списка.
+    """
+    spec = RESOURCES[resource]
+    view = spec.list_view.as_view()
+    base = urlsplit(base_url)
+    factory = RequestFactory(HTTP_HOST=base.netloc, HTTP_ACCEPT='application/json')
+    path = reverse(spec.list_url_name)
+    pages, ids, query = {}, [], sorted(params.items())
+    with override_settings(ALLOWED_HOSTS=[base.hostname]):
+        while True:
+            response = view(factory.get(path, dict(query), secure=base.scheme == 'https'))
+            url = canonical_url(path, query)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: HTTP {response.status_code}')
+            data = json.loads(response.content)
+            pages[url] = _store(out_dir, response.content)
+            ids.extend(item['id'] for item in data['results'])
+            if not data['next']:
+                return pages, ids
+            query = sorted(parse_qsl(urlsplit(data['next']).query))
+
+
+def _run(tasks, workers):
+    """Выполняет задачи `(функция, аргументы)` в пуле процессов; результаты в порядке задач."""
+    if workers <= 1:
+        return [func(*args) for func, args in tasks]
+    # Дочерние процессы открывают свои соединения с БД: общий сокет сломал бы протокол
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        futures = [executor.submit(func, *args) for func, args in tasks]
+        return [future.result() for future in futures]
+
+
+def _list_scopes(resource, categories):
+    path = reverse(RESOURCES[resource].list_url_name)
+    for category in [None, *sorted(categories)]:
+        for variant in LIST_VARIANTS:
+            params = {**variant, **({} if category is None else {'category': str(category)})}
+            yield canonical_url(path, params.items()), {'resource': resource, 'category': category, 'params': params}
+
+
+def _collect_changes(cursor, batch=1000):
+    upserted, deleted = {}, {}
+    while True:
+        page = changes_since(cursor, batch)
+        for resource, changes in page['changes'].items():
+            upserted.setdefault(resource, set()).update(changes[UPSERTED])
+            deleted.setdefault(resource, set()).update(changes[ChangeAction.DELETED.value])
+        cursor = page['cursor']
+        if not page['has_more']:
+            return cursor, upserted, deleted
+
+
+def _changed_ids(upserted, deleted):
+    """
+    Товары и образы, чьё представление могло измениться: образ содержит
+    товары целиком, а товары и образы - названия своих категорий.
+    """
+    categories = upserted.get('categories', set()) | deleted.get('categories', set())
+    products = upserted.get('products', set()) | deleted.get('products', set())
+    products |= set(Product.objects.filter(categories__in=categories).values_list('pk', flat=True))
+    looks = upserted.get('looks', set()) | deleted.get('looks', set())
+    looks |= set(
+        Look.objects.filter(Q(products__in=products) | Q(categories__in=categories)).values_list('pk', flat=True)
+    )
+    return {'products': products, 'looks': looks}, categories
+
+
+def _stale_scopes(lists, changed, categories, existing_categories):
+    """Списки, где затронутые объекты были раньше или могут оказаться теперь."""
+    stale = {}
+    for resource, ids in changed.items():
+        if not ids:
+            continue
+        model = RESOURCES[resource].model
+        through = model.categories.through.objects.filter(**{f'{model._meta.model_name}_id__in': ids})
+        related = categories | set(through.values_list('category_id', flat=True))
+        for url, scope in _list_scopes(resource, existing_categories):
+            listed = lists.get(url)
+            if listed is None or scope['category'] is None or scope['category'] in related \
+                    or not ids.isdisjoint(listed['ids']):
+                stale[url] = scope
+    return stale
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'rb') as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return None
+
+
+def _save_manifest(out_dir, manifest):
+    descriptor, temporary = tempfile.mkstemp(dir=out_dir)
+    with os.fdopen(descriptor, 'w') as output:
+        json.dump(manifest, output, ensure_ascii=False, separators=(',', ':'))
+    os.chmod(temporary, 0o644)
+    # Читатели видят либо старый манифест, либо новый целиком
+    os.replace(temporary, os.path.join(out_dir, MANIFEST_NAME))
+
+
+def _collect_garbage(out_dir, entries):
+    referenced = set()
+    for entry in entries.values():
+        referenced.add(entry['file'])
+        referenced.update(entry['encodings'].values())
+    removed = 0
+    for directory, _, names in os.walk(os.path.join(out_dir, FILES_DIR)):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.relpath(path, out_dir).replace(os.sep, '/') not in referenced:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def build_snapshot(out_dir, base_url, workers=1, chunk_size=500, incremental=False):
+    """
+    Рендерит каталог в `out_dir`: карточки товаров и образов и все страницы
+    списков (общих и по категориям, в полном представлении и сеткой).
+    Каждое тело - файл под хэшем содержимого с копиями gzip и brotli, а
+    манифест сопоставляет URL запроса (`canonical_url`) с этими файлами.
+
+    С `incremental` перестраиваются только объекты и списки, затронутые
+    журналом изменений после курсора манифеста; без манифеста или при другом
+    `base_url` строится полный снимок. Файлы, на которые новый манифест
+    не ссылается, удаляются.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir) if incremental else None
+    if manifest is not None and manifest['base_url'] != base_url:
+        manifest = None
+    existing_categories = set(Category.objects.values_list('pk', flat=True))
+
+    if manifest is None:
+        cursor = settled_cursor()
+        manifest = {'entries': {}, 'lists': {}}
+        present = {resource: sorted(spec.model.objects.values_list('pk', flat=True)) for resource, spec in RESOURCES.items()}
+        removed = {resource: set() for resource in RESOURCES}
+        stale = {url: scope for resource in RESOURCES for url, scope in _list_scopes(resource, existing_categories)}
+    else:
+        cursor, upserted, deleted = _collect_changes(manifest['cursor'])
+        changed, categories = _changed_ids(upserted, deleted)
+        present = {
+            resource: sorted(RESOURCES[resource].model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            for resource, ids in changed.items()
+        }
+        removed = {resource: ids - set(present[resource]) for resource, ids in changed.items()}
+        stale = _stale_scopes(manifest['lists'], changed, categories, existing_categories)
+    entries, lists = manifest['entries'], manifest['lists']
+
+    tasks = [
+        (render_details, (resource, ids[start:start + chunk_size], out_dir))
+        for resource, ids in present.items()
+        for start in range(0, len(ids), chunk_size)
+    ]
+    details = len(tasks)
+    tasks += [(render_list, (scope['resource'], scope['params'], base_url, out_dir)) for scope in stale.values()]
+    results = _run(tasks, workers)
+
+    for resource, ids in removed.items():
+        for pk in ids:
+            entries.pop(reverse(RESOURCES[resource].detail_url_name, kwargs={'pk': pk}), None)
+    for result in results[:details]:
+        entries.update(result)
+    # Старые страницы снимаем до записи новых: первая страница списка сохраняет свой URL
+    for url in list(lists):
+        category = lists[url]['category']
+        if url in stale or (category is not None and category not in existing_categories):
+            for page in lists.pop(url)['pages']:
+                entries.pop(page, None)
+    for (url, scope), (pages, ids) in zip(stale.items(), results[details:]):
+        entries.update(pages)
+        lists[url] = {**scope, 'pages': list(pages), 'ids': ids}
+
+    manifest.update(version=1, generated_at=timezone.now().isoformat(), cursor=cursor, base_url=base_url)
+    _save_manifest(out_dir, manifest)
+    return {
+        'details': sum(len(result) for result in results[:details]),
+        'pages': sum(len(pages) for pages, _ in results[details:]),
+        'entries': len(entries),
+        'removed_files': _collect_garbage(out_dir, entries),
+    }
+
+
+def _accepted_encodings(request):
+    return {part.split(';')[0].strip() for part in request.headers.get('Accept-Encoding', '').split(',')}
+
+
+class CatalogSnapshotMiddleware:
+    """
+    Отдаёт GET каталога из снимка build_catalog_snapshot, если задан
+    CATALOG_SNAPSHOT_DIR и URL есть в манифесте: без view, БД и кэша, сразу
+    сжатой копией по Accept-Encoding. Остальные запросы и URL, которых нет
+    в снимке, идут в Django как обычно. Манифест перечитывается, когда
+    меняется файл, поэтому инкрементальная пересборка подхватывается на лету.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.loaded = (None, None, {})
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def entries(self, directory):
+        path = os.path.join(directory, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self.loaded[:2] != (directory, mtime):
+            manifest = load_manifest(directory) or {}
+            self.loaded = (directory, mtime, manifest.get('entries', {}))
+        return self.loaded[2]
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.from_snapshot(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Манифест и файл снимка - один stat и один open на локальном диске: в пул потоков не уводим
+        response = self.from_snapshot(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    def from_snapshot(self, request):
+        directory = settings.CATALOG_SNAPSHOT_DIR
+        if directory and request.method in ('GET', 'HEAD'):
+            entry = self.entries(directory).get(canonical_url(request.path, request.GET.items()))
+            if entry is not None:
+                return self.serve(request, directory, entry)
+        return None
+
+    @staticmethod
+    def serve(request, directory, entry):
+        if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            accepted = _accepted_encodings(request)
+            encoding = next((name for name in ('br', 'gzip') if name in accepted and name in entry['encodings']), None)
+            try:
+                body = open(os.path.join(directory, entry['encodings'][encoding] if encoding else entry['file']), 'rb')
+            except FileNotFoundError:
+                # Файл уже убран новой сборкой, а манифест ещё старый
+                return None
+            response = FileResponse(body, content_type='application/json')
+            del response['Content-Disposition']
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = entry['etag']
+        response['Vary'] = 'Accept-Encoding'
+        return response
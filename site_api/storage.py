@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import tempfile
+from functools import partial
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Имя оригинала: <каталог upload_to>/<2 знака хэша>/<sha256><расширение>
+HASHED_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{64}(?:\.[0-9a-z]+)?$')
+# Расширение загрузки сохраняется, только если похоже на настоящее: длинное
+# или с посторонними символами не даёт имени уложиться в max_length поля
+EXTENSION = re.compile(r'\.[0-9a-z]{1,8}')
+INCOMING_DIR = '.incoming'
+
+
+def is_content_addressed(name):
+    return HASHED_NAME.search(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище фото под именем из SHA-256 содержимого.
+
+    Одинаковые загрузки (например, одно фото, выбранное дважды в MultiFileInput
+    админки) ложатся в один файл, а содержимое под именем никогда не меняется,
+    поэтому файл можно кэшировать навсегда. Файл читается и пишется кусками;
+    загрузку, которую Django уже записал во временный файл, переносим без копии.
+
+    Одним файлом могут пользоваться несколько строк, поэтому удалять его можно,
+    только когда ссылок не осталось (site_api.images.delete_unreferenced_files).
+    Строка с повторной загрузкой видна удалению только после коммита, поэтому
+    файл, который уже был на диске, после коммита проверяется ещё раз и при
+    необходимости записывается заново.
+    """
+    chunk_size = 64 * 1024
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, extension = posixpath.dirname(name), posixpath.splitext(name)[1].lower()
+        if not EXTENSION.fullmatch(extension):
+            extension = ''
+        # Длина имени известна до хэширования: проверяем её, пока на диск ничего не записано
+        length = len(posixpath.join(directory, 'xx', '0' * 64 + extension))
+        if max_length is not None and length > max_length:
+            raise SuspiciousFileOperation(
+                f'Storage can not find an available filename for "{name}": '
+                f'the hashed name exceeds max_length={max_length}.'
+            )
+        if hasattr(content, 'temporary_file_path'):
+            digest, source, spooled = self._digest(content), content.temporary_file_path(), False
+        else:
+            (digest, source), spooled = self._spool(content), True
+        hashed = posixpath.join(directory, digest[:2], f'{digest}{extension}')
+        validate_file_name(hashed, allow_relative_path=True)
+        try:
+            if self.exists(hashed):
+                transaction.on_commit(partial(self._restore, hashed, content))
+            else:
+                self._place(source, hashed)
+                spooled = False
+        finally:
+            if spooled:
+                os.remove(source)
+        return hashed
+
+    def _place(self, source, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Гонка двух одинаковых загрузок безопасна: содержимое у них одно
+        file_move_safe(source, path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+
+    def _restore(self, hashed, content):
+        # Файл могли удалить как ничейный, пока строка с этой загрузкой не была закоммичена
+        if self.exists(hashed):
+            return
+        try:
+            source = self._spool(content)[1]
+        except (OSError, ValueError):
+            logger.exception('Не удалось восстановить файл %s', hashed)
+            return
+        self._place(source, hashed)
+
+    def delete_unreferenced(self, names, referenced):
+        """
+        Удаляет файлы `names`, на которые нет ссылок, и возвращает их имена.
+        `referenced(names)` - множество имён, на которые ссылаются строки.
+
+        Файл сначала переносится в INCOMING_DIR, затем ссылки проверяются ещё раз:
+        загрузка того же содержимого, закоммиченная между проверками, получает файл
+        обратно, а закоммиченная позже не найдёт его и запишет заново (_restore).
+        """
+        candidates = set(names) - referenced(names)
+        moved = {}
+        for name in candidates:
+            descriptor, aside = tempfile.mkstemp(dir=self._incoming())
+            os.close(descriptor)
+            try:
+                os.replace(self.path(name), aside)
+            except FileNotFoundError:
+                os.remove(aside)
+                continue
+            moved[name] = aside
+        deleted = []
+        still_referenced = referenced(list(moved))
+        for name, aside in moved.items():
+            if name in still_referenced:
+                os.replace(aside, self.path(name))
+            else:
+                os.remove(aside)
+                deleted.append(name)
+        return deleted
+
+    def _incoming(self):
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        return incoming
+
+    def _digest(self, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(self.chunk_size):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def _spool(self, content):
+        # Временный файл на той же файловой системе: перенос на место - атомарный rename
+        descriptor, path = tempfile.mkstemp(dir=self._incoming())
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(descriptor, 'wb') as spool:
+                for chunk in content.chunks(self.chunk_size):
+                    digest.update(chunk)
+                    spool.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return digest.hexdigest(), path
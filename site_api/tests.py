@@ -1,3 +1,1444 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Value
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from site_api.async_views import (
+    AsyncProductListView, AsyncProductDetailView, AsyncProductLooksView, AsyncLookListView, AsyncLookDetailView,
+)
+from site_api.benchmarks import compare_results
+from site_api.catalog_io import stream_serialized
+from site_api.cache import LOOKS, PRODUCTS, bump_version, catalog_cache, get_version, path_cache_key
+from site_api.filters import ORDERINGS, filter_products, get_ordering
+from site_api.images import delete_unreferenced_files
+from site_api.jobs import claim_jobs, finish_job, image_names, process_image, requeue_stale_jobs
+from site_api.models import (
+    Product, ProductImage, Category, Look, LookImage, ImageJob, ProcessingStatus, ChangeLogEntry, ChangeAction,
+)
+from site_api.pagination import KeysetPagination
+from site_api.querysets import look_queryset, product_queryset
+from site_api.renditions import ensure_rendition, rendition_name, srcset_widths
+from site_api.renderers import CatalogJSONRenderer
+from site_api.routers import REPLICA_ALIAS, ReplicaRouter, ReplicaReadsMiddleware
+from site_api.search import search_products
+from site_api.seeding import clear_catalog, placeholder, seed_catalog
+from site_api.serializers import LookSerializer, ProductImageSerializer, ProductSerializer, drf_read
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot
+from site_api.static_catalog import build_snapshot, load_manifest
+from site_api.storage import is_content_addressed
+
+
+def create_catalog(products_count, images_per_product=2, products_per_look=3):
+    categories = [Category.objects.create(name=f'Категория {i}') for i in range(2)]
+    products = []
+    offset = Product.objects.count()
+    for i in range(offset, offset + products_count):
+        product = Product.objects.create(name=f'Товар {i}', article=f'T{i:05d}', price=1000 + i, material='Хлопок')
+        product.categories.set(categories)
+        for j in range(images_per_product):
+            ProductImage.objects.create(product=product, image=f'product_images/{i}_{j}.png', is_main=j == 0)
+        products.append(product)
+    for i in range(0, products_count, products_per_look):
+        look = Look.objects.create(name=f'Образ {i}', price=5000)
+        look.products.set(products[i:i + products_per_look])
+        look.categories.set(categories)
+        LookImage.objects.create(look=look, image=f'look_images/{i}.png', is_main=True)
+    refresh_product_snapshot([product.pk for product in products])
+    refresh_look_snapshot(Look.objects.values('pk'))
+    return products
+
+
+def analyzed_catalog(products):
+    """Каталог со свежей статистикой: планировщик PostgreSQL выбирает индексы по ней, а не по пустой таблице."""
+    seed_catalog(products, 0, images_per=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class QueryCountTests(TestCase):
+    """Число запросов на чтение не должно зависеть от количества строк."""
+
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, expected):
+        create_catalog(3)
+        small = self.count_queries(url)
+        # Версия кэша сдвигается после коммита, в TestCase - при выходе из блока
+        with self.captureOnCommitCallbacks(execute=True):
+            create_catalog(12)
+        large = self.count_queries(url)
+        self.assertEqual(small, large, f'{url}: число запросов растёт вместе с каталогом')
+        self.assertEqual(large, expected)
+
+    def test_product_list(self):
+        # товары, фото, категории + 2 агрегата для ETag
+        self.assertConstantQueries('/api/products/', 5)
+
+    def test_look_list(self):
+        # образы, фото образов, товары, фото товаров, категории товаров, категории образов + 3 агрегата для ETag
+        self.assertConstantQueries('/api/looks/', 9)
+
+    def test_product_summary_list(self):
+        # фото и категории берутся из снимков в строке товара
+        self.assertConstantQueries('/api/products/?view=summary', 3)
+
+    def test_look_summary_list(self):
+        self.assertConstantQueries('/api/looks/?view=summary', 5)
+
+    def test_product_detail(self):
+        product = create_catalog(1, images_per_product=5)[0]
+        with self.assertNumQueries(5):
+            self.client.get(f'/api/products/{product.pk}/', HTTP_ACCEPT='application/json')
+
+    def test_look_detail(self):
+        create_catalog(6, products_per_look=6)
+        look = Look.objects.get()
+        with self.assertNumQueries(9):
+            self.client.get(f'/api/looks/{look.pk}/', HTTP_ACCEPT='application/json')
+
+    def test_main_image_first(self):
+        product = create_catalog(1, images_per_product=3)[0]
+        last_image = product.images.order_by('-id').first()
+        ProductImage.objects.filter(product=product).update(is_main=False)
+        ProductImage.objects.filter(pk=last_image.pk).update(is_main=True)
+        response = self.client.get(f'/api/products/{product.pk}/', HTTP_ACCEPT='application/json')
+        self.assertTrue(response.json()['images'][0]['is_main'])
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсоры next/previous обходят список без пропусков и повторов в обе стороны."""
+
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        create_catalog(7)
+        self.expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def walk(self, url, direction):
+        pages = []
+        while url:
+            page = self.get(url)
+            pages.append([item['id'] for item in page['results']])
+            url = page[direction]
+        return pages
+
+    def test_forward_and_back(self):
+        for view in ('', '&view=summary'):
+            pages = self.walk(f'/api/products/?page_size=3{view}', 'next')
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            self.assertEqual(sum(pages, []), self.expected)
+
+            last = self.get(f'/api/products/?page_size=3{view}')
+            while last['next']:
+                last = self.get(last['next'])
+            back = self.walk(last['previous'], 'previous')
+            self.assertEqual(sum(reversed(back), []), self.expected[:6])
+
+    def test_first_page_links(self):
+        page = self.get('/api/products/?page_size=10')
+        self.assertIsNone(page['next'])
+        self.assertIsNone(page['previous'])
+        self.assertEqual(self.get('/api/products/?page_size=1000')['results'][-1]['id'], self.expected[-1])
+
+    def test_new_rows_do_not_shift_pages(self):
+        first = self.get('/api/products/?page_size=3')
+        create_catalog(2)
+        catalog_cache().clear()
+        second = self.get(first['next'])
+        self.assertEqual([item['id'] for item in second['results']], self.expected[3:6])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Планы запросов проверяются только на PostgreSQL')
+    def test_cursor_starts_index_range(self):
+        analyzed_catalog(5000)
+        for ordering, index, condition in (
+            ('-created_at', 'products_created_at_id_idx', r'ROW\(created_at, id\) <'),
+            ('price', 'products_price_id_idx', r'ROW\(price, id\) >'),
+        ):
+            page = self.get(f'/api/products/?ordering={ordering}&page_size=50')
+            paginator = KeysetPagination()
+            paginator.ordering = ORDERINGS[ordering]
+            request = Request(APIRequestFactory().get(page['next']))
+            plan = paginator.get_page_queryset(Product.objects.all(), request).explain()
+            # Курсор - начало диапазона в индексе, а не фильтр по строкам с начала индекса
+            self.assertIn(index, plan)
+            self.assertRegex(plan, rf'Index Cond: \({condition}')
+
+    def test_summary_view(self):
+        product = Product.objects.get(pk=self.expected[0])
+        item = self.get('/api/products/?page_size=1&view=summary')['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'price', 'main_image', 'categories'})
+        self.assertEqual(item['price'], product.price)
+        self.assertEqual(sorted(item['categories']), sorted(product.categories.values_list('pk', flat=True)))
+        self.assertTrue(item['main_image'].endswith(product.images.get(is_main=True).image.name))
+        look = self.get('/api/looks/?page_size=1&view=summary')['results'][0]
+        self.assertIn('products', look)
+        self.assertNotIn('images', look)
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_catalog(1, images_per_product=0)[0]
+        # Задачи для фото образа без файла здесь не нужны
+        ImageJob.objects.all().delete()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+        self.media_root = media_root.name
+
+    def create_image(self, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), (200, 100, 50)).save(buffer, 'PNG')
+        name = default_storage.save('product_images/original.png', io.BytesIO(buffer.getvalue()))
+        return ProductImage.objects.create(product=self.product, image=name, is_main=True)
+
+    def test_rendition_view(self):
+        image = self.create_image(600, 300)
+        response = self.client.get(f'/api/renditions/product/{image.pk}/card.webp')
+        self.assertEqual(response.status_code, 302)
+        path = os.path.join(self.media_root, rendition_name(image.image.name, 'card', 'webp'))
+        with Image.open(path) as rendition:
+            self.assertEqual((rendition.format, rendition.size), ('WEBP', (400, 200)))
+        # Временные файлы атомарной записи не остаются рядом с производной
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['card.webp'])
+        with Image.open(os.path.join(self.media_root, ensure_rendition(image.image.name, 'full', 'jpeg'))) as rendition:
+            self.assertEqual(rendition.size, (600, 300))
+        for url in (f'/api/renditions/product/{image.pk}/huge.webp', '/api/renditions/look/999999/card.webp'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_srcset_uses_real_width(self):
+        image = self.create_image(300, 200)
+        # Пока воркер не записал ширину, объявляются номинальные размеры
+        srcset_value = self.client.get(
+            f'/api/products/{self.product.pk}/', HTTP_ACCEPT='application/json'
+        ).json()['images'][0]['srcset']
+        self.assertEqual(len(srcset_value['webp'].split(', ')), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs = claim_jobs(10)
+            names = image_names(jobs)
+            for job in jobs:
+                finish_job(job, width=process_image(names[job.kind, job.image_id]))
+        image.refresh_from_db()
+        self.assertEqual(image.width, 300)
+        srcset_value = self.client.get(
+            f'/api/products/{self.product.pk}/', HTTP_ACCEPT='application/json'
+        ).json()['images'][0]['srcset']
+        self.assertEqual(srcset_value['jpeg'], (
+            f'/api/renditions/product/{image.pk}/thumb.jpeg 100w, '
+            f'/api/renditions/product/{image.pk}/card.jpeg 300w'
+        ))
+        self.assertEqual(srcset_widths(1200), {'thumb': 100, 'card': 400, 'full': 1200})
+        self.assertEqual(srcset_widths(60), {'thumb': 60})
+
+
+def crash_on_odd_width(name):
+    # Имитирует падение дочернего процесса (OOM, сбой декодера) без исключения в Python
+    with default_storage.open(name, 'rb') as source:
+        if Image.open(source).width % 2:
+            os._exit(1)
+    return process_image(name)
+
+
+class ImageJobTests(TestCase):
+    """Очередь обработки фото: захват, завершение, повторы и возврат брошенных задач."""
+
+    def setUp(self):
+        self.product = create_catalog(1, images_per_product=0)[0]
+        ImageJob.objects.all().delete()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+
+    def create_image(self, width, is_main=False):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, 10), (width % 256, 0, 0)).save(buffer, 'PNG')
+        name = default_storage.save('product_images/job.png', io.BytesIO(buffer.getvalue()))
+        image = ProductImage.objects.create(product=self.product, image=name, is_main=is_main)
+        return image, ImageJob.objects.get(kind='product', image_id=image.pk)
+
+    def status(self, obj):
+        obj.refresh_from_db()
+        return obj.processing_status if isinstance(obj, ProductImage) else obj.status
+
+    def test_claim_and_finish(self):
+        (first, first_job), (second, second_job) = self.create_image(40, True), self.create_image(60)
+        jobs = claim_jobs(1)
+        self.assertEqual([job.pk for job in jobs], [first_job.pk])
+        self.assertEqual(jobs[0].attempts, 1)
+        self.assertEqual(self.status(first), ProcessingStatus.PROCESSING)
+        self.assertEqual([job.pk for job in claim_jobs(10)], [second_job.pk])
+        self.assertEqual(claim_jobs(10), [])
+
+        finish_job(jobs[0], width=40)
+        self.assertEqual(self.status(first_job), ProcessingStatus.READY)
+        self.assertEqual(self.status(first), ProcessingStatus.READY)
+        self.assertEqual(first.width, 40)
+
+    def test_retry_until_max_attempts(self):
+        image, job = self.create_image(40)
+        for attempt in range(1, 4):
+            job = claim_jobs(1)[0]
+            self.assertEqual(job.attempts, attempt)
+            finish_job(job, error='OSError: broken', max_attempts=3)
+        self.assertEqual(self.status(job), ProcessingStatus.FAILED)
+        self.assertEqual(self.status(image), ProcessingStatus.FAILED)
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_requeue_stale(self):
+        (_, fresh), (_, stale), (image, exhausted) = self.create_image(20), self.create_image(40), self.create_image(60)
+        claim_jobs(10)
+        ImageJob.objects.filter(pk=exhausted.pk).update(attempts=3)
+        ImageJob.objects.filter(pk__in=[stale.pk, exhausted.pk]).update(
+            updated_at=timezone.now() - timezone.timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale_jobs(600, max_attempts=3), (1, 1))
+        self.assertEqual(self.status(fresh), ProcessingStatus.PROCESSING)
+        self.assertEqual(self.status(stale), ProcessingStatus.PENDING)
+        self.assertEqual(self.status(exhausted), ProcessingStatus.FAILED)
+        self.assertEqual(self.status(image), ProcessingStatus.FAILED)
+
+    def test_pixel_limit(self):
+        image, _ = self.create_image(40)
+        # 400 пикселей: больше предела, но меньше двух пределов, где Pillow только предупреждает
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 300):
+            with self.assertRaises(Image.DecompressionBombWarning):
+                process_image(image.image.name)
+
+    def test_worker_survives_crashed_process(self):
+        (good, good_job), (bomb, bomb_job) = self.create_image(40, True), self.create_image(41)
+        output = io.StringIO()
+        with mock.patch('site_api.management.commands.process_image_jobs.process_image', crash_on_odd_width):
+            call_command('process_image_jobs', once=True, workers=1, batch=1, stdout=output, stderr=output)
+        self.assertEqual(self.status(good_job), ProcessingStatus.READY)
+        self.assertEqual(self.status(good), ProcessingStatus.READY)
+        self.assertEqual(good.width, 40)
+        self.assertEqual(self.status(bomb_job), ProcessingStatus.FAILED)
+        self.assertEqual(bomb_job.attempts, 3)
+        self.assertIn('BrokenProcessPool', bomb_job.error)
+        self.assertEqual(self.status(bomb), ProcessingStatus.FAILED)
+
+
+class ProductImportTests(TestCase):
+    """Импорт NDJSON/CSV: upsert по артикулу, отчёт об ошибках по строкам и побочные записи без сигналов."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_catalog(1)[0]
+        self.look = Look.objects.get()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+        self.media(*ProductImage.objects.values_list('image', flat=True))
+
+    def media(self, *names):
+        for name in names:
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(name.encode())
+
+    def ndjson(self, *rows):
+        return ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+    def post(self, content, content_type='application/x-ndjson'):
+        response = self.client.post('/api/products/bulk/', content, content_type=content_type)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_create_and_update(self):
+        self.media('product_images/n1.png', 'product_images/n2.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            report = self.post(self.ndjson(
+                {'article': self.product.article, 'name': 'Обновлён', 'price': 7, 'material': 'Лён'},
+                {'article': 'N00001', 'name': 'Новый', 'price': 10, 'material': 'Шерсть',
+                 'categories': ['Категория 0', 'Свитеры'], 'images': ['product_images/n1.png', 'product_images/n2.png']},
+            ))
+        self.assertEqual((report['created'], report['updated'], report['errors']), (1, 1, []))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price), ('Обновлён', 7))
+        # Без ключа categories категории товара не трогаются
+        self.assertEqual(self.product.categories.count(), 2)
+
+        created = Product.objects.get(article='N00001')
+        sweaters = Category.objects.get(name='Свитеры')
+        self.assertEqual(sorted(created.category_ids), sorted([Category.objects.get(name='Категория 0').pk, sweaters.pk]))
+        self.assertEqual(created.main_image.image.name, 'product_images/n1.png')
+        self.assertEqual(ImageJob.objects.filter(kind='product', image_id__in=created.images.values('pk')).count(), 2)
+
+        self.look.refresh_from_db()
+        self.assertEqual(self.look.products_min_price, 7)
+        logged = set(ChangeLogEntry.objects.values_list('resource', 'object_id', 'action'))
+        self.assertLessEqual({
+            ('products', created.pk, ChangeAction.CREATED), ('products', self.product.pk, ChangeAction.UPDATED),
+            ('looks', self.look.pk, ChangeAction.UPDATED), ('categories', sweaters.pk, ChangeAction.CREATED),
+        }, logged)
+
+        # Тот же список фото второй раз не пересоздаётся
+        report = self.post(self.ndjson({'article': 'N00001', 'name': 'Новый', 'price': 10, 'material': 'Шерсть',
+                                        'images': ['product_images/n1.png', 'product_images/n2.png']}))
+        self.assertEqual((report['created'], report['updated'], report['unchanged_images']), (0, 1, 1))
+
+    def test_row_errors(self):
+        content = b'{"article": "E00001", "name": "A", "price": 0, "material": "M"}\n' \
+                  b'not json\n' \
+                  b'[1, 2]\n' \
+                  b'\n' \
+                  b'{"article": "E00002", "name": "B", "price": 1, "material": "M"}\n' \
+                  b'{"article": "E00002", "name": "C", "price": 2, "material": "M"}\n'
+        report = self.post(content)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['line'] for error in report['errors']], [1, 2, 3, 5])
+        self.assertIn('price', report['errors'][0]['errors'])
+        self.assertIn('superseded by line 6', report['errors'][3]['errors'][0])
+        self.assertEqual(Product.objects.get(article='E00002').name, 'C')
+
+    def test_ambiguous_category(self):
+        Category.objects.create(name='Дубль')
+        Category.objects.create(name='Дубль')
+        report = self.post(self.ndjson(
+            {'article': 'D00001', 'name': 'A', 'price': 1, 'material': 'M', 'categories': ['Дубль']},
+            {'article': 'D00002', 'name': 'B', 'price': 1, 'material': 'M', 'categories': ['Категория 1']},
+        ))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'][0]['article'], 'D00001')
+        self.assertIn('categories', report['errors'][0]['errors'])
+        self.assertFalse(Product.objects.filter(article='D00001').exists())
+
+    def test_images_synced_by_path(self):
+        self.media('product_images/n1.png', 'product_images/n2.png', '.incoming/tmp123')
+        first, second = self.product.images.order_by('-is_main', 'pk')
+        row = {'article': self.product.article, 'name': 'A', 'price': 1, 'material': 'M'}
+        with self.captureOnCommitCallbacks(execute=True):
+            report = self.post(self.ndjson({**row, 'images': [second.image.name, 'product_images/n1.png']}))
+        self.assertEqual(report['errors'], [])
+        # Оставшееся фото сохраняет id и становится основным, убранное удаляется вместе с файлом
+        images = list(self.product.images.order_by('-is_main', 'pk').values_list('pk', 'image', 'is_main'))
+        self.assertEqual(images[0], (second.pk, second.image.name, True))
+        self.assertEqual(images[1][1:], ('product_images/n1.png', False))
+        self.assertFalse(default_storage.exists(first.image.name))
+
+        for name in ('product_images/missing.png', '../settings.py', '/etc/passwd',
+                     'product_images/../product_images/n2.png', '.incoming/tmp123'):
+            report = self.post(self.ndjson({**row, 'images': [name]}))
+            self.assertIn('images', report['errors'][0]['errors'], name)
+        self.assertEqual(self.product.images.count(), 2)
+
+    def test_multipart_csv_and_export(self):
+        self.media('product_images/c.png')
+        content = 'article,name,price,material,categories,images\r\n' \
+                  'C00001,Рубашка,500,Хлопок,Рубашки|Категория 1,product_images/c.png\r\n'
+        upload = SimpleUploadedFile('catalog.csv', content.encode('utf-8-sig'), content_type='text/csv')
+        response = self.client.post('/api/products/bulk/', {'file': upload}, format='multipart')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(self.client.post('/api/products/bulk/', {}, format='multipart').status_code, 400)
+
+        response = self.client.get('/api/products/bulk/?as=csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        row = next(row for row in rows if row['article'] == 'C00001')
+        self.assertEqual(set(row['categories'].split('|')), {'Рубашки', 'Категория 1'})
+        self.assertEqual(row['images'], 'product_images/c.png')
+
+        # Выгрузка снова импортируется без изменений
+        exported = b''.join(self.client.get('/api/products/bulk/').streaming_content)
+        report = self.post(exported)
+        self.assertEqual((report['created'], report['errors']), (0, []))
+        self.assertEqual(report['updated'], Product.objects.count())
+
+    def test_search_refresh(self):
+        with mock.patch('site_api.catalog_io.refresh_product_search') as refresh:
+            self.post(self.ndjson({'article': 'S00001', 'name': 'A', 'price': 1, 'material': 'M'}))
+        refresh.assert_called_once_with([Product.objects.get(article='S00001').pk])
+
+
+class SearchTests(TestCase):
+    """Поиск: ранжирование, фильтры и фасеты (только PostgreSQL) и обновление поискового индекса по сигналам."""
+
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.shirts = Category.objects.create(name='Рубашки')
+        self.by_name = Product.objects.create(name='Рубашка льняная', article='R00001', price=1500, material='Лён')
+        self.by_category = Product.objects.create(name='Блуза', article='B00001', price=4000, material='Шёлк')
+        self.by_category.categories.add(self.shirts)
+        self.other = Product.objects.create(name='Свитер', article='W00001', price=3500, material='Шерсть')
+        self.look = Look.objects.create(name='Офис', price=9000)
+        self.look.products.add(self.by_name, self.other)
+
+    def search(self, query):
+        response = self.client.get(f'/api/search/?{query}', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск работает только на PostgreSQL')
+    def test_ranking_filters_and_facets(self):
+        data = self.search('q=рубашка')
+        self.assertEqual([item['id'] for item in data['products']], [self.by_name.pk, self.by_category.pk])
+        self.assertEqual([item['id'] for item in data['looks']], [self.look.pk])
+        self.assertEqual(data['facets']['categories'], [{'id': self.shirts.pk, 'name': 'Рубашки', 'count': 1}])
+        self.assertEqual(
+            [bucket['count'] for bucket in data['facets']['price']], [0, 1, 1, 0, 0, 0],
+        )
+
+        self.assertEqual([item['id'] for item in self.search('q=рубашка&price_max=2000')['products']], [self.by_name.pk])
+        self.assertEqual([item['id'] for item in self.search(f'q=рубашка&category={self.shirts.pk}')['products']],
+                         [self.by_category.pk])
+        self.assertEqual([item['id'] for item in self.search('q=R0000&type=products')['products']], [self.by_name.pk])
+        self.assertNotIn('looks', self.search('q=рубашка&type=products'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск работает только на PostgreSQL')
+    def test_limit(self):
+        for limit, expected in (('1', 1), ('-1', 1), ('0', 1), ('1000', 2)):
+            self.assertEqual(len(self.search(f'q=рубашка&type=products&limit={limit}')['products']), expected, limit)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск работает только на PostgreSQL')
+    def test_index_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.products.clear()
+        self.assertEqual([item['id'] for item in self.search('q=рубашка')['products']], [self.by_name.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.name = 'Рубашка шерстяная'
+            self.other.save()
+        self.assertIn(self.other.pk, [item['id'] for item in self.search('q=шерстяная')['products']])
+        self.assertEqual([item['id'] for item in self.search('q=шерстяная')['looks']], [self.look.pk])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/search/', HTTP_ACCEPT='application/json').status_code, 400)
+        response = self.client.get('/api/search/?q=x&limit=many', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_follows_products_and_looks(self):
+        ranked = lambda queryset, term: queryset.annotate(rank=Value(1.0))
+        with mock.patch('site_api.views.search_looks', side_effect=ranked) as search_looks:
+            self.assertEqual([item['id'] for item in self.search('q=офис&type=looks')['looks']], [self.look.pk])
+            self.search('q=офис&type=looks')
+            self.assertEqual(search_looks.call_count, 1)
+            # Выдача содержит товары (артикулы, цены), поэтому правка одного товара тоже её сбрасывает
+            bump_version(PRODUCTS)
+            self.search('q=офис&type=looks')
+            self.assertEqual(search_looks.call_count, 2)
+            bump_version(LOOKS)
+            self.search('q=офис&type=looks')
+            self.assertEqual(search_looks.call_count, 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN проверяется только на PostgreSQL')
+    def test_article_prefix_uses_index(self):
+        analyzed_catalog(2000)
+        with connection.cursor() as cursor:
+            sql, params = search_products(Product.objects.all(), 'S0001').query.sql_with_params()
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('products_article_prefix_idx', plan)
+        self.assertNotIn('Seq Scan on products', plan)
+
+    def test_reverse_clear_reaches_every_handler(self):
+        updated_at = self.look.updated_at
+        with mock.patch('site_api.signals.refresh_look_search') as refresh_looks, \
+                mock.patch('site_api.signals.refresh_look_pricing') as refresh_pricing, \
+                mock.patch('site_api.signals.record_changes') as record:
+            self.other.looks.clear()
+        refresh_looks.assert_called_with([self.look.pk])
+        refresh_pricing.assert_called_with([self.look.pk])
+        record.assert_any_call(Look, [self.look.pk], ChangeAction.UPDATED)
+        self.look.refresh_from_db()
+        self.assertGreater(self.look.updated_at, updated_at)
+
+    def test_m2m_refreshes_owners(self):
+        with mock.patch('site_api.signals.refresh_product_search') as refresh_products, \
+                mock.patch('site_api.signals.refresh_look_search') as refresh_looks:
+            self.shirts.products.clear()
+            refresh_products.assert_called_with([self.by_category.pk])
+            self.by_name.looks.clear()
+            refresh_looks.assert_called_with([self.look.pk])
+            self.shirts.products.add(self.other)
+            refresh_products.assert_called_with({self.other.pk})
+            self.look.products.add(self.by_category)
+            refresh_looks.assert_called_with([self.look.pk])
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_catalog(5)
+
+    def test_ndjson_and_json(self):
+        expected = ProductSerializer(product_queryset().order_by('id'), many=True).data
+        response = self.client.get('/api/products/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], json.loads(JSONRenderer().render(expected)))
+
+        response = self.client.get('/api/looks/export/?as=json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        looks = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([look['id'] for look in looks], list(Look.objects.order_by('id').values_list('pk', flat=True)))
+
+    def test_chunks(self):
+        chunks = list(stream_serialized(product_queryset(), ProductSerializer, 'json', chunk_size=2))
+        self.assertEqual(len(json.loads(b''.join(chunks))), 5)
+        self.assertEqual(list(stream_serialized(Product.objects.none(), ProductSerializer, 'json')), [b'[', b']'])
+        self.assertEqual(self.client.get('/api/products/export/?as=xml').status_code, 400)
+
+
+class CatalogCacheTests(TestCase):
+    """Версия кэша сдвигается после коммита записи, а не внутри её транзакции."""
+
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.product = create_catalog(1)[0]
+        self.url = f'/api/products/{self.product.pk}/'
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_read_during_write_is_not_cached_as_fresh(self):
+        response = self.get()
+        stale, etag = response.content, response['ETag']
+        version = get_version(PRODUCTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.product.name = 'Новое имя'
+                self.product.save()
+                self.assertEqual(get_version(PRODUCTS), version)
+                # Параллельное чтение до коммита видит старые строки и кэширует их под текущей версией
+                catalog_cache().set(path_cache_key(PRODUCTS, self.url), stale)
+                catalog_cache().set(path_cache_key(PRODUCTS, self.url) + ':validators:json', (etag, None))
+        self.assertNotEqual(get_version(PRODUCTS), version)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Новое имя')
+
+    def test_rollback_keeps_version(self):
+        version = get_version(PRODUCTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.product.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(get_version(PRODUCTS), version)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag и Last-Modified: 304 без сериализации, новый ETag после записи."""
+
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.products = create_catalog(3)
+        self.look = Look.objects.first()
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_if_none_match(self):
+        urls = [
+            '/api/products/', f'/api/products/{self.products[0].pk}/',
+            '/api/looks/', f'/api/looks/{self.look.pk}/',
+        ]
+        for url in urls:
+            etag = self.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200, url)
+
+    def test_if_modified_since_only_for_detail(self):
+        url = f'/api/products/{self.products[0].pk}/'
+        last_modified = self.get(url)['Last-Modified']
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200)
+        # Удаление из списка не сдвигает максимальный updated_at, поэтому для списков решает только ETag
+        self.assertEqual(self.get('/api/products/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_etag_changes_after_write(self):
+        product_url = f'/api/products/{self.products[0].pk}/'
+        look_url = f'/api/looks/{self.look.pk}/'
+        etags = {url: self.get(url)['ETag'] for url in ('/api/products/', product_url, '/api/looks/', look_url)}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = 'Новое имя'
+            self.products[0].save()
+        for url, etag in etags.items():
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag, url)
+
+        etag = self.get('/api/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[2].delete()
+        self.assertEqual(self.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_format_in_etag(self):
+        url = f'/api/products/{self.products[0].pk}/'
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url + '?view=summary', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotEqual(self.client.get(url, HTTP_ACCEPT='text/html')['ETag'], etag)
+
+
+class SnapshotTests(TestCase):
+    """Снимки `main_image` и `category_ids` обновляются теми же запросами, что меняют фото и категории."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_catalog(1)[0]
+        self.category = Category.objects.create(name='Новая')
+
+    def test_main_image_after_upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        upload = SimpleUploadedFile('new.png', buffer.getvalue(), content_type='image/png')
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            response = self.client.post(
+                f'/api/products/{self.product.pk}/images/', {'image': upload, 'is_main': True}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image_id, response.json()['id'])
+        self.assertEqual(self.product.images.filter(is_main=True).count(), 1)
+
+    def test_category_delete(self):
+        self.product.categories.add(self.category)
+        refresh_product_snapshot([self.product.pk])
+        self.category.delete()
+        self.product.refresh_from_db()
+        self.assertNotIn(self.category.pk, self.product.category_ids)
+        self.assertEqual(len(self.product.category_ids), 2)
+
+
+class ImageUpdateTests(TestCase):
+    """PUT с фото меняет только разницу: оставленные строки не пересоздаются, файлы удалённых чистятся после коммита."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_catalog(1)[0]
+        self.main, self.extra = self.product.images.order_by('-is_main', 'pk')
+
+    def test_keep_and_flip_main(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(
+                f'/api/products/{self.product.pk}/', {'images': [{'id': self.extra.pk, 'is_main': True}]}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([image['id'] for image in response.json()['images']], [self.extra.pk])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image_id, self.extra.pk)
+        self.assertFalse(ProductImage.objects.filter(pk=self.main.pk).exists())
+        self.assertFalse(any(query['sql'].startswith('INSERT INTO "product_images"') for query in context.captured_queries))
+
+    def test_add_remove_and_delete_files(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            old = default_storage.save('product_images/old.png', io.BytesIO(buffer.getvalue()))
+            ProductImage.objects.filter(pk=self.extra.pk).update(image=old)
+            # Другое содержимое: одинаковый файл остался бы на диске под новым фото
+            buffer = io.BytesIO()
+            Image.new('RGB', (8, 8), (255, 0, 0)).save(buffer, 'PNG')
+            upload = SimpleUploadedFile('new.png', buffer.getvalue(), content_type='image/png')
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(f'/api/products/{self.product.pk}/', {
+                    'images[0]id': self.main.pk,
+                    'images[0]is_main': 'false',
+                    'images[1]image': upload,
+                    'images[1]is_main': 'true',
+                }, format='multipart')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(default_storage.exists(old))
+        images = response.json()['images']
+        self.assertEqual(len(images), 2)
+        self.assertTrue(images[0]['is_main'])
+        self.assertEqual(images[1]['id'], self.main.pk)
+        self.assertEqual(ImageJob.objects.filter(image_id=images[0]['id']).count(), 1)
+
+    def test_foreign_image_id(self):
+        other = create_catalog(1)[0].images.first()
+        response = self.client.put(
+            f'/api/products/{self.product.pk}/', {'images': [{'id': other.pk, 'is_main': True}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.product.images.count(), 2)
+
+
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_catalog(1, images_per_product=0)[0]
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), (10, 20, 30)).save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+
+    def upload(self, name):
+        response = self.client.post(
+            f'/api/products/{self.product.pk}/images/',
+            {'image': SimpleUploadedFile(name, self.content, content_type='image/png')}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        return ProductImage.objects.get(pk=response.json()['id']).image.name
+
+    def test_identical_uploads_share_file(self):
+        first, second = self.upload('модель_0.png'), self.upload('copy.PNG')
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^product_images/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(default_storage.open(first).read(), self.content)
+        # Пока файл нужен другой строке, удаление одного фото его не трогает
+        images = list(self.product.images.all())
+        images[0].delete()
+        delete_unreferenced_files([first])
+        self.assertTrue(default_storage.exists(first))
+        images[1].delete()
+        delete_unreferenced_files([first])
+        self.assertFalse(default_storage.exists(first))
+
+    def test_serve_media(self):
+        name = self.upload('a.png')
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.client.get(f'/media/{name}', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.settings(MEDIA_SERVER='nginx'):
+            response = self.client.get(f'/media/{name}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response.content, b'')
+        for path in ('/media/../settings.py', '/media/product_images/missing.png'):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+        spool = os.path.basename(default_storage._spool(ContentFile(self.content))[1])
+        for path in (f'/media/.incoming/{spool}', f'/media/product_images/../.incoming/{spool}'):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+    def test_upload_restores_file_deleted_before_commit(self):
+        name = self.upload('a.png')
+        self.product.images.get().delete()
+        # Повторная загрузка застаёт файл на диске, но её строка ещё не закоммичена,
+        # и удаление ничейных файлов в другой транзакции её не видит
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(default_storage.save('product_images/b.png', io.BytesIO(self.content)), name)
+            delete_unreferenced_files([name])
+            self.assertFalse(default_storage.exists(name))
+            ProductImage.objects.create(product=self.product, image=name, is_main=True)
+        self.assertEqual(default_storage.open(name).read(), self.content)
+
+    def test_hashed_name_fits_field(self):
+        name = default_storage.save('product_images/a.' + 'x' * 40, ContentFile(self.content), max_length=100)
+        self.assertRegex(name, r'^product_images/[0-9a-f]{2}/[0-9a-f]{64}$')
+        self.assertTrue(is_content_addressed(name))
+        self.assertRegex(default_storage.save('product_images/a.jpeg', ContentFile(b'x'), max_length=100), r'\.jpeg$')
+        # Имя, которое не влезет в колонку, отвергается до записи файла, а не после
+        with self.assertRaises(SuspiciousFileOperation):
+            default_storage.save('d' * 40 + '/a.png', ContentFile(b'orphan'), max_length=100)
+        stored = [file for _, _, files in os.walk(settings.MEDIA_ROOT) for file in files]
+        self.assertEqual(len(stored), 2)
+
+    def test_delete_rechecks_references(self):
+        name = self.upload('a.png')
+        # Ссылка появилась между первой проверкой и удалением
+        answers = iter([set(), {name}])
+        self.assertEqual(default_storage.delete_unreferenced([name], lambda names: next(answers)), [])
+        self.assertEqual(default_storage.open(name).read(), self.content)
+        self.assertEqual(default_storage.delete_unreferenced([name], lambda names: set()), [name])
+        self.assertFalse(default_storage.exists(name))
+
+
+class LookPricingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.products = create_catalog(3)
+        self.look = Look.objects.get()
+
+    def assertPricing(self, total, count, min_price, max_price):
+        self.look.refresh_from_db()
+        self.assertEqual(
+            (self.look.products_total, self.look.products_count, self.look.products_min_price, self.look.products_max_price),
+            (total, count, min_price, max_price),
+        )
+
+    def test_incremental_refresh(self):
+        prices = [product.price for product in self.products]
+        self.assertPricing(sum(prices), 3, min(prices), max(prices))
+
+        self.products[0].price = 10
+        self.products[0].save()
+        self.assertPricing(10 + sum(prices[1:]), 3, 10, max(prices))
+
+        self.products[2].looks.remove(self.look)
+        self.assertPricing(10 + prices[1], 2, 10, prices[1])
+
+        self.products[1].delete()
+        self.assertPricing(10, 1, 10, 10)
+
+        self.look.products.clear()
+        self.assertPricing(0, 0, None, None)
+
+    def test_product_looks(self):
+        other = create_catalog(3)
+        response = self.client.get(f'/api/products/{self.products[0].pk}/looks/', HTTP_ACCEPT='application/json')
+        results = response.json()['results']
+        self.assertEqual([look['id'] for look in results], [self.look.pk])
+        self.assertEqual(results[0]['savings'], sum(product.price for product in self.products) - self.look.price)
+        self.assertNotIn(other[0].looks.get().pk, [look['id'] for look in results])
+        response = self.client.get('/api/products/0/looks/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class AdminChangelistTests(TestCase):
+    """Число запросов страницы списка в админке не зависит от числа строк."""
+    urls = (
+        '/admin/site_api/product/', '/admin/site_api/product/?category={category}&o=6',
+        '/admin/site_api/productimage/', '/admin/site_api/look/', '/admin/site_api/look/?category={category}',
+        '/admin/site_api/lookimage/', '/admin/site_api/imagejob/',
+    )
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def count_queries(self):
+        counts = {}
+        category = Category.objects.first().pk
+        for url in self.urls:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url.format(category=category))
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(context.captured_queries)
+        return counts
+
+    def test_queries_do_not_grow_with_rows(self):
+        create_catalog(2)
+        small = self.count_queries()
+        create_catalog(10)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_image_count_and_category_filter(self):
+        products = create_catalog(3)
+        category = products[0].categories.first()
+        response = self.client.get(f'/admin/site_api/product/?category={category.pk}')
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertEqual({product.images_count for product in response.context['cl'].result_list}, {2})
+        self.assertEqual(self.client.get('/admin/site_api/product/?category=x').status_code, 302)
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class ChangesFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_changes(self, since, limit=500):
+        response = self.client.get(f'/api/changes/?since={since}&limit={limit}', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_deltas_and_tombstones(self):
+        cursor = self.client.get('/api/changes/', HTTP_ACCEPT='application/json').json()['cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            products = create_catalog(3)
+        look = Look.objects.get()
+        first = self.get_changes(cursor)
+        self.assertFalse(first['has_more'])
+        self.assertEqual(first['changes']['products']['upserted'], sorted(product.pk for product in products))
+        self.assertEqual(first['changes']['looks']['upserted'], [look.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/products/{products[0].pk}/')
+        second = self.get_changes(first['cursor'])
+        self.assertEqual(second['changes']['products'], {'upserted': [], 'deleted': [products[0].pk]})
+        self.assertEqual(len(second['changes']['product_images']['deleted']), 2)
+        self.assertEqual(second['changes']['looks']['upserted'], [look.pk])
+        self.assertEqual(self.get_changes(second['cursor'])['changes'], {})
+
+    def test_batches(self):
+        cursor = self.client.get('/api/changes/', HTTP_ACCEPT='application/json').json()['cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            products = create_catalog(3)
+        seen = set()
+        while True:
+            batch = self.get_changes(cursor, limit=4)
+            seen.update(batch['changes'].get('products', {}).get('upserted', []))
+            cursor = batch['cursor']
+            if not batch['has_more']:
+                break
+        self.assertEqual(seen, {product.pk for product in products})
+
+    def test_log_shares_data_transaction(self):
+        product = create_catalog(1)[0]
+        before = ChangeLogEntry.objects.count()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            product.name = 'Откатится'
+            product.save()
+            # Запись журнала уже в транзакции данных, а не отложена до коммита
+            self.assertEqual(ChangeLogEntry.objects.count(), before + 1)
+            raise RuntimeError
+        self.assertEqual(ChangeLogEntry.objects.count(), before)
+        product.refresh_from_db()
+        self.assertNotEqual(product.name, 'Откатится')
+
+    def test_bootstrap_cursor_is_settled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_catalog(1)
+        with self.settings(CHANGES_SETTLE_SECONDS=60):
+            response = self.client.get('/api/changes/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['cursor'], 0)
+        latest = ChangeLogEntry.objects.order_by('-pk').values_list('pk', flat=True).first()
+        self.assertEqual(self.client.get('/api/changes/', HTTP_ACCEPT='application/json').json()['cursor'], latest)
+
+
+class BatchFetchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.products = create_catalog(4)
+
+    def test_order_and_not_found(self):
+        first, second = self.products[0].pk, self.products[2].pk
+        response = self.client.get(f'/api/products/?ids={second},0,{first}', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([item['id'] for item in results], [second, 0, first])
+        self.assertEqual(results[1], {'id': 0, 'not_found': True})
+        detail = self.client.get(f'/api/products/{first}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(results[2], detail.json())
+
+    def test_warm_detail_cache(self):
+        ids = [product.pk for product in self.products]
+        for pk in ids[:2]:
+            self.client.get(f'/api/products/{pk}/', HTTP_ACCEPT='application/json')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/products/batch/', {'ids': ids}, format='json', HTTP_ACCEPT='application/json')
+        self.assertEqual([item['id'] for item in response.json()['results']], ids)
+        # Промахи читаются одним запросом плюс prefetch фото и категорий
+        self.assertEqual(len(context.captured_queries), 3)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(f'/api/products/?ids={ids[3]},{ids[2]}', HTTP_ACCEPT='application/json')
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_invalid_ids(self):
+        for url in ('/api/products/?ids=1,x', '/api/products/?ids=', '/api/looks/?ids=' + ','.join(['1'] * 101)):
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT='application/json').status_code, 400, url)
+        response = self.client.post('/api/looks/batch/', [1, 2], format='json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.products = create_catalog(4)
+        self.look = Look.objects.first()
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_fields_and_expand(self):
+        results = self.get('/api/products/?fields=id,name,price&ordering=price')['results']
+        self.assertEqual(set(results[0]), {'id', 'name', 'price'})
+        product = self.get(f'/api/products/{self.products[0].pk}/?expand=categories')
+        self.assertEqual(product['images'], list(self.products[0].images.order_by('-is_main', 'id').values_list('id', flat=True)))
+        self.assertEqual(set(product['categories'][0]), {'id', 'name'})
+        look = self.get(f'/api/looks/{self.look.pk}/?fields=id,products.id,products.images.image&expand=products.images')
+        self.assertEqual(set(look), {'id', 'products'})
+        self.assertEqual(set(look['products'][0]), {'id', 'images'})
+        self.assertEqual(set(look['products'][0]['images'][0]), {'image'})
+        summary = self.get('/api/looks/?view=summary&fields=id,price')['results']
+        self.assertEqual(set(summary[0]), {'id', 'price'})
+        batch = self.get(f'/api/products/?ids={self.products[1].pk}&fields=id,article')['results']
+        self.assertEqual(batch, [{'id': self.products[1].pk, 'article': self.products[1].article}])
+
+    def test_skips_unrequested_prefetches(self):
+        with CaptureQueriesContext(connection) as full:
+            self.get('/api/looks/')
+        catalog_cache().clear()
+        with CaptureQueriesContext(connection) as context:
+            self.get('/api/looks/?fields=id,name,products&expand=')
+        self.assertLess(len(context.captured_queries), len(full.captured_queries))
+        self.assertNotIn('material', ' '.join(query['sql'] for query in context.captured_queries))
+
+    def test_unknown_fields(self):
+        for url in ('/api/products/?fields=id,secret', '/api/looks/?expand=price',
+                    f'/api/looks/{self.look.pk}/?fields=products.secret'):
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT='application/json').status_code, 400, url)
+
+
+class AsyncReadTests(TestCase):
+    """Асинхронные GET отдают те же байты и валидаторы, что синхронные."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.factory = AsyncRequestFactory()
+        catalog_cache().clear()
+        self.products = create_catalog(5)
+        self.look = Look.objects.first()
+
+    async def assertSameResponse(self, view, url, **kwargs):
+        expected = await sync_to_async(self.client.get)(url, HTTP_ACCEPT='application/json')
+        catalog_cache().clear()
+        response = await view.as_view()(self.factory.get(url), **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(response.headers.get('ETag'), expected.headers.get('ETag'))
+        if response.status_code != 200:
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['Content-Type'], expected['Content-Type'])
+        return response
+
+    async def test_lists(self):
+        await self.assertSameResponse(AsyncProductListView, '/api/products/?page_size=2&ordering=price')
+        await self.assertSameResponse(AsyncProductListView, '/api/products/?view=summary&price_min=1002')
+        await self.assertSameResponse(AsyncLookListView, '/api/looks/')
+        await self.assertSameResponse(AsyncLookListView, '/api/looks/?view=summary')
+        await self.assertSameResponse(AsyncProductLooksView, f'/api/products/{self.products[0].pk}/looks/',
+                                      pk=self.products[0].pk)
+        await self.assertSameResponse(AsyncLookListView, f'/api/looks/?ids={self.look.pk},0')
+        await self.assertSameResponse(AsyncLookListView, '/api/looks/?fields=id,products&expand=products.images')
+
+    async def test_details(self):
+        await self.assertSameResponse(AsyncProductDetailView, f'/api/products/{self.products[0].pk}/',
+                                      pk=self.products[0].pk)
+        await self.assertSameResponse(AsyncLookDetailView, f'/api/looks/{self.look.pk}/', pk=self.look.pk)
+
+    async def test_errors(self):
+        for view, url, kwargs in (
+            (AsyncProductDetailView, '/api/products/0/', {'pk': 0}),
+            (AsyncLookDetailView, '/api/looks/0/', {'pk': 0}),
+            (AsyncProductLooksView, '/api/products/0/looks/', {'pk': 0}),
+            (AsyncProductListView, '/api/products/?cursor=forged', {}),
+            (AsyncProductListView, '/api/products/?ordering=name', {}),
+            (AsyncLookListView, '/api/looks/?ids=abc', {}),
+        ):
+            response = await self.assertSameResponse(view, url, **kwargs)
+            self.assertIn(response.status_code, (400, 404), url)
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.products = create_catalog(3)
+        self.look = Look.objects.first()
+        output = tempfile.TemporaryDirectory()
+        self.addCleanup(output.cleanup)
+        self.output = output.name
+
+    def snapshot(self, url):
+        entry = load_manifest(self.output)['entries'][url]
+        with open(os.path.join(self.output, entry['file']), 'rb') as body:
+            return entry, body.read()
+
+    def test_build_matches_api_and_serves(self):
+        report = build_snapshot(self.output, 'http://testserver')
+        self.assertEqual(report['details'], 3 + Look.objects.count())
+        for url in (f'/api/products/{self.products[0].pk}/', f'/api/looks/{self.look.pk}/',
+                    '/api/products/?view=summary', f'/api/looks/?category={Category.objects.first().pk}'):
+            entry, content = self.snapshot(url)
+            self.assertEqual(content, self.client.get(url, HTTP_ACCEPT='application/json').content, url)
+            with open(os.path.join(self.output, entry['encodings']['gzip']), 'rb') as compressed:
+                self.assertEqual(gzip.decompress(compressed.read()), content)
+
+        url = f'/api/products/{self.products[0].pk}/'
+        entry, content = self.snapshot(url)
+        with self.settings(CATALOG_SNAPSHOT_DIR=self.output), self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), content)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=entry['etag']).status_code, 304)
+
+    def test_incremental(self):
+        build_snapshot(self.output, 'http://testserver')
+        product = self.products[1]
+        removed = self.products[2].pk
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Переименован'
+            product.save()
+            self.products[2].delete()
+        report = build_snapshot(self.output, 'http://testserver', incremental=True)
+        looks = Look.objects.filter(products__in=[product.pk, removed]).distinct().count()
+        self.assertEqual(report['details'], 1 + looks)
+        self.assertEqual(json.loads(self.snapshot(f'/api/products/{product.pk}/')[1])['name'], 'Переименован')
+        self.assertNotIn(f'/api/products/{removed}/', load_manifest(self.output)['entries'])
+        _, content = self.snapshot('/api/products/')
+        self.assertEqual(content, self.client.get('/api/products/', HTTP_ACCEPT='application/json').content)
+        self.assertEqual(build_snapshot(self.output, 'http://testserver', incremental=True)['details'], 0)
+
+    @override_settings(DEBUG=True)
+    async def test_serves_under_asgi_without_adaptation(self):
+        await sync_to_async(build_snapshot)(self.output, 'http://testserver')
+        url = f'/api/products/{self.products[0].pk}/'
+        _, content = self.snapshot(url)
+        # Цепочка middleware собирается на первом запросе; в DEBUG BaseHandler пишет
+        # в django.request о каждом обработчике, обёрнутом в async_to_sync или sync_to_async
+        with self.settings(CATALOG_SNAPSHOT_DIR=self.output), self.assertNoLogs('django.request', 'DEBUG'):
+            response = await AsyncClient().get(url)
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_only_safe_api_requests_read_from_replica(self):
+        router = ReplicaRouter()
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(Product))
+            return HttpResponse()
+
+        middleware = ReplicaReadsMiddleware(view)
+        factory = RequestFactory()
+        for request in (factory.get('/api/products/'), factory.post('/api/products/'), factory.get('/admin/')):
+            middleware(request)
+        self.assertEqual(seen, [REPLICA_ALIAS, None, None])
+        self.assertIsNone(router.db_for_read(Product))
+        self.assertFalse(router.allow_migrate(REPLICA_ALIAS, 'site_api'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.product = create_catalog(2)[0]
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_and_exposition(self):
+        url = f'/api/products/{self.product.pk}/'
+        first = self.client.get(url, HTTP_ACCEPT='application/json')
+        second = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertIn('db;desc=', first['Server-Timing'])
+        self.assertIn('cache;desc="miss"', first['Server-Timing'])
+        self.assertIn('cache;desc="hit"', second['Server-Timing'])
+
+        with self.settings(METRICS_TOKEN='secret'):
+            body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('# TYPE catalog_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'catalog_request_duration_seconds_count\{method="GET",route="product-detail",status="200"\}')
+        self.assertRegex(body, r'catalog_response_cache_total\{result="hit",route="product-detail"\}')
+
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_from_all_workers(self):
+        # Два процесса-«воркера» пишут в общий каталог; /metrics любого процесса видит оба
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory.name}
+        script = (
+            'import django; django.setup(); from site_api.metrics import cache_requests; '
+            'cache_requests.labels("product-detail", "miss").inc()'
+        )
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', script], env=env, check=True)
+        with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory.name}):
+            body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('catalog_response_cache_total{result="miss",route="product-detail"} 2.0', body)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('site_api.slow_requests', level='WARNING') as logs:
+            self.client.get('/api/looks/', HTTP_ACCEPT='application/json')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['route'], 'look-list-create')
+        self.assertEqual(len(entry['top_queries']), min(entry['db_queries'], 5))
+
+
+class FastRenderingTests(TestCase):
+    """orjson и FastReadMixin дают те же байты, что JSONRenderer и обход полей DRF."""
+
+    def test_renderer_matches_stdlib(self):
+        data = {'name': 'Платье\u2028мини', 'created_at': timezone.now(), 'ids': (1, 2), 7: None}
+        self.assertEqual(CatalogJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            CatalogJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+    def test_fast_read_matches_drf(self):
+        create_catalog(3)
+        looks = list(look_queryset())
+        fast = LookSerializer(looks, many=True).data
+        with drf_read():
+            generic = LookSerializer(looks, many=True).data
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(generic))
+
+    def test_fast_read_plan(self):
+        plain = {name for name, attr, field in ProductImageSerializer()._read_plan if field is None}
+        # processing_status - поле с choices: значение может быть членом перечисления, а не строкой
+        self.assertEqual(plain, {'id', 'is_main'})
+        create_catalog(1)
+        image = ProductImage.objects.first()
+        image.processing_status = ProcessingStatus.READY
+        self.assertIs(type(ProductImageSerializer(image).data['processing_status']), str)
+
+
+class SeedCatalogTests(TestCase):
+    def test_seed_and_clear(self):
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            report = seed_catalog(30, 6, images_per=2, categories=4, products_per_look=3, batch_size=7)
+        self.assertEqual(report, {'categories': 4, 'products': 30, 'looks': 6, 'images': 72})
+        look = Look.objects.order_by('pk').first()
+        self.assertEqual(look.products_count, 3)
+        self.assertLess(look.price, look.products_total)
+        self.assertIsNotNone(look.main_image_id)
+        product = Product.objects.order_by('pk').first()
+        self.assertEqual(product.main_image.product_id, product.pk)
+        self.assertEqual(sorted(product.category_ids), sorted(product.categories.values_list('pk', flat=True)))
+
+        clear_catalog()
+        self.assertFalse(Product.objects.exists() or Look.objects.exists() or Category.objects.exists())
+        self.assertFalse(ProductImage.objects.exists() or LookImage.objects.exists())
+        self.assertFalse(ChangeLogEntry.objects.exists())
+
+    def test_placeholder_reused(self):
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            name = placeholder('product')
+            self.assertTrue(is_content_addressed(name))
+            self.assertTrue(default_storage.exists(name))
+            with mock.patch('site_api.seeding.Image.new') as new:
+                self.assertEqual(placeholder('product'), name)
+            new.assert_not_called()
+
+
+class BenchmarkComparisonTests(SimpleTestCase):
+    def test_regressions(self):
+        baseline = {'100:10': {'products.list': {
+            'p50_ms': 2.0, 'p99_ms': 5.0, 'queries': 3, 'errors': 0, 'peak_rss_mb': 100.0,
+        }}}
+        noise = {'100:10': {'products.list': {
+            'p50_ms': 2.8, 'p99_ms': 5.5, 'queries': 3, 'errors': 0, 'peak_rss_mb': 110.0,
+        }}}
+        self.assertEqual(compare_results(baseline, noise), [])
+        worse = {'100:10': {'products.list': {
+            'p50_ms': 4.0, 'p99_ms': 5.0, 'queries': 4, 'errors': 1, 'peak_rss_mb': 100.0,
+        }}}
+        self.assertEqual(len(compare_results(baseline, worse)), 3)
+
+
+class ListFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalog_cache().clear()
+        self.products = create_catalog(6)
+
+    def get_ids(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_filters(self):
+        category = Category.objects.create(name='Платья')
+        self.products[1].categories.add(category)
+        self.products[4].categories.add(category)
+        look = Look.objects.filter(products=self.products[0]).get()
+
+        self.assertEqual(self.get_ids(f'/api/products/?category={category.pk}&ordering=price'),
+                         [self.products[1].pk, self.products[4].pk])
+        self.assertEqual(self.get_ids('/api/products/?price_min=1002&price_max=1003&ordering=price'),
+                         [self.products[2].pk, self.products[3].pk])
+        self.assertEqual(sorted(self.get_ids(f'/api/products/?in_look={look.pk}')),
+                         sorted(product.pk for product in look.products.all()))
+        self.assertEqual(self.get_ids(f'/api/looks/?product={self.products[4].pk}&view=summary'),
+                         list(Look.objects.filter(products=self.products[4]).values_list('pk', flat=True)))
+
+    def test_ordering_pagination(self):
+        seen = []
+        url = '/api/products/?ordering=-price&page_size=4&view=summary'
+        while url:
+            response = self.client.get(url, HTTP_ACCEPT='application/json').json()
+            seen += [item['price'] for item in response['results']]
+            url = response['next']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), len(self.products))
+
+    def test_invalid_parameters(self):
+        for query in ('ordering=material', 'price_min=abc', 'created_after=yesterday'):
+            response = self.client.get(f'/api/products/?{query}', HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_forged_cursor(self):
+        def cursor(position, ordering='-created_at,-id'):
+            payload = json.dumps({'p': position, 'o': ordering}).encode('utf-8')
+            return base64.urlsafe_b64encode(payload).decode('ascii')
+
+        valid = [timezone.now().isoformat(), self.products[0].pk]
+        response = self.client.get(f'/api/products/?cursor={cursor(valid)}', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        forged = [
+            cursor(valid[:1]), cursor(valid + [1]), cursor([valid[0], 'abc']), cursor(['yesterday', 1]),
+            cursor([None, 1]), cursor([valid[0], [1]]), cursor([valid[0], True]), cursor({'a': 1}),
+            cursor(valid, ordering='price,id'), cursor([1, 'x'], ordering='price,id'), 'not-base64', cursor('x')[:-2],
+        ]
+        for value in forged:
+            for url in (f'/api/products/?cursor={value}', f'/api/looks/?cursor={value}&view=summary',
+                        f'/api/products/?ordering=price&cursor={value}'):
+                response = self.client.get(url, HTTP_ACCEPT='application/json')
+                self.assertEqual(response.status_code, 404, (url, response.content))
+
+    @skipUnless(connection.vendor == 'postgresql', 'Планы запросов проверяются только на PostgreSQL')
+    def test_query_plans_use_indexes(self):
+        analyzed_catalog(5000)
+
+        def index_condition(url, index):
+            request = Request(APIRequestFactory().get(url))
+            paginator = KeysetPagination()
+            paginator.ordering = get_ordering(request.query_params)
+            queryset = filter_products(Product.objects.all(), request.query_params)
+            plan = paginator.get_page_queryset(queryset, request).explain()
+            self.assertIn(index, plan)
+            return re.search(r'Index Cond: (.*)', plan).group(1)
+
+        url = '/api/products/?ordering=price&price_min=49000&page_size=10'
+        self.assertIn('price >= 49000', index_condition(url, 'products_price_id_idx'))
+        # Следующая страница начинается с позиции курсора в том же индексе, фильтр по цене - его граница
+        condition = index_condition(self.client.get(url, HTTP_ACCEPT='application/json').json()['next'],
+                                    'products_price_id_idx')
+        self.assertIn('ROW(price, id) > ROW(', condition)
+        self.assertIn('price >= 49000', condition)
+        after = (timezone.now() + timezone.timedelta(days=1)).date().isoformat()
+        self.assertIn('created_at > ', index_condition(f'/api/products/?created_after={after}',
+                                                      'products_created_at_id_idx'))
@@ -1,11 +1,35 @@
+from django.conf import settings
 from django.urls import path
-from site_api.views import ProductListCreateView, ProductDetailView, ProductImageCreateView, LookListCreateView, LookDetailView, LookImageCreateView
+from site_api.async_views import (
+    AsyncProductListView, AsyncProductDetailView, AsyncProductLooksView, AsyncLookListView, AsyncLookDetailView,
+    split_by_method,
+)
+from site_api.views import ProductListCreateView, ProductBulkView, ProductBatchView, ProductExportView, ProductDetailView, ProductImageCreateView, ProductLooksView, LookListCreateView, LookBatchView, LookExportView, LookDetailView, LookImageCreateView, SearchView, ChangesView, ImageRenditionView
+
+
+def read_view(async_view, sync_view):
+    # ASYNC_READS включается для развёртывания под ASGI (gunicorn_asgi.py); под WSGI
+    # асинхронный view выполнялся бы через async_to_sync и был бы только медленнее
+    sync_view = sync_view.as_view()
+    if not settings.ASYNC_READS:
+        return sync_view
+    return split_by_method(async_view.as_view(), sync_view)
+
 
 urlpatterns = [
-    path('products/', ProductListCreateView.as_view(), name='product-list-create'),
-    path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
+    path('products/', read_view(AsyncProductListView, ProductListCreateView), name='product-list-create'),
+    path('products/bulk/', ProductBulkView.as_view(), name='product-bulk'),
+    path('products/batch/', ProductBatchView.as_view(), name='product-batch'),
+    path('products/export/', ProductExportView.as_view(), name='product-export'),
+    path('products/<int:pk>/', read_view(AsyncProductDetailView, ProductDetailView), name='product-detail'),
     path('products/<int:product_id>/images/', ProductImageCreateView.as_view(), name='product-image-create'),
-    path('looks/', LookListCreateView.as_view(), name='look-list-create'),
-    path('looks/<int:pk>/', LookDetailView.as_view(), name='look-detail'),
+    path('products/<int:pk>/looks/', read_view(AsyncProductLooksView, ProductLooksView), name='product-looks'),
+    path('looks/', read_view(AsyncLookListView, LookListCreateView), name='look-list-create'),
+    path('looks/batch/', LookBatchView.as_view(), name='look-batch'),
+    path('looks/export/', LookExportView.as_view(), name='look-export'),
+    path('looks/<int:pk>/', read_view(AsyncLookDetailView, LookDetailView), name='look-detail'),
     path('looks/<int:look_id>/images/', LookImageCreateView.as_view(), name='look-image-create'),
-] 
\ No newline at end of file
+    path('search/', SearchView.as_view(), name='search'),
+    path('changes/', ChangesView.as_view(), name='changes'),
+    path('renditions/<str:kind>/<int:pk>/<str:size>.<str:fmt>', ImageRenditionView.as_view(), name='image-rendition'),
+]
@@ -1,29 +1,114 @@
+import json
+import logging
+
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from PIL import UnidentifiedImageError
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from site_api.batch import parse_ids, fetch_batch
+from site_api.cache import PRODUCTS, LOOKS, cache_response
+from site_api.catalog_io import (
+    FORMATS, detect_format, read_rows, import_products, export_rows, render_rows, stream_serialized,
+)
+from site_api.changes import changes_since, settled_cursor
+from site_api.conditional import (
+    conditional_get, product_list_state, product_detail_state, look_list_state, look_detail_state,
+)
+from site_api.fieldsets import sparse_fieldsets
+from site_api.filters import filter_products, filter_looks, get_ordering
 from site_api.models import Product, ProductImage, Look, LookImage
-from site_api.serializers import ProductSerializer, LookSerializer, LookImageSerializer
+from site_api.pagination import KeysetPagination
+from site_api.querysets import (
+    product_queryset, look_queryset, product_summary_queryset, look_summary_queryset, attach_related_ids,
+)
+from site_api.renditions import RENDITION_WIDTHS, RENDITION_FORMATS, ensure_rendition, rendition_storage
+from site_api.search import search_products, search_looks, category_facets, price_facets
+from site_api.serializers import (
+    ProductSerializer, ProductSummarySerializer, ProductImageSerializer,
+    LookSerializer, LookSummarySerializer, LookImageSerializer,
+)
+from site_api.snapshots import refresh_product_snapshot, refresh_look_snapshot
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_VIEW = 'summary'
+
+class BatchFetchMixin:
+    """
+    Выдача нескольких объектов по id: `GET ?ids=1,2,3` у списка или
+    `POST {"ids": [...]}` у `.../batch/` для длинных списков.
+    """
+    resource = None
+    detail_url_name = None
+    queryset_builder = None
+    serializer_class = None
+    max_query_ids = 100
+    max_body_ids = 1000
+
+    @staticmethod
+    def body_ids(request):
+        return request.data.get('ids') if isinstance(request.data, dict) else None
+
+    def batch_response(self, request, values, limit):
+        fields, expand = sparse_fieldsets(request.query_params)
+        content = fetch_batch(
+            self.resource, self.detail_url_name, self.queryset_builder(fields, expand), self.serializer_class,
+            parse_ids(values, limit), fields, expand,
+        )
+        if request.accepted_renderer.format != 'json':
+            return Response(json.loads(content))
+        return HttpResponse(content, content_type='application/json')
+
+class ProductListCreateView(BatchFetchMixin, APIView):
+    resource = PRODUCTS
+    detail_url_name = 'product-detail'
+    queryset_builder = staticmethod(product_queryset)
+    serializer_class = ProductSerializer
 
-class ProductListCreateView(APIView):
     def get(self, request):
-        products = Product.objects.all().prefetch_related('images', 'categories')
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        if 'ids' in request.query_params:
+            return self.batch_response(request, request.query_params['ids'], self.max_query_ids)
+        return self.list(request)
+
+    @conditional_get(PRODUCTS, product_list_state)
+    @cache_response(PRODUCTS)
+    def list(self, request):
+        paginator = KeysetPagination()
+        paginator.ordering = get_ordering(request.query_params)
+        fields, expand = sparse_fieldsets(request.query_params)
+        if request.query_params.get('view') == SUMMARY_VIEW:
+            products = filter_products(product_summary_queryset(), request.query_params)
+            page = paginator.paginate_queryset(products, request, view=self)
+            serializer = ProductSummarySerializer(page, many=True, fields=fields, expand=expand)
+            return paginator.get_paginated_response(serializer.data)
+
+        products = filter_products(product_queryset(fields, expand), request.query_params)
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductSerializer(page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = ProductSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            product = serializer.save()
+            return Response(ProductSerializer(product_queryset().get(pk=product.pk)).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ProductDetailView(APIView):
+    @conditional_get(PRODUCTS, product_detail_state, detail=True)
+    @cache_response(PRODUCTS)
     def get(self, request, pk):
+        fields, expand = sparse_fieldsets(request.query_params)
         try:
-            product = Product.objects.get(pk=pk)
+            product = product_queryset(fields, expand).get(pk=pk)
         except Product.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        serializer = ProductSerializer(product)
+            raise NotFound
+        serializer = ProductSerializer(product, fields=fields, expand=expand)
         return Response(serializer.data)
 
     def put(self, request, pk):
@@ -34,7 +119,7 @@ class ProductDetailView(APIView):
         serializer = ProductSerializer(product, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data)
+            return Response(ProductSerializer(product_queryset().get(pk=product.pk)).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
@@ -45,6 +130,59 @@ class ProductDetailView(APIView):
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class ProductBulkView(APIView):
+    """
+    Импорт товаров потоком NDJSON/CSV с upsert по артикулу и экспорт в том же формате.
+
+    Тело запроса - либо файл в поле `file` (multipart), либо сами строки
+    с Content-Type `application/x-ndjson` или `text/csv`.
+    """
+    parser_classes = [MultiPartParser]
+    chunk_size = 1000
+
+    def get(self, request):
+        fmt = request.query_params.get('as', 'ndjson')
+        if fmt not in FORMATS:
+            return Response({'as': [f'Expected one of: {", ".join(FORMATS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(render_rows(export_rows(self.chunk_size), fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+    def post(self, request):
+        if request.content_type.startswith('multipart/'):
+            upload = request.data.get('file')
+            if upload is None:
+                return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+            stream, fmt = upload, detect_format(name=upload.name)
+        else:
+            stream, fmt = request.stream, detect_format(content_type=request.content_type)
+        if stream is None:
+            return Response({'detail': 'Empty request body.'}, status=status.HTTP_400_BAD_REQUEST)
+        report = import_products(read_rows(stream, fmt), chunk_size=self.chunk_size)
+        return Response(report)
+
+class CatalogExportView(APIView):
+    """Потоковая выгрузка всего каталога в полном представлении API: NDJSON или JSON-массив."""
+    formats = {
+        'ndjson': 'application/x-ndjson',
+        'json': 'application/json',
+    }
+    queryset_builder = None
+    serializer_class = None
+    chunk_size = 500
+
+    def get(self, request):
+        fmt = request.query_params.get('as', 'ndjson')
+        if fmt not in self.formats:
+            return Response({'as': [f'Expected one of: {", ".join(self.formats)}.']}, status=status.HTTP_400_BAD_REQUEST)
+        content = stream_serialized(self.queryset_builder(), self.serializer_class, fmt, self.chunk_size)
+        return StreamingHttpResponse(content, content_type=self.formats[fmt])
+
+class ProductExportView(CatalogExportView):
+    queryset_builder = staticmethod(product_queryset)
+    serializer_class = ProductSerializer
+
 class ProductImageCreateView(APIView):
     def post(self, request, product_id):
         try:
@@ -53,32 +191,76 @@ class ProductImageCreateView(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = ProductImageSerializer(data=request.data)
         if serializer.is_valid():
-            if serializer.validated_data.get('is_main', False):
-                product.images.filter(is_main=True).update(is_main=False)
-            ProductImage.objects.create(product=product, **serializer.validated_data)
+            with transaction.atomic():
+                if serializer.validated_data.get('is_main', False):
+                    product.images.filter(is_main=True).update(is_main=False)
+                serializer.save(product=product)
+                refresh_product_snapshot([product.pk])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class LookListCreateView(APIView):
+class ProductLooksView(APIView):
+    """
+    Образы, в которые входит товар. Выборка идёт по индексу промежуточной
+    таблицы по `product_id`, а цены комплекта берутся из агрегатов образа.
+    """
+    @cache_response(LOOKS)
+    def get(self, request, pk):
+        if not Product.objects.filter(pk=pk).exists():
+            raise NotFound
+        paginator = KeysetPagination()
+        paginator.ordering = get_ordering(request.query_params)
+        page = paginator.paginate_queryset(look_summary_queryset().filter(products=pk), request, view=self)
+        attach_related_ids(page, Look, 'products')
+        serializer = LookSummarySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class LookListCreateView(BatchFetchMixin, APIView):
+    resource = LOOKS
+    detail_url_name = 'look-detail'
+    queryset_builder = staticmethod(look_queryset)
+    serializer_class = LookSerializer
+
     def get(self, request):
-        looks = Look.objects.all().prefetch_related('images', 'products', 'categories')
-        serializer = LookSerializer(looks, many=True)
-        return Response(serializer.data)
+        if 'ids' in request.query_params:
+            return self.batch_response(request, request.query_params['ids'], self.max_query_ids)
+        return self.list(request)
+
+    @conditional_get(LOOKS, look_list_state)
+    @cache_response(LOOKS)
+    def list(self, request):
+        paginator = KeysetPagination()
+        paginator.ordering = get_ordering(request.query_params)
+        fields, expand = sparse_fieldsets(request.query_params)
+        if request.query_params.get('view') == SUMMARY_VIEW:
+            looks = filter_looks(look_summary_queryset(), request.query_params)
+            page = paginator.paginate_queryset(looks, request, view=self)
+            attach_related_ids(page, Look, 'products')
+            serializer = LookSummarySerializer(page, many=True, fields=fields, expand=expand)
+            return paginator.get_paginated_response(serializer.data)
+
+        looks = filter_looks(look_queryset(fields, expand), request.query_params)
+        page = paginator.paginate_queryset(looks, request, view=self)
+        serializer = LookSerializer(page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = LookSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            look = serializer.save()
+            return Response(LookSerializer(look_queryset().get(pk=look.pk)).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class LookDetailView(APIView):
+    @conditional_get(LOOKS, look_detail_state, detail=True)
+    @cache_response(LOOKS)
     def get(self, request, pk):
+        fields, expand = sparse_fieldsets(request.query_params)
         try:
-            look = Look.objects.get(pk=pk)
+            look = look_queryset(fields, expand).get(pk=pk)
         except Look.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        serializer = LookSerializer(look)
+            raise NotFound
+        serializer = LookSerializer(look, fields=fields, expand=expand)
         return Response(serializer.data)
 
     def put(self, request, pk):
@@ -89,7 +271,7 @@ class LookDetailView(APIView):
         serializer = LookSerializer(look, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data)
+            return Response(LookSerializer(look_queryset().get(pk=look.pk)).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
@@ -100,6 +282,28 @@ class LookDetailView(APIView):
         look.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class LookExportView(CatalogExportView):
+    queryset_builder = staticmethod(look_queryset)
+    serializer_class = LookSerializer
+
+class ProductBatchView(BatchFetchMixin, APIView):
+    resource = PRODUCTS
+    detail_url_name = 'product-detail'
+    queryset_builder = staticmethod(product_queryset)
+    serializer_class = ProductSerializer
+
+    def post(self, request):
+        return self.batch_response(request, self.body_ids(request), self.max_body_ids)
+
+class LookBatchView(BatchFetchMixin, APIView):
+    resource = LOOKS
+    detail_url_name = 'look-detail'
+    queryset_builder = staticmethod(look_queryset)
+    serializer_class = LookSerializer
+
+    def post(self, request):
+        return self.batch_response(request, self.body_ids(request), self.max_body_ids)
+
 class LookImageCreateView(APIView):
     def post(self, request, look_id):
         try:
@@ -108,8 +312,105 @@ class LookImageCreateView(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = LookImageSerializer(data=request.data)
         if serializer.is_valid():
-            if serializer.validated_data.get('is_main', False):
-                look.images.filter(is_main=True).update(is_main=False)
-            LookImage.objects.create(look=look, **serializer.validated_data)
+            with transaction.atomic():
+                if serializer.validated_data.get('is_main', False):
+                    look.images.filter(is_main=True).update(is_main=False)
+                serializer.save(look=look)
+                refresh_look_snapshot([look.pk])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class SearchView(APIView):
+    """
+    Полнотекстовый поиск по товарам и образам с фасетами по категориям и цене.
+
+    Фасеты считаются по найденным товарам до применения фильтров `category`,
+    `price_min` и `price_max`, чтобы клиент видел все доступные варианты.
+    """
+    types = ('products', 'looks')
+    default_limit = 20
+    max_limit = 100
+
+    @cache_response(PRODUCTS, LOOKS)
+    def get(self, request):
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response({'q': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        types = request.query_params.get('type', ','.join(self.types)).split(',')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+            category = request.query_params.get('category')
+            category = int(category) if category else None
+            price_min = int(request.query_params.get('price_min', 0))
+            price_max = request.query_params.get('price_max')
+            price_max = int(price_max) if price_max else None
+        except ValueError:
+            return Response({'detail': 'limit, category and price bounds must be integers.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data = {}
+        if 'products' in types:
+            matched = search_products(Product.objects.all(), term)
+            data['facets'] = {'categories': category_facets(matched), 'price': price_facets(matched)}
+            products = search_products(product_summary_queryset(), term).filter(price__gte=price_min)
+            if price_max is not None:
+                products = products.filter(price__lte=price_max)
+            if category is not None:
+                products = products.filter(categories=category)
+            rows = list(products.order_by('-rank', '-id')[:limit])
+            data['products'] = ProductSummarySerializer(rows, many=True).data
+        if 'looks' in types:
+            looks = search_looks(look_summary_queryset(), term).filter(price__gte=price_min)
+            if price_max is not None:
+                looks = looks.filter(price__lte=price_max)
+            if category is not None:
+                looks = looks.filter(categories=category)
+            rows = list(looks.order_by('-rank', '-id')[:limit])
+            attach_related_ids(rows, Look, 'products')
+            data['looks'] = LookSummarySerializer(rows, many=True).data
+        return Response(data)
+
+class ChangesView(APIView):
+    """
+    Инкрементальная синхронизация по журналу изменений: `?since=<cursor>&limit=N`.
+
+    Без `since` возвращается только курсор устоявшейся части журнала
+    (settled_cursor, как и в выдаче изменений). Клиент сначала берёт его,
+    затем выгружает каталог целиком и дальше запрашивает изменения после курсора,
+    пока `has_more` не станет false.
+    """
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+            since = request.query_params.get('since')
+            since = int(since) if since else None
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if since is None:
+            return Response({'cursor': settled_cursor(), 'has_more': False, 'changes': {}})
+        return Response(changes_since(since, limit))
+
+class ImageRenditionView(APIView):
+    image_models = {
+        'product': ProductImage,
+        'look': LookImage,
+    }
+
+    def get(self, request, kind, pk, size, fmt):
+        model = self.image_models.get(kind)
+        if model is None or size not in RENDITION_WIDTHS or fmt not in RENDITION_FORMATS:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        image_name = model.objects.filter(pk=pk).values_list('image', flat=True).first()
+        if not image_name:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        try:
+            name = ensure_rendition(image_name, size, fmt)
+        except (FileNotFoundError, UnidentifiedImageError):
+            logger.exception('Не удалось построить %s/%s для %s', size, fmt, image_name)
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        response = redirect(rendition_storage.url(name))
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response